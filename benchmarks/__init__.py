@@ -0,0 +1,12 @@
+"""Offline benchmarks for the userbot
+
+They drive the plugin handlers with in-memory stand-ins for Pyrogram and
+pytgcalls objects (see benchmarks/fakes.py), no Telegram account needed.
+Run them from the repository root, e.g.
+
+    python -m benchmarks.bench_player --output before.json
+    python -m benchmarks.bench_player --compare before.json
+
+Dependencies of the benchmarked plugin (Pyrogram, pytgcalls, ffmpeg...)
+still have to be installed.
+"""
@@ -0,0 +1,122 @@
+"""Benchmark message classification of plugins/vc/player.py
+
+Feeds a synthetic high-traffic group (mostly chatter, some links and
+commands, several chats) through the Pyrogram filters of the player
+and reports messages per second. "legacy" rebuilds the per-command
+regex filters the player used before tgvc/dispatcher.py.
+
+    python -m benchmarks.bench_dispatch --messages 100000
+"""
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from pyrogram import filters
+from benchmarks.fakes import FakeClient, FakeGroupCall
+from benchmarks.harness import git_revision
+from plugins.vc import player
+
+CHAT_ID = -1001234567890
+OTHER_CHATS = [-1001000000000 - i for i in range(9)]
+WORDS = ("hello", "lol", "music", "nice", "track", "ok", "what", "🔥",
+         "@someone", "#tag", "thanks", "play", "the", "skip")
+COMMANDS = ("/play", "!play", "/current", "!help", "!skip", "!skip 2 3",
+            "!vc", "!pause", "/repo", "!unknown")
+LINKS = ("https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+         "https://soundcloud.com/artist/track",
+         "https://example.com/page")
+
+
+def legacy_filters():
+    """per-command filters of the player before the dispatcher"""
+    async def current_vc_filter(_, __, m):
+        group_call = player.mp.group_call
+        if not group_call.is_connected:
+            return False
+        return m.chat.id == int("-100" + str(group_call.full_chat.id))
+
+    current_vc = filters.create(current_vc_filter)
+    main = filters.group & filters.text & ~filters.edited
+    chain = [
+        filters.group & ~filters.edited & current_vc
+        & (filters.regex("^(\\/|!)play$") | filters.audio),
+        main & current_vc & filters.regex("^(\\/|!)current$"),
+        main & current_vc & filters.regex("^(\\/|!)help$"),
+        main & current_vc & filters.command("skip", prefixes="!"),
+        main & filters.regex("^!join$"),
+        main & current_vc & filters.regex("^!leave$"),
+        main & filters.regex("^!vc$"),
+    ]
+    chain.extend(
+        main & current_vc & filters.regex(regex)
+        for regex in ("^!stop$", "^!replay$", "^!pause", "^!resume",
+                      "^!clean$", "^!mute$", "^!unmute$",
+                      "^(\\/|!)repo$")
+    )
+    chain.append(main & filters.regex(player.REGEX_SITES)
+                 & ~filters.regex(player.REGEX_EXCLUDE_URL))
+    return chain
+
+
+def current_filters():
+    return [
+        handler.filters
+        for obj in vars(player).values()
+        for handler, _ in getattr(obj, 'handlers', [])
+    ]
+
+
+def make_feed(client, n, seed=0):
+    rnd = random.Random(seed)
+    feed = []
+    for _ in range(n):
+        chat_id = CHAT_ID if rnd.random() < 0.3 else rnd.choice(OTHER_CHATS)
+        kind = rnd.random()
+        if kind < 0.03:
+            text = rnd.choice(COMMANDS)
+        elif kind < 0.05:
+            text = rnd.choice(LINKS)
+        else:
+            text = " ".join(rnd.choice(WORDS)
+                            for _ in range(rnd.randint(1, 12)))
+        feed.append(client.message(chat_id, text))
+    return feed
+
+
+async def classify(client, chain, feed):
+    """like Pyrogram, stop at the first handler whose filter matches"""
+    matched = 0
+    start = time.perf_counter()
+    for m in feed:
+        for f in chain:
+            if await f(client, m):
+                matched += 1
+                break
+    return time.perf_counter() - start, matched
+
+
+async def main(n, workdir):
+    client = FakeClient(workdir)
+    group_call = FakeGroupCall(client)
+    group_call.on_network_status_changed(
+        player.network_status_changed_handler
+    )
+    player.mp.group_call = group_call
+    await group_call.start(CHAT_ID)
+    feed = make_feed(client, n)
+    print(f"revision {git_revision()}, {n} messages")
+    for name, chain in (('legacy', legacy_filters()),
+                        ('dispatcher', current_filters())):
+        client.calls.clear()
+        elapsed, matched = await classify(client, chain, feed)
+        print(f"{name:<12} {n / elapsed:>12,.0f} msg/s "
+              f"({matched} matched, "
+              f"{sum(client.calls.values())} API calls)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=100000)
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(main(parser.parse_args().messages, tmp))
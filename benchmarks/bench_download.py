@@ -0,0 +1,156 @@
+"""Benchmark tgvc/download.py against a local stand-in media server
+
+The server answers upload.GetFile-like requests ("offset limit") over
+TCP with a per request latency and a per connection bandwidth cap,
+which is how a Telegram media DC behaves for a single session request.
+workers=1 is equivalent to Message.download(). Also checks that a
+download interrupted halfway resumes, and that dropped requests are
+retried, by comparing SHA-256 of the result.
+
+    python -m benchmarks.bench_download --size 64 --workers 1 2 4 8
+"""
+import os
+import json
+import time
+import struct
+import asyncio
+import hashlib
+import argparse
+import tempfile
+from benchmarks.harness import git_revision
+from tgvc.download import CHUNK_SIZE, ChunkedDownload
+
+MiB = 1024 * 1024
+
+
+class MediaServer(object):
+    def __init__(self, data, latency, bandwidth, drop_every=0):
+        self.data = memoryview(data)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.drop_every = drop_every
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                offset, limit = map(int, line.split())
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+                if self.drop_every and self.requests % self.drop_every == 0:
+                    break
+                chunk = self.data[offset:offset + limit]
+                writer.write(struct.pack("!I", len(chunk)))
+                for i in range(0, len(chunk), 64 * 1024):
+                    writer.write(chunk[i:i + 64 * 1024])
+                    await writer.drain()
+                    await asyncio.sleep(64 * 1024 / self.bandwidth)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+class LocalChunkSource(object):
+    """fetch(offset, limit) over a pool of connections to MediaServer"""
+
+    def __init__(self, port):
+        self.port = port
+        self.idle = []
+
+    async def fetch(self, offset, limit):
+        if self.idle:
+            reader, writer = self.idle.pop()
+        else:
+            reader, writer = await asyncio.open_connection(
+                "127.0.0.1", self.port
+            )
+        try:
+            writer.write(f"{offset} {limit}\n".encode())
+            size, = struct.unpack("!I", await reader.readexactly(4))
+            data = await reader.readexactly(size)
+        except BaseException:
+            writer.close()
+            raise
+        self.idle.append((reader, writer))
+        return data
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+
+
+async def download(server_args, data, path, workers, stop_after=None):
+    server = MediaServer(data, *server_args)
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    source = LocalChunkSource(listener.sockets[0].getsockname()[1])
+    job = ChunkedDownload(source.fetch, len(data), path, workers=workers)
+    start = time.perf_counter()
+    try:
+        if stop_after is None:
+            await job.run()
+        else:
+            task = asyncio.ensure_future(job.run())
+            while len(job.done) < stop_after:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    finally:
+        source.close()
+        listener.close()
+    return time.perf_counter() - start, server.requests, job.retried
+
+
+def sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(MiB), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def main(args, workdir):
+    data = os.urandom(args.size * MiB + 12345)
+    expected = hashlib.sha256(data).hexdigest()
+    server_args = (args.latency / 1000, args.bandwidth * MiB)
+    results = {'revision': git_revision(), 'throughput_mib_s': {}}
+    print(f"revision {results['revision']}, {len(data) / MiB:.1f} MiB, "
+          f"latency {args.latency}ms, {args.bandwidth} MiB/s per request")
+    for workers in args.workers:
+        path = os.path.join(workdir, f"w{workers}")
+        elapsed, _, _ = await download(server_args, data, path, workers)
+        assert sha256(path) == expected
+        results['throughput_mib_s'][workers] = len(data) / MiB / elapsed
+        print(f"workers {workers:>2}: {elapsed:>7.2f}s "
+              f"{len(data) / MiB / elapsed:>7.1f} MiB/s")
+    # interrupted halfway and resumed
+    path = os.path.join(workdir, "resume")
+    chunks = -(-len(data) // CHUNK_SIZE)
+    await download(server_args, data, path, 4, stop_after=chunks // 2)
+    _, requests, _ = await download(server_args, data, path, 4)
+    assert sha256(path) == expected
+    print(f"resume: {requests} of {chunks} chunks fetched after restart")
+    # every 10th request dropped by the server
+    path = os.path.join(workdir, "drop")
+    _, _, retried = await download(server_args + (10,), data, path, 4)
+    assert sha256(path) == expected
+    print(f"dropped requests: {retried} chunks retried, file intact")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=64, help="MiB")
+    parser.add_argument('--latency', type=float, default=50, help="ms")
+    parser.add_argument('--bandwidth', type=float, default=8,
+                        help="MiB/s per request")
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 2, 4, 8])
+    parser.add_argument('--output', help="write results to a JSON file")
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(main(parser.parse_args(), tmp))
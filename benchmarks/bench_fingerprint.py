@@ -0,0 +1,132 @@
+"""Benchmark tgvc/fingerprint.py
+
+- fingerprint: seconds per minute of RAW PCM for tracks of --minutes
+- lookup: FingerprintIndex.match() latency with --references tracks
+  of 4 minutes in the index (random sub-fingerprints, plus the melodies)
+- accuracy: melodies re-encoded to MP3 and back with ffmpeg have to
+  match their original, different melodies must not match
+
+    python -m benchmarks.bench_fingerprint --references 10000
+"""
+import os
+import json
+import time
+import wave
+import argparse
+import tempfile
+import subprocess
+from benchmarks.fakes import make_melody
+from benchmarks.harness import git_revision
+from tgvc.fingerprint import DECIMATE, HOP, FingerprintIndex, fingerprint
+from tgvc.pcm import SAMPLE_RATE
+from tgvc.stats import summarize
+from tgvc.transcode import PCM_OUTPUT
+
+FRAMES_PER_MINUTE = 60 * SAMPLE_RATE // DECIMATE // HOP
+
+
+def wav_to_raw(wav, raw):
+    with wave.open(wav) as f, open(raw, 'wb') as out:
+        out.write(f.readframes(f.getnframes()))
+    return raw
+
+
+def reencode(raw, workdir):
+    """RAW PCM -> 128k MP3 -> RAW PCM, like a re-upload"""
+    mp3 = raw + ".mp3"
+    out = raw + ".re.raw"
+    pcm_in = ['-f', 's16le', '-ar', '48k', '-ac', '2']
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', *pcm_in, '-i', raw,
+                    '-b:a', '128k', mp3], check=True)
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-i', mp3,
+                    '-f', PCM_OUTPUT['format'], '-ar', PCM_OUTPUT['ar'],
+                    '-ac', str(PCM_OUTPUT['ac']), out], check=True)
+    return out
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(args, workdir):
+    import numpy as np
+    rng = np.random.default_rng(args.seed)
+    results = {'revision': git_revision(), 'fingerprint_s_per_min': {},
+               'references': args.references}
+    print(f"revision {results['revision']}")
+    melodies = {}
+    for minutes in args.minutes:
+        raw = wav_to_raw(
+            make_melody(os.path.join(workdir, "m.wav"), minutes * 60,
+                        seed=minutes),
+            os.path.join(workdir, f"melody-{minutes}.raw")
+        )
+        runs = [timed(fingerprint, raw) for _ in range(args.runs)]
+        per_minute = min(x[0] for x in runs) / minutes
+        melodies[raw] = runs[0][1]
+        results['fingerprint_s_per_min'][minutes] = per_minute
+        print(f"fingerprint {minutes:>3} min: {per_minute * 1000:.1f}ms "
+              f"per minute, {runs[0][1].nbytes / minutes / 1024:.1f} KiB "
+              f"per minute")
+    index = FingerprintIndex()
+    for i in range(args.references):
+        index.add(f"random-{i}", rng.integers(
+            0, 2 ** 32, 4 * FRAMES_PER_MINUTE, dtype=np.uint32
+        ))
+    for raw, fp in melodies.items():
+        index.add(raw, fp)
+    build_s, _ = timed(index.match, melodies[raw][:10])
+    index.add("one more", rng.integers(
+        0, 2 ** 32, 4 * FRAMES_PER_MINUTE, dtype=np.uint32
+    ))
+    insert_s, _ = timed(index.match, melodies[raw][:10])
+    lookup_s, correct = [], 0
+    queries = [(raw, fp) for raw, fp in melodies.items()]
+    if args.reencode:
+        queries += [(raw, fingerprint(reencode(raw, workdir)))
+                    for raw in melodies]
+    for _ in range(args.lookups // len(queries) + 1):
+        for raw, fp in queries:
+            elapsed, found = timed(index.match, fp)
+            lookup_s.append(elapsed)
+            correct += found is not None and found[0] == raw
+    others = [fingerprint(wav_to_raw(
+        make_melody(os.path.join(workdir, "o.wav"), 60, seed=1000 + i),
+        os.path.join(workdir, "other.raw")
+    )) for i in range(args.negatives)]
+    false_matches = sum(index.match(fp) is not None for fp in others)
+    results.update({
+        'index_build_s': build_s,
+        'index_insert_s': insert_s,
+        'lookup_s': summarize(lookup_s),
+        'match_rate': correct / len(lookup_s),
+        'false_matches': false_matches,
+    })
+    print(f"index of {len(index)} references built in {build_s:.2f}s, "
+          f"one more added in {insert_s * 1000:.1f}ms")
+    print("lookup " + " ".join(
+        f"{k} {v * 1000:.2f}ms" for k, v in results['lookup_s'].items()
+    ))
+    print(f"originals{' and re-encodes' if args.reencode else ''} matched "
+          f"{results['match_rate']:.1%}, false matches {false_matches} of "
+          f"{args.negatives} other melodies")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--minutes', type=int, nargs='+', default=[1, 5, 30])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--references', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=100)
+    parser.add_argument('--negatives', type=int, default=20)
+    parser.add_argument('--no-reencode', dest='reencode',
+                        action='store_false', help="skip the ffmpeg step")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write results to a JSON file")
+    with tempfile.TemporaryDirectory() as tmp:
+        main(parser.parse_args(), tmp)
@@ -0,0 +1,111 @@
+"""Benchmark tgvc/library.py with a large synthetic library
+
+Builds a library of --tracks tracks with titles and performers made of
+random words (a tenth of them marked as cached), then measures search
+latency for queries of one or two words of existing tracks (the last
+one may be a prefix, like a member typing "!play daft pun") and the
+latency of recording a play.
+
+    python -m benchmarks.bench_library --tracks 100000 --queries 1000
+"""
+import os
+import json
+import time
+import random
+import string
+import argparse
+import tempfile
+from benchmarks.harness import git_revision
+from tgvc.library import TrackLibrary
+from tgvc.stats import summarize
+
+
+def make_words(rng, n):
+    return list({
+        "".join(rng.choice(string.ascii_lowercase)
+                for _ in range(rng.randint(3, 9)))
+        for _ in range(n)
+    })
+
+
+def make_tracks(rng, n, words):
+    performers = [" ".join(rng.sample(words, rng.randint(1, 2)))
+                  for _ in range(n // 20 + 1)]
+    return [{
+        'file_unique_id': f"u{i}",
+        'title': " ".join(rng.sample(words, rng.randint(2, 5))).title(),
+        'performer': rng.choice(performers),
+        'duration': rng.randint(60, 600),
+        'file_id': f"f{i}",
+        'file_size': rng.randint(1, 20) * 1024 * 1024,
+        'link': f"https://t.me/c/1/{i}",
+        'cached': int(rng.random() < 0.1),
+    } for i in range(n)]
+
+
+def make_query(rng, track):
+    words = (track['title'] + " " + track['performer']).lower().split()
+    query = rng.sample(words, min(len(words), rng.randint(1, 2)))
+    if rng.random() < 0.5:
+        query[-1] = query[-1][:max(2, len(query[-1]) - 2)]
+    return " ".join(query)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(args, workdir):
+    rng = random.Random(args.seed)
+    tracks = make_tracks(rng, args.tracks, make_words(rng, args.words))
+    path = os.path.join(workdir, "library.sqlite")
+    library = TrackLibrary(path)
+    build_s, _ = timed(library.record_many, tracks)
+    queries = [make_query(rng, rng.choice(tracks))
+               for _ in range(args.queries)]
+    search_s, hits, cached_first = [], 0, 0
+    for query in queries:
+        elapsed, found = timed(library.search, query)
+        search_s.append(elapsed)
+        hits += bool(found)
+        cached_first += bool(found) and found[0].cached
+    record_s = [
+        timed(lambda x: library.record(**x), rng.choice(tracks))[0]
+        for _ in range(args.queries // 10)
+    ]
+    library.close()
+    results = {
+        'revision': git_revision(),
+        'tracks': args.tracks,
+        'build_s': build_s,
+        'db_mib': os.path.getsize(path) / 1024 / 1024,
+        'search_s': summarize(search_s),
+        'record_s': summarize(record_s),
+        'hit_rate': hits / len(queries),
+        'cached_first_rate': cached_first / max(hits, 1),
+    }
+    print(f"revision {results['revision']}, {args.tracks} tracks, "
+          f"built in {build_s:.2f}s, {results['db_mib']:.1f} MiB")
+    for key in ('search_s', 'record_s'):
+        print(f"{key:<10}" + " ".join(
+            f"{k} {v * 1000:.3f}ms" for k, v in results[key].items()
+        ))
+    print(f"queries with results {results['hit_rate']:.1%}, "
+          f"cached track first {results['cached_first_rate']:.1%}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tracks', type=int, default=100000)
+    parser.add_argument('--words', type=int, default=20000,
+                        help="size of the vocabulary")
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write results to a JSON file")
+    with tempfile.TemporaryDirectory() as tmp:
+        main(parser.parse_args(), tmp)
@@ -0,0 +1,160 @@
+"""Benchmark reading RAW PCM through tgvc/pcm.py against plain reads
+
+Writes --minutes of s16le 48 kHz stereo noise and lets --readers
+readers (like silence trimming, fingerprinting and a level meter) each
+compute the RMS of every --window seconds of it, with
+
+- read: f.read() of every window, a new bytes object each time
+- readinto: f.readinto() a buffer allocated once per reader
+- read_all: f.read() of the whole file, then views of it
+- mmap: windows of one shared PCMSource, NumPy views of the mapping
+
+Every mode runs in its own process after the file was read once (warm
+page cache), reports read throughput (bytes consumed by all readers per
+second), the growth of peak RSS and of private (anonymous) memory. The
+pages of a mapping count in RSS but are the page cache, shared with
+ffmpeg, tgcalls and other readers of the file.
+
+    python -m benchmarks.bench_pcm --minutes 20 --readers 3
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+from benchmarks.harness import git_revision
+from tgvc.pcm import FRAME_BYTES, SAMPLE_RATE, open_source
+
+MODES = ('read', 'readinto', 'read_all', 'mmap')
+
+
+def memory_kib():
+    """(peak RSS, RSS, anonymous RSS) of this process in KiB"""
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ('VmHWM', 'VmRSS', 'RssAnon'):
+                fields[key] = int(value.split()[0])
+    return fields['VmHWM'], fields['VmRSS'], fields['RssAnon']
+
+
+def rms(np, window):
+    return float(np.sqrt(np.square(
+        np.frombuffer(window, dtype='<i2'), dtype=np.float32
+    ).mean()))
+
+
+def windows(mode, path, window_bytes):
+    """windows of path for one reader, a generator which owns the file"""
+    if mode == 'read':
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(window_bytes)
+                if not data:
+                    return
+                yield data
+    elif mode == 'readinto':
+        buffer = bytearray(window_bytes)
+        view = memoryview(buffer)
+        with open(path, 'rb') as f:
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    return
+                yield view[:n]
+    elif mode == 'read_all':
+        with open(path, 'rb') as f:
+            data = memoryview(f.read())
+        for offset in range(0, len(data), window_bytes):
+            yield data[offset:offset + window_bytes]
+    else:
+        with open_source(path) as source:
+            yield from source.windows(window_bytes // FRAME_BYTES)
+
+
+def run_mode(mode, path, readers, window_bytes, queue):
+    import numpy as np
+    rms(np, b'\0\0\0\0')
+    _, rss, anon = memory_kib()
+    peak_anon = anon
+    consumed = 0
+    # reading /proc costs more than a small window, sample every ~4 MiB
+    sample_every = max(1, 4 * 1024 * 1024 // window_bytes)
+    rounds = 0
+    start = time.perf_counter()
+    # readers interleave window by window, like concurrent consumers
+    generators = [windows(mode, path, window_bytes) for _ in range(readers)]
+    while generators:
+        for g in list(generators):
+            window = next(g, None)
+            if window is None:
+                generators.remove(g)
+                continue
+            rms(np, window)
+            consumed += len(window)
+        rounds += 1
+        if rounds % sample_every == 0:
+            peak_anon = max(peak_anon, memory_kib()[2])
+    elapsed = time.perf_counter() - start
+    queue.put({
+        'mode': mode,
+        'throughput_mib_s': consumed / elapsed / 1024 / 1024,
+        'elapsed_s': elapsed,
+        'peak_rss_kib': memory_kib()[0] - rss,
+        'peak_anon_kib': peak_anon - anon,
+    })
+
+
+def main(args, workdir):
+    import numpy as np
+    path = os.path.join(workdir, "pcm.raw")
+    frames = args.minutes * 60 * SAMPLE_RATE
+    rng = np.random.default_rng(0)
+    with open(path, 'wb') as f:
+        for start in range(0, frames, 60 * SAMPLE_RATE):
+            n = min(60 * SAMPLE_RATE, frames - start)
+            f.write((rng.standard_normal(n * 2) * 3000).astype('<i2'))
+    with open(path, 'rb') as f:
+        while f.read(16 * 1024 * 1024):
+            pass
+    size = os.path.getsize(path)
+    window_bytes = int(args.window * SAMPLE_RATE) * FRAME_BYTES
+    results = {'revision': git_revision(), 'file_mib': size / 1024 / 1024,
+               'readers': args.readers, 'window_s': args.window, 'runs': []}
+    print(f"revision {results['revision']}, {results['file_mib']:.0f} MiB, "
+          f"{args.readers} readers, {args.window}s windows")
+    context = multiprocessing.get_context('spawn')
+    for mode in args.modes:
+        best = None
+        for _ in range(args.runs):
+            queue = context.Queue()
+            process = context.Process(target=run_mode, args=(
+                mode, path, args.readers, window_bytes, queue
+            ))
+            process.start()
+            run = queue.get()
+            process.join()
+            if best is None or run['elapsed_s'] < best['elapsed_s']:
+                best = run
+        results['runs'].append(best)
+        print(f"{mode:>9}: {best['throughput_mib_s']:>8.0f} MiB/s, "
+              f"peak RSS +{best['peak_rss_kib'] / 1024:>6.1f} MiB, "
+              f"private +{best['peak_anon_kib'] / 1024:>6.1f} MiB")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--minutes', type=int, default=20)
+    parser.add_argument('--readers', type=int, default=3)
+    parser.add_argument('--window', type=float, default=1.0,
+                        help="seconds of audio per window")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--output', help="write results to a JSON file")
+    with tempfile.TemporaryDirectory() as tmp:
+        main(parser.parse_args(), tmp)
@@ -0,0 +1,232 @@
+"""Benchmark handlers of plugins/vc/player.py with offline fakes
+
+Scenarios:
+- play_burst: members reply /play to different audios
+- current_burst: members spam /current while a track is playing
+- skip_burst: admin skips queued tracks with !skip n and !skip
+- transitions: tracks end one after another (on_playout_ended)
+- playlist_import: a 200 track playlist link is imported (youtube_dl
+  replaced by a fake with latency and failing entries), /current is
+  answered meanwhile and the first tracks end one after another
+- library_play: played tracks are queued again with !play <query>
+- duplicate_uploads: the same recording is uploaded under new file ids
+  between other tracks and queued with /play
+- flood: members and one abusive member send /play replies as fast as
+  they can while tracks end and /current is probed, with the admission
+  limits of FLOOD_LIMITS; flood_unlimited is the same without limits
+
+Scenarios other than flood run without admission control.
+"""
+import math
+import time
+import asyncio
+from types import SimpleNamespace
+from benchmarks import harness
+from benchmarks.fakes import FakeClient, FakeGroupCall
+from plugins.vc import player
+from tgvc.admission import AdmissionControl
+
+CHAT_ID = -1001234567890
+TRACKS = 20
+TRACK_DURATION = 5
+PLAYLIST_ENTRIES = 200
+PLAYLIST_URL = "https://www.youtube.com/playlist?list=PLbench"
+UNLIMITED = dict(user_burst=math.inf, chat_burst=math.inf,
+                 max_queue=math.inf, max_backlog=math.inf)
+# scaled down to the 5s tracks of the benchmark
+FLOOD_LIMITS = dict(user_rate=1, user_burst=2, chat_rate=5, chat_burst=10,
+                    max_queue=20, max_backlog=3 * TRACK_DURATION)
+FLOOD_MEMBERS = 20
+FLOOD_REQUESTS = 5
+
+
+async def setup(bench):
+    """fresh player state with a fake group call joined to CHAT_ID"""
+    client = FakeClient(bench.workdir)
+    bench.client = client
+    group_call = FakeGroupCall(client)
+    group_call.on_network_status_changed(
+        player.network_status_changed_handler
+    )
+    group_call.on_playout_ended(player.playout_ended_handler)
+    player.mp.group_call = group_call
+    player.mp.playlist.clear()
+    player.mp.msg.clear()
+    player.mp.start_time = None
+    player._caches.library = None
+    player.admission = AdmissionControl(**UNLIMITED)
+    player._caches.fingerprint_index = None
+    player.tracer.open_traces.clear()
+    player.tracer.recent.clear()
+    player.DELETE_DELAY = 0
+    await group_call.start(CHAT_ID)
+    return client, group_call
+
+
+async def queue_tracks(bench, client, n, name='play'):
+    for i in range(n):
+        audio = client.audio_message(CHAT_ID, f"t{i}", TRACK_DURATION)
+        m = client.message(CHAT_ID, "/play", reply_to_message=audio)
+        await bench.timed(name, player.dispatch_command(client, m))
+
+
+async def play_burst(bench):
+    client, _ = await setup(bench)
+    await queue_tracks(bench, client, TRACKS)
+
+
+async def current_burst(bench):
+    client, _ = await setup(bench)
+    await queue_tracks(bench, client, 2, name='setup play')
+    for _ in range(100):
+        m = client.message(CHAT_ID, "/current")
+        await bench.timed('current', player.dispatch_command(client, m))
+
+
+async def skip_burst(bench):
+    client, _ = await setup(bench)
+    await queue_tracks(bench, client, TRACKS, name='setup play')
+    for i in range(TRACKS - 1, 2, -2):
+        m = client.message(CHAT_ID, f"!skip {i} {i - 1}", outgoing=True)
+        await bench.timed('skip n', player.dispatch_command(client, m))
+    while len(player.mp.playlist) > 1:
+        m = client.message(CHAT_ID, "!skip", outgoing=True)
+        await bench.timed('skip', player.dispatch_command(client, m))
+
+
+async def transitions(bench):
+    client, group_call = await setup(bench)
+    await queue_tracks(bench, client, TRACKS, name='setup play')
+    while len(player.mp.playlist) > 1:
+        await bench.timed('playout_ended', group_call.playout_ended())
+
+
+def fake_extract_playlist(url):
+    time.sleep(0.2)
+    return {'title': "bench", 'entries': [
+        {'id': f"e{i}", 'url': f"e{i}", 'ie_key': "Youtube",
+         'title': f"entry {i}", 'duration': TRACK_DURATION}
+        for i in range(PLAYLIST_ENTRIES)
+    ]}
+
+
+def fake_download_entry_file(client):
+    def download(entry, download_dir):
+        time.sleep(0.05)
+        if entry.url.endswith("3"):
+            raise IOError("unavailable")
+        return client.media_file(entry.audio), entry.audio.title, \
+            TRACK_DURATION
+    return download
+
+
+async def playlist_import(bench):
+    client, group_call = await setup(bench)
+    player._extract_playlist = fake_extract_playlist
+    player._download_entry_file = fake_download_entry_file(client)
+    m = client.message(CHAT_ID, PLAYLIST_URL)
+    task = asyncio.ensure_future(
+        bench.timed('import', player.import_playlist(client, m))
+    )
+    while not task.done():
+        m = client.message(CHAT_ID, "/current")
+        await bench.timed('current', player.dispatch_command(client, m))
+        await asyncio.sleep(0.01)
+    await task
+    for _ in range(10):
+        await bench.timed('playout_ended', group_call.playout_ended())
+
+
+async def library_play(bench):
+    client, group_call = await setup(bench)
+    await queue_tracks(bench, client, TRACKS, name='setup play')
+    while len(player.mp.playlist) > 1:
+        await group_call.playout_ended()
+    for i in range(TRACKS):
+        m = client.message(CHAT_ID, f"!play track t{i}")
+        await bench.timed('play query', player.dispatch_command(client, m))
+
+
+async def duplicate_uploads(bench):
+    client, group_call = await setup(bench)
+    for i in range(TRACKS):
+        tone = "same" if i % 2 else None
+        audio = client.audio_message(CHAT_ID, f"d{i}", TRACK_DURATION,
+                                     tone=tone)
+        m = client.message(CHAT_ID, "/play", reply_to_message=audio)
+        await bench.timed('play', player.dispatch_command(client, m))
+    while len(player.mp.playlist) > 1:
+        await bench.timed('playout_ended', group_call.playout_ended())
+    # duplicates which were seen before are rejected on /play
+    for i in range(1, TRACKS, 2):
+        audio = client.audio_message(CHAT_ID, f"d{i}", TRACK_DURATION,
+                                     tone="same")
+        m = client.message(CHAT_ID, "/play", reply_to_message=audio)
+        await bench.timed('play seen', player.dispatch_command(client, m))
+
+
+async def _flood(bench, limits):
+    client, group_call = await setup(bench)
+    client.latency = 0.002
+    admission = player.admission = AdmissionControl(**limits)
+    done = asyncio.Event()
+
+    async def member(user_id, requests, interval):
+        user = SimpleNamespace(id=user_id, is_contact=False)
+        for i in range(requests):
+            audio = client.audio_message(CHAT_ID, f"u{user_id}-{i}",
+                                         TRACK_DURATION)
+            m = client.message(CHAT_ID, "/play", reply_to_message=audio,
+                               from_user=user)
+            await bench.timed('play', player.dispatch_command(client, m))
+            bench.counts['max queue'] = max(bench.counts['max queue'],
+                                            len(player.mp.playlist))
+            bench.counts['max backlog s'] = max(
+                bench.counts['max backlog s'], admission.backlog
+            )
+            await asyncio.sleep(interval)
+
+    async def probe():
+        while not done.is_set():
+            m = client.message(CHAT_ID, "/current")
+            await bench.timed('current', player.dispatch_command(client, m))
+            await asyncio.sleep(0.02)
+
+    async def playout():
+        while not done.is_set():
+            await asyncio.sleep(0.2)
+            await bench.timed('playout_ended', group_call.playout_ended())
+
+    tasks = [asyncio.ensure_future(probe()), asyncio.ensure_future(playout())]
+    await asyncio.gather(
+        member(0, FLOOD_REQUESTS * 6, 0),
+        *[member(i, FLOOD_REQUESTS, 0.05 * i)
+          for i in range(1, FLOOD_MEMBERS)]
+    )
+    done.set()
+    await asyncio.gather(*tasks)
+    bench.counts.update({k: v for k, v in admission.stats.items() if v})
+
+
+async def flood(bench):
+    await _flood(bench, FLOOD_LIMITS)
+
+
+async def flood_unlimited(bench):
+    await _flood(bench, UNLIMITED)
+
+
+SCENARIOS = {
+    'play_burst': play_burst,
+    'current_burst': current_burst,
+    'skip_burst': skip_burst,
+    'transitions': transitions,
+    'playlist_import': playlist_import,
+    'library_play': library_play,
+    'duplicate_uploads': duplicate_uploads,
+    'flood': flood,
+    'flood_unlimited': flood_unlimited,
+}
+
+if __name__ == '__main__':
+    harness.main(SCENARIOS, __doc__)
@@ -0,0 +1,208 @@
+"""Benchmark !reload of the plugins while the player plays
+
+Loads the plugins into a FakeClient like Pyrogram does, joins a fake
+voice chat, queues tracks and sends !reload (plugins/reload.py)
+through the handlers --reloads times. Every round ends a track twice,
+once as usual and once while !reload runs, and reports
+
+- reload: the !reload handler, compiling and re-importing the plugins
+- stall: longest the event loop was blocked during a reload, nothing
+  else runs meanwhile (a track which ends waits for it)
+- track change: from the end of a track until the next one plays,
+  as usual and with !reload at the same time
+- whether the group call stayed connected and kept its input, the
+  playlist and caches survived and the new handlers were swapped in
+
+pytgcalls plays the RAW PCM in its own thread, a reload which doesn't
+touch the GroupCall is not heard in the middle of a track. For
+comparison, restart is the time from starting a fresh process until
+it plays again: importing the plugins, !join and /play of the same
+track from the RAW PCM left in the workdir. The session start of a real
+restart needs Telegram and comes on top.
+
+    python -m benchmarks.bench_reload --reloads 10
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import importlib
+import subprocess
+from benchmarks.fakes import FakeClient, FakeGroupCall
+from benchmarks.harness import git_revision
+from tgvc.stats import summarize
+
+PLUGINS = ["vc.player", "ping", "sysinfo", "reload"]
+PLUGIN_CONFIG = dict(root="plugins", include=PLUGINS)
+CHAT_ID = -1001234567890
+TRACK_DURATION = 5
+TICK = 0.001
+
+
+def load(client):
+    modules = [importlib.import_module(f"plugins.{x}") for x in PLUGINS]
+    client.load_plugins(modules)
+    player = modules[0]
+    player.DELETE_DELAY = 0
+    group_call = FakeGroupCall(client)
+    # as MusicPlayer.group_call registers them
+    group_call.on_network_status_changed(player._on_network_status_changed)
+    group_call.on_playout_ended(player._on_playout_ended)
+    player.mp.group_call = group_call
+    return player, group_call
+
+
+async def join_and_play(client, player, tracks, first=0):
+    await client.dispatcher.dispatch(
+        client.message(CHAT_ID, "!join", outgoing=True)
+    )
+    for i in range(first, first + tracks):
+        audio = client.audio_message(CHAT_ID, f"t{i}", TRACK_DURATION)
+        await client.dispatcher.dispatch(client.message(
+            CHAT_ID, "/play", reply_to_message=audio, outgoing=True
+        ))
+
+
+async def ticker(ticks):
+    while True:
+        before = time.perf_counter()
+        await asyncio.sleep(TICK)
+        now = time.perf_counter()
+        ticks.append((now, now - before - TICK))
+
+
+async def reload(client, player, ticks):
+    """!reload, returns (seconds of the handler, longest stall)"""
+    start = time.perf_counter()
+    m = client.message(CHAT_ID, "!reload", outgoing=True)
+    await client.dispatcher.dispatch(m)
+    elapsed = time.perf_counter() - start
+    # the task of reload_plugins() swaps the handlers after the handler
+    await asyncio.sleep(0.01)
+    if not m.text.startswith("\U0001f503"):
+        raise RuntimeError(m.text)
+    player.DELETE_DELAY = 0
+    # ticks which ended after the start, the longest one spans it
+    stall = max((x[1] for x in ticks if x[0] >= start), default=0)
+    return elapsed, stall
+
+
+async def track_change(player, group_call, with_reload=None):
+    """seconds from the end of the current track until the next plays"""
+    next_track = player.mp.playlist[1]
+    ended = time.monotonic()
+    if with_reload is not None:
+        task = asyncio.ensure_future(with_reload)
+        # the track ends while the reload runs
+        await asyncio.sleep(0)
+    await group_call.playout_ended()
+    if with_reload is not None:
+        await task
+    trace = player.tracer.get(next_track)
+    return trace.started + trace.at('play') - ended
+
+
+async def run_reloads(workdir, rounds):
+    client = FakeClient(workdir, plugins=PLUGIN_CONFIG)
+    player, group_call = load(client)
+    events = []
+
+    async def network_status_changed(gc, is_connected):
+        events.append(is_connected)
+
+    group_call.on_network_status_changed(network_status_changed)
+    await join_and_play(client, player, 2 * rounds + 2)
+    mp, caches = player.mp, player._caches
+    ticks = []
+    tick_task = asyncio.ensure_future(ticker(ticks))
+    results = {'reload_s': [], 'stall_s': [], 'change_s': [],
+               'change_reload_s': []}
+    checks = []
+    for _ in range(rounds):
+        results['change_s'].append(await track_change(player, group_call))
+        playing = group_call.input_filename
+        playlist = list(mp.playlist)
+        handler = client.dispatcher.groups[0][0]
+        commands = player.commands
+        elapsed, stall = await reload(client, player, ticks)
+        results['reload_s'].append(elapsed)
+        results['stall_s'].append(stall)
+        checks.append({
+            'connected': group_call.is_connected and not events[1:],
+            'same input': group_call.input_filename == playing,
+            'same state': (player.mp is mp and mp.group_call is group_call
+                           and mp.playlist == playlist
+                           and player._caches is caches),
+            'new handlers': (player.commands is not commands
+                             and handler not in client.dispatcher.groups[0]),
+        })
+        results['change_reload_s'].append(await track_change(
+            player, group_call, reload(client, player, ticks)
+        ))
+    tick_task.cancel()
+    checks = {k: all(x[k] for x in checks) for k in checks[0]}
+    playing = int(mp.playlist[0].audio.file_unique_id[1:])
+    return {k: summarize(v) for k, v in results.items()}, checks, playing
+
+
+async def restart_child(workdir, track):
+    """a fresh process plays track again, prints when it plays"""
+    client = FakeClient(workdir, plugins=PLUGIN_CONFIG)
+    player, group_call = load(client)
+    await join_and_play(client, player, 1, first=track)
+    if not group_call.input_filename:
+        raise RuntimeError("not playing")
+    print(json.dumps({'played': time.time()}))
+
+
+def run_restarts(workdir, track, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.time()
+        output = subprocess.check_output([
+            sys.executable, "-m", "benchmarks.bench_reload",
+            "--child", workdir, str(track)
+        ])
+        played = json.loads(output.decode().splitlines()[-1])['played']
+        samples.append(played - started)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--reloads', type=int, default=10)
+    parser.add_argument('--restarts', type=int, default=3)
+    parser.add_argument('--output', help="write results to a JSON file")
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return asyncio.run(restart_child(args.child[0], int(args.child[1])))
+    with tempfile.TemporaryDirectory() as workdir:
+        results, checks, playing = asyncio.run(
+            run_reloads(workdir, args.reloads)
+        )
+        # the RAW PCM of the track playing is left in the workdir
+        results['restart_s'] = run_restarts(workdir, playing,
+                                            args.restarts)
+    results = {'revision': git_revision(), 'reloads': args.reloads,
+               **results, 'checks': checks}
+    print(f"revision {results['revision']}, {args.reloads} reloads")
+    for key, label in (('reload_s', "reload"), ('stall_s', "stall"),
+                       ('change_s', "track change"),
+                       ('change_reload_s', "change + !reload"),
+                       ('restart_s', "restart")):
+        print(f"{label:<17}" + " ".join(
+            f"{k} {v * 1000:8.1f}ms" for k, v in results[key].items()
+        ))
+    print("checks: " + ", ".join(
+        f"{k} {'ok' if v else 'FAILED'}" for k, v in checks.items()
+    ))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
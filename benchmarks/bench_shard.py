@@ -0,0 +1,156 @@
+"""Benchmark tgvc/shard.py, voice chats of several accounts in workers
+
+For every count of --workers a Coordinator runs that many fake workers
+(FakeClient, FakeGroupCall and the player plugin) in one shared
+workdir. Every worker receives the same feed, like accounts which are
+members of the same groups: !join in one chat per worker, then --tracks
+/play replies in every chat. The coordinator assigns the chats, every
+worker plays the tracks of its chat to the end, the others ignore them.
+
+Reports the time until every chat had an owner (mostly the collect
+window of the coordinator), tracks played per second over all chats
+and the speedup against one worker. A chat costs CPU (ffmpeg, NumPy),
+so tracks per second scale with the workers up to the number of cores;
+--latency adds simulated API latency per call. With --same-tracks every
+chat plays the same tracks, they are downloaded and transcoded once
+for all workers.
+
+    python -m benchmarks.bench_shard --workers 1 2 4 --tracks 5
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from benchmarks.fakes import FakeClient, FakeGroupCall
+from benchmarks.harness import git_revision
+from plugins.vc import player
+from tgvc import shard
+from tgvc.admission import AdmissionControl
+
+TRACK_DURATION = 5
+FIRST_CHAT_ID = -1001000000000
+UNLIMITED = dict(user_burst=float('inf'), chat_burst=float('inf'),
+                 max_queue=float('inf'), max_backlog=float('inf'))
+ASSIGN_TIMEOUT = 10
+
+
+async def wait_for(predicate, timeout=ASSIGN_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.005)
+
+
+async def play_chats(workdir, chats, tracks, latency, same_tracks):
+    client = FakeClient(workdir, latency)
+    group_call = FakeGroupCall(client)
+    group_call.on_network_status_changed(
+        player.network_status_changed_handler
+    )
+    group_call.on_playout_ended(player.playout_ended_handler)
+    player.mp.group_call = group_call
+    player.admission = AdmissionControl(**UNLIMITED)
+    player.DELETE_DELAY = 0
+    worker = shard.worker
+    worker.start(client)
+    start = time.perf_counter()
+    for chat_id in chats:
+        await player.dispatch_command(client, client.message(chat_id,
+                                                             "!join"))
+    await wait_for(lambda: len(worker.owners) == len(chats))
+    owned = [x for x in chats if worker.owns(x)]
+    await wait_for(lambda: player.mp.chat_id in owned or not owned)
+    assigned = time.perf_counter() - start
+    for i in range(tracks):
+        for chat_id in chats:
+            track = f"t{i}" if same_tracks else f"c{chat_id}-t{i}"
+            audio = client.audio_message(chat_id, track, TRACK_DURATION)
+            m = client.message(chat_id, "/play", reply_to_message=audio)
+            await player.dispatch_command(client, m)
+    played = 1 if player.mp.playlist else 0
+    while len(player.mp.playlist) > 1:
+        await group_call.playout_ended()
+        played += 1
+    return {
+        'worker': worker.index,
+        'chats': len(owned),
+        'played': played,
+        'assigned_s': assigned,
+        'elapsed_s': time.perf_counter() - start,
+        'downloads': client.calls['download_media'],
+    }
+
+
+def fake_worker(workdir, chats, tracks, latency, same_tracks, results):
+    try:
+        # the loop of the worker like app.start() and idle() of main.py
+        # use it, not a new one of asyncio.run()
+        run = asyncio.get_event_loop().run_until_complete(
+            play_chats(workdir, chats, tracks, latency, same_tracks)
+        )
+    except BaseException:
+        # don't leave the parent waiting for the result
+        results.put(None)
+        raise
+    results.put(run)
+
+
+def run_workers(n, args):
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    chats = [FIRST_CHAT_ID - i for i in range(n)]
+    with tempfile.TemporaryDirectory() as workdir:
+        coordinator = shard.Coordinator(fake_worker, [
+            (workdir, chats, args.tracks, args.latency, args.same_tracks,
+             results)
+        ] * n)
+        start = time.perf_counter()
+        coordinator.run()
+        wall = time.perf_counter() - start
+        runs = [results.get() for _ in range(n)]
+    if None in runs:
+        raise SystemExit(f"a worker of {n} failed, see its traceback")
+    played = sum(x['played'] for x in runs)
+    play_s = max(x['elapsed_s'] - x['assigned_s'] for x in runs)
+    return {
+        'workers': n,
+        'wall_s': wall,
+        'assigned_s': max(x['assigned_s'] for x in runs),
+        'played': played,
+        'tracks_per_s': played / play_s,
+        'downloads': sum(x['downloads'] for x in runs),
+        'coordinator': dict(coordinator.stats),
+    }
+
+
+def main(args):
+    results = {'revision': git_revision(), 'cpus': os.cpu_count(),
+               'tracks': args.tracks, 'runs': []}
+    print(f"revision {results['revision']}, {results['cpus']} CPUs, "
+          f"{args.tracks} tracks of {TRACK_DURATION}s per chat")
+    for n in args.workers:
+        run = run_workers(n, args)
+        results['runs'].append(run)
+        base = results['runs'][0]['tracks_per_s']
+        print(f"{n:>3} workers: assigned in {run['assigned_s']:.2f}s, "
+              f"{run['played']} tracks {run['tracks_per_s']:6.2f}/s "
+              f"(x{run['tracks_per_s'] / base:.2f}), "
+              f"{run['downloads']} downloads, {run['coordinator']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--tracks', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds per fake API call")
+    parser.add_argument('--same-tracks', action='store_true')
+    parser.add_argument('--output', help="write results to a JSON file")
+    main(parser.parse_args())
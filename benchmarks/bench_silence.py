@@ -0,0 +1,88 @@
+"""Benchmark tgvc/silence.py against transcoding
+
+Encodes tones with seconds of silence before and after them to MP3,
+transcodes them to RAW PCM like the player does and compares the time
+of the transcode with the time of finding and cutting the silence.
+The cut has to be within 0.2s of the silence which was added.
+Finding the silence reads only the edges of the file, cutting the head
+copies the rest of it and costs about as much as writing it.
+
+    python -m benchmarks.bench_silence --lengths 30 300 1800
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import ffmpeg
+from benchmarks.bench_transcode import measure
+from benchmarks.harness import git_revision
+from tgvc import silence
+
+
+def make_padded(path, seconds, head, tail):
+    """MP3 of a tone with head and tail seconds of silence"""
+    (
+        ffmpeg
+        .input(f"sine=frequency=440:duration={seconds}:sample_rate=44100",
+               format='lavfi')
+        .filter('adelay', f"{int(head * 1000)}", all=1)
+        .filter('apad', pad_dur=tail)
+        .output(path, ac=2, acodec='libmp3lame', audio_bitrate='192k',
+                loglevel='error')
+        .overwrite_output()
+        .run()
+    )
+    return path
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(args, workdir):
+    # the player has imported NumPy long before, don't count the import
+    import numpy  # noqa: F401
+    results = {'revision': git_revision(), 'runs': []}
+    print(f"revision {results['revision']}, "
+          f"head {args.head}s tail {args.tail}s of silence")
+    raw = os.path.join(workdir, "out.raw")
+    for seconds in args.lengths:
+        src = make_padded(os.path.join(workdir, f"{seconds}.mp3"),
+                          seconds, args.head, args.tail)
+        total = seconds + args.head + args.tail
+        transcode_s = measure(src, raw, 'default', total)['wall_s']
+        find_s, (head, tail) = timed(silence.find_silence, raw)
+        cut_s, _ = timed(silence.cut, raw, head, tail)
+        head_s, tail_s = silence.seconds(head), silence.seconds(tail)
+        if abs(head_s - args.head) > 0.2 or abs(tail_s - args.tail) > 0.2:
+            raise RuntimeError(f"cut {head_s:.2f}s/{tail_s:.2f}s of "
+                               f"{args.head}s/{args.tail}s silence")
+        run = {
+            'seconds': seconds,
+            'transcode_s': transcode_s,
+            'find_s': find_s,
+            'cut_s': cut_s,
+            'share': (find_s + cut_s) / transcode_s,
+        }
+        results['runs'].append(run)
+        print(f"{seconds:>6}s transcode {transcode_s:>7.3f}s "
+              f"find {find_s * 1000:>7.1f}ms cut {cut_s * 1000:>7.1f}ms "
+              f"{run['share']:>6.1%} of transcode, "
+              f"cut {head_s:.2f}s + {tail_s:.2f}s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lengths', type=int, nargs='+',
+                        default=[30, 300, 1800])
+    parser.add_argument('--head', type=float, default=4)
+    parser.add_argument('--tail', type=float, default=6)
+    parser.add_argument('--output', help="write results to a JSON file")
+    with tempfile.TemporaryDirectory() as tmp:
+        main(parser.parse_args(), tmp)
@@ -0,0 +1,79 @@
+"""Benchmark startup and time to first response of the plugins
+
+Every run is a fresh Python process (cold imports) which loads the
+plugins the way Pyrogram does and then answers "!vc" through the
+player with a FakeClient, like the first command after a restart.
+The session start itself needs Telegram and is not included, main.py
+prints it in its startup report.
+
+    python -m benchmarks.bench_startup --runs 10
+"""
+import sys
+import json
+import argparse
+import subprocess
+from benchmarks.harness import git_revision
+from tgvc.stats import summarize
+
+PLUGINS = ["plugins.vc.player", "plugins.ping", "plugins.sysinfo"]
+
+
+def child():
+    from tgvc.startup import profile
+    import asyncio
+    import tempfile
+    import importlib
+    with profile.imports("plugin load"):
+        modules = [importlib.import_module(x) for x in PLUGINS]
+    player = modules[0]
+    player.DELETE_DELAY = 0
+    from benchmarks.fakes import FakeClient
+    with tempfile.TemporaryDirectory() as workdir:
+        client = FakeClient(workdir)
+        profile.watch_first_response(client)
+        m = client.message(-1001234567890, "!vc", outgoing=True)
+        asyncio.run(player.dispatch_command(client, m))
+    slowest = sorted(profile.import_times.items(), key=lambda x: -x[1])
+    print(json.dumps({
+        'plugin_load_s': profile.phases["plugin load"],
+        'first_response_s': profile.first_response,
+        'imports': dict(slowest[:10]),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', help="write results to a JSON file")
+    parser.add_argument('--child', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child()
+    runs = [
+        json.loads(subprocess.check_output(
+            [sys.executable, "-m", "benchmarks.bench_startup", "--child"]
+        ).decode().splitlines()[-1])
+        for _ in range(args.runs)
+    ]
+    results = {
+        'revision': git_revision(),
+        'plugin_load_s': summarize([x['plugin_load_s'] for x in runs]),
+        'first_response_s': summarize([x['first_response_s'] for x in runs]),
+        'imports': runs[-1]['imports'],
+    }
+    print(f"revision {results['revision']}, {args.runs} runs")
+    for key in ('plugin_load_s', 'first_response_s'):
+        print(f"{key:<18}" + " ".join(
+            f"{k} {v:.3f}s" for k, v in results[key].items()
+        ))
+    print("slowest imports of the last run (inclusive):")
+    for module, seconds in results['imports'].items():
+        print(f"  {module:<40} {seconds:.3f}s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
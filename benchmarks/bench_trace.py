@@ -0,0 +1,79 @@
+"""Benchmark the cost of tracing a track with tgvc/trace.py
+
+Traces --tracks tracks with the spans the player marks for a track
+downloaded, transcoded and played after another one (11 spans), with
+the JSON Lines file written (and rotated every --max-bytes) or kept in
+memory only, and reports the microseconds per track and per span and
+the bytes per trace. Compare them with the handler latencies of
+benchmarks/bench_player.py, which are milliseconds.
+
+    python -m benchmarks.bench_trace --tracks 100000
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+from types import SimpleNamespace
+from benchmarks.harness import git_revision
+from tgvc.trace import TrackTracer
+
+SPANS = 11
+
+
+def trace_tracks(tracer, n):
+    """seconds per track of begin() ... finish() for n tracks"""
+    tracks = [SimpleNamespace() for _ in range(n)]
+    start = time.perf_counter()
+    for i, track in enumerate(tracks):
+        tracer.begin(track, f"AgADbench{i}", f"Artist - Track {i}")
+        tracer.mark(track, 'admitted')
+        tracer.mark(track, 'download_start')
+        tracer.mark(track, 'download_end', bytes=8 * 1024 * 1024)
+        tracer.mark(track, 'transcode_start')
+        tracer.mark(track, 'transcode_end')
+        tracer.mark(track, 'ready')
+        tracer.mark(track, 'play', gap=0.0123)
+        tracer.mark(track, 'loop')
+        tracer.mark(track, 'loop')
+        tracer.finish(track)
+    return (time.perf_counter() - start) / n
+
+
+def main(args, workdir):
+    results = {'revision': git_revision(), 'tracks': args.tracks}
+    print(f"revision {results['revision']}, {args.tracks} tracks of "
+          f"{SPANS} spans")
+    memory_s = trace_tracks(TrackTracer(), args.tracks)
+    path = os.path.join(workdir, "traces.jsonl")
+    tracer = TrackTracer()
+    tracer.open(path, max_bytes=args.max_bytes)
+    file_s = trace_tracks(tracer, args.tracks)
+    files = [x for x in os.listdir(workdir) if x.startswith("traces.jsonl")]
+    with open(path) as f:
+        lines = f.readlines()
+    results.update({
+        'memory_us_per_track': memory_s * 1e6,
+        'file_us_per_track': file_s * 1e6,
+        'file_us_per_span': file_s * 1e6 / SPANS,
+        'bytes_per_trace': os.path.getsize(path) / len(lines),
+        'files': len(files),
+    })
+    assert json.loads(lines[-1])['spans'][-1]['name'] == 'end'
+    for key in ('memory', 'file'):
+        print(f"{key:>6}: {results[f'{key}_us_per_track']:7.1f}us per track")
+    print(f"{results['file_us_per_span']:.2f}us per span, "
+          f"{results['bytes_per_trace']:.0f} bytes per trace, "
+          f"{len(files)} files after rotation")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tracks', type=int, default=100000)
+    parser.add_argument('--max-bytes', type=int, default=4 * 1024 * 1024)
+    parser.add_argument('--output', help="write results to a JSON file")
+    with tempfile.TemporaryDirectory() as tmp:
+        main(parser.parse_args(), tmp)
@@ -0,0 +1,123 @@
+"""Benchmark transcode profiles of tgvc/transcode.py
+
+Generates a local corpus of sine tones encoded as MP3/Opus/FLAC/M4A in
+several lengths, transcodes each file with each profile to RAW PCM and
+reports wall time, CPU seconds and peak RSS of the ffmpeg process.
+Pick the profile with the lowest CPU/wall time that fits in memory and
+set TRANSCODE_PROFILE to it.
+
+    python -m benchmarks.bench_transcode --lengths 30 600 --output t.json
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import ffmpeg
+from benchmarks.harness import git_revision
+from tgvc import transcode
+
+CODECS = {
+    'mp3': ('mp3', {'acodec': 'libmp3lame', 'audio_bitrate': '192k'}),
+    'opus': ('opus', {'acodec': 'libopus', 'audio_bitrate': '128k'}),
+    'flac': ('flac', {'acodec': 'flac'}),
+    'm4a': ('m4a', {'acodec': 'aac', 'audio_bitrate': '192k'}),
+}
+# s16le, 2 channels, 48 kHz
+PCM_BYTES_PER_SECOND = 2 * 2 * 48000
+
+
+def make_corpus(corpus_dir, lengths):
+    """encode 44.1 kHz stereo tones, skip files which already exist"""
+    files = []
+    for seconds in lengths:
+        for codec, (ext, kwargs) in CODECS.items():
+            path = os.path.join(corpus_dir, f"tone-{seconds}s.{ext}")
+            if not os.path.isfile(path):
+                (
+                    ffmpeg
+                    .input(f"sine=frequency=440:duration={seconds}"
+                           ":sample_rate=44100", format='lavfi')
+                    .output(path, ac=2, loglevel='error', **kwargs)
+                    .overwrite_output()
+                    .run()
+                )
+            files.append((codec, seconds, path))
+    return files
+
+
+def measure(src, dst, profile, seconds):
+    """wall time, CPU seconds and peak RSS of one ffmpeg run"""
+    pipe = transcode.use_pipe(src, profile)
+    args = transcode.build(src, dst, profile, pipe).compile()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        args,
+        stdin=subprocess.PIPE if pipe else subprocess.DEVNULL
+    )
+    if pipe:
+        with open(src, 'rb') as f:
+            shutil.copyfileobj(f, process.stdin,
+                               transcode.PIPE_CHUNK_SIZE)
+        process.stdin.close()
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    process.returncode = (
+        os.WEXITSTATUS(status) if os.WIFEXITED(status)
+        else -os.WTERMSIG(status)
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed with profile {profile}: {src}")
+    # ffmpeg may exit 0 on truncated input, check the RAW PCM length
+    if os.path.getsize(dst) < seconds * PCM_BYTES_PER_SECOND * 0.99:
+        raise RuntimeError(f"short output with profile {profile}: {src}")
+    return {
+        'wall_s': wall,
+        'cpu_s': usage.ru_utime + usage.ru_stime,
+        'peak_rss_kib': usage.ru_maxrss,
+    }
+
+
+def run(corpus_dir, lengths, profiles, repeat):
+    results = {'revision': git_revision(), 'runs': []}
+    with tempfile.TemporaryDirectory() as workdir:
+        dst = os.path.join(workdir, "out.raw")
+        for codec, seconds, src in make_corpus(corpus_dir, lengths):
+            for profile in profiles:
+                best = min(
+                    (measure(src, dst, profile, seconds)
+                     for _ in range(repeat)),
+                    key=lambda x: x['wall_s']
+                )
+                best.update(codec=codec, seconds=seconds, profile=profile)
+                results['runs'].append(best)
+                print(f"{codec:<5} {seconds:>6}s {profile:<16} "
+                      f"wall {best['wall_s']:>7.3f}s "
+                      f"cpu {best['cpu_s']:>7.3f}s "
+                      f"rss {best['peak_rss_kib'] / 1024:>6.1f} MiB")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--corpus', help="keep the generated corpus here")
+    parser.add_argument('--lengths', type=int, nargs='+',
+                        default=[30, 300, 1800])
+    parser.add_argument('--profiles', nargs='+',
+                        default=list(transcode.PROFILES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="write results to a JSON file")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus or tmp
+        os.makedirs(corpus_dir, exist_ok=True)
+        results = run(corpus_dir, args.lengths, args.profiles, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Run benchmark scenarios and store results comparable across commits
+
+A scenario is a coroutine function taking a Bench, it wraps every
+handler call with bench.timed(name, coro). For each scenario the
+harness records handler latency percentiles, API call counts (from the
+FakeClient) and peak Python memory (tracemalloc). Scenarios may add
+their own numbers to bench.counts.
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from collections import Counter
+from tgvc.stats import summarize
+
+
+class Bench(object):
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.latency = {}
+        self.counts = Counter()
+        self.client = None
+
+    async def timed(self, name, coro):
+        start = time.perf_counter()
+        result = await coro
+        self.latency.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _run_scenario(scenario):
+    with tempfile.TemporaryDirectory() as workdir:
+        bench = Bench(workdir)
+        tracemalloc.start()
+        start = time.perf_counter()
+        await scenario(bench)
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        'wall_s': wall,
+        'peak_kib': peak / 1024,
+        'api_calls': dict(bench.client.calls) if bench.client else {},
+        'latency_ms': {
+            name: {k: v * 1000 for k, v in summarize(samples).items()}
+            for name, samples in bench.latency.items()
+        },
+        'handler_calls': {
+            name: len(samples) for name, samples in bench.latency.items()
+        },
+        'counts': dict(bench.counts),
+    }
+
+
+def run(scenarios, output=None):
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'scenarios': {},
+    }
+    for name, scenario in scenarios.items():
+        results['scenarios'][name] = asyncio.run(_run_scenario(scenario))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+def print_results(results, baseline=None):
+    print(f"revision {results['revision']} python {results['python']}")
+    for name, result in results['scenarios'].items():
+        base = (baseline or {}).get('scenarios', {}).get(name)
+        print(f"\n{name}: {result['wall_s']:.3f}s, "
+              f"peak {result['peak_kib']:.0f} KiB, "
+              f"api {sum(result['api_calls'].values())} calls")
+        for handler, lat in result['latency_ms'].items():
+            line = (f"  {handler:<24} p50 {lat['p50']:>9.3f}ms "
+                    f"p95 {lat['p95']:>9.3f}ms max {lat['max']:>9.3f}ms")
+            if base and base['latency_ms'].get(handler, {}).get('p50'):
+                old = base['latency_ms'][handler]['p50']
+                line += f"  p50 {(lat['p50'] - old) / old * 100:+.1f}%"
+            print(line)
+        if result.get('counts'):
+            print("  " + ", ".join(f"{k} {v:g}"
+                                   for k, v in result['counts'].items()))
+
+
+def main(scenarios, description=None):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--output', help="write results to a JSON file")
+    parser.add_argument('--compare', help="JSON results of an earlier run")
+    parser.add_argument('scenario', nargs='*', help="scenarios to run")
+    args = parser.parse_args()
+    unknown = set(args.scenario) - set(scenarios)
+    if unknown:
+        sys.exit(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    if args.scenario:
+        scenarios = {k: scenarios[k] for k in args.scenario}
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(run(scenarios, args.output), baseline)
@@ -1,24 +1,72 @@
-from os import environ
-# import logging
-from pyrogram import Client, idle
+from tgvc.startup import profile
+with profile.imports():
+    from os import environ, path
+    # import logging
+    from pyrogram import Client, idle
+    from tgvc import shard
+    from tgvc.looplag import monitor
+    from tgvc.trace import tracer
 
 api_id = int(environ["API_ID"])
 api_hash = environ["API_HASH"]
-session_name = environ["SESSION_NAME"]
+# several session strings separated by spaces run one worker process per
+# account, see tgvc/shard.py
+session_names = environ["SESSION_NAME"].split()
+# opt-in, report event loop blocked longer than this (ms) to saved messages
+loop_lag_threshold = environ.get("LOOP_LAG_THRESHOLD")
+# finished track traces of the player, empty to keep them in memory only
+trace_file = environ.get("TRACE_FILE", "traces.jsonl")
 
 plugins = dict(
     root="plugins",
     include=[
         "vc." + environ["PLUGIN"],
         "ping",
-        "sysinfo"
+        "sysinfo",
+        "reload"
     ]
 )
 
-app = Client(session_name, api_id, api_hash, plugins=plugins)
-# logging.basicConfig(level=logging.INFO)
-app.start()
-print('>>> USERBOT STARTED')
-idle()
-app.stop()
-print('\n>>> USERBOT STOPPED')
+
+def run(session_name):
+    app = Client(session_name, api_id, api_hash, plugins=plugins)
+    if trace_file:
+        name, ext = path.splitext(trace_file)
+        if shard.worker is not None:
+            name = f"{name}-{shard.worker.index}"
+        tracer.open(path.join(app.workdir, name + ext))
+    app.load_plugins = profile.wrap("plugin load", app.load_plugins)
+    profile.watch_first_response(
+        app,
+        lambda p: print(f'>>> FIRST RESPONSE {p.first_response:.3f}s')
+    )
+
+    async def report_blocked_loop(stalled, stack):
+        await app.send_message(
+            "me",
+            f"event loop blocked for over `{stalled * 1000:.0f} ms`\n"
+            f"lag: `{monitor.summary()}`\n"
+            f"```{stack[-3500:]}```"
+        )
+
+    # logging.basicConfig(level=logging.INFO)
+    with profile.phase("start (session and plugins)"):
+        app.start()
+    if shard.worker is not None:
+        shard.worker.start(app)
+    if loop_lag_threshold:
+        monitor.threshold = float(loop_lag_threshold) / 1000
+        monitor.on_blocked = report_blocked_loop
+        monitor.start()
+    print('>>> USERBOT STARTED')
+    print(profile.report())
+    idle()
+    monitor.stop()
+    app.stop()
+    print('\n>>> USERBOT STOPPED')
+
+
+if len(session_names) == 1:
+    run(session_names[0])
+else:
+    shard.Coordinator(run, [(x, ) for x in session_names]).run()
@@ -1,13 +1,23 @@
-"""!ping reply with pong
+"""!ping [n] run n latency probes and show percentiles per probe type
 !uptime check uptime
 """
-from time import time
+import os
+import asyncio
+from random import randint
+from time import time, process_time
 from datetime import datetime
 from pyrogram import Client, filters, emoji
+from pyrogram.raw.functions import Ping
 from pyrogram.types import Message
+from tgvc.core import group_call_states, state
+from tgvc.dispatcher import CommandDispatcher
+from tgvc.looplag import monitor
+from tgvc.stats import summarize
 
 # DELAY_DELETE = 60
-START_TIME = datetime.utcnow()
+PING_MAX_PROBES = 20
+# of the process, not of the last !reload
+START_TIME = state("start time", datetime.utcnow)
 START_TIME_ISO = START_TIME.replace(microsecond=0).isoformat()
 TIME_DURATION_UNITS = (
     ('week', 60 * 60 * 24 * 7),
@@ -17,13 +27,21 @@ TIME_DURATION_UNITS = (
     ('sec', 1)
 )
 
-self_or_contact_filter = filters.create(
-    lambda
-    _,
-    __,
-    message:
-    (message.from_user and message.from_user.is_contact) or message.outgoing
-)
+commands = CommandDispatcher()
+
+
+def is_self_or_contact(message: Message):
+    return bool(
+        (message.from_user and message.from_user.is_contact)
+        or message.outgoing
+    )
+
+
+def _valid_ping(message: Message):
+    args = message.command[1:]
+    return (is_self_or_contact(message)
+            and len(args) <= 1
+            and all(x.isdigit() for x in args))
 
 
 # https://gist.github.com/borgstrom/936ca741e885a1438c374824efb038b3
@@ -39,26 +57,72 @@ async def _human_time_duration(seconds):
     return ', '.join(parts)
 
 
-@Client.on_message(filters.text
-                   & self_or_contact_filter
-                   & ~filters.edited
-                   & ~filters.via_bot
-                   & filters.regex("^!ping$"))
-async def ping_pong(_, m: Message):
-    """reply ping with pong and delete both messages"""
+async def _timed(samples, probe_type, coro):
     start = time()
-    m_reply = await m.reply_text("...")
-    delta_ping = time() - start
-    await m_reply.edit_text(
-        f"{emoji.ROBOT} ping: `{delta_ping * 1000:.3f} ms`"
-    )
+    result = await coro
+    samples.setdefault(probe_type, []).append(time() - start)
+    return result
 
 
-@Client.on_message(filters.text
-                   & self_or_contact_filter
+async def _run_probes(client, m_status: Message, n, samples):
+    """raw MTProto ping, send, edit, get_chat and event loop wake-up"""
+    sent = []
+    for i in range(n):
+        await _timed(samples, 'mtproto',
+                     client.send(Ping(ping_id=randint(0, 2 ** 31))))
+        sent.append(await _timed(samples, 'send',
+                                 client.send_message("me", f"ping {i}")))
+        await _timed(samples, 'edit',
+                     m_status.edit_text(f"{emoji.ROBOT} ping {i + 1}/{n}"))
+        await _timed(samples, 'get_chat', client.get_chat(m_status.chat.id))
+        await _timed(samples, 'loop', asyncio.sleep(0))
+    await client.delete_messages("me", [x.message_id for x in sent])
+
+
+def _format_probes(samples, n, wall, cpu):
+    lines = [f"{'ms':<8}{'min':>7}{'p50':>7}{'p95':>7}{'max':>7}"]
+    for probe_type, values in samples.items():
+        summary = summarize(values)
+        lines.append(f"{probe_type:<8}" + "".join(
+            f"{summary[k] * 1000:>7.1f}"
+            for k in ('min', 'p50', 'p95', 'max')
+        ))
+    load = ", ".join(f"{x:.2f}" for x in os.getloadavg())
+    text = [
+        f"{emoji.ROBOT} **ping** x{n}",
+        "```" + "\n".join(lines) + "```",
+        f"- loop lag: `{monitor.summary() if monitor.is_running else 'n/a'}`",
+        f"- cpu: `{cpu / wall * 100:.0f}% of {wall:.2f}s`, "
+        f"load `{load}` ({os.cpu_count()} cores)",
+    ]
+    text.extend(f"- {name}: `{state}`"
+                for name, state in group_call_states().items())
+    return "\n".join(text)
+
+
+@Client.on_message(commands.filter
+                   & filters.text
                    & ~filters.edited
-                   & ~filters.via_bot
-                   & filters.regex("^!uptime$"))
+                   & ~filters.via_bot)
+async def dispatch_command(client, m: Message):
+    await commands.dispatch(client, m)
+
+
+@commands.on("!ping", args=True, check=_valid_ping)
+async def ping_pong(client, m: Message):
+    """!ping [n] break latency down by API call type, loop lag and CPU"""
+    args = m.command[1:]
+    n = max(1, min(int(args[0]), PING_MAX_PROBES)) if args else 1
+    samples = {}
+    start, start_cpu = time(), process_time()
+    m_reply = await _timed(samples, 'reply', m.reply_text("..."))
+    await _run_probes(client, m_reply, n, samples)
+    await m_reply.edit_text(_format_probes(
+        samples, n, time() - start, process_time() - start_cpu
+    ))
+
+
+@commands.on("!uptime", check=is_self_or_contact)
 async def get_uptime(_, m: Message):
     """/uptime Reply with readable uptime and ISO 8601 start time"""
     current_time = datetime.utcnow()
@@ -0,0 +1,44 @@
+"""!reload [plugin ...] re-import the plugins without leaving the voice
+chat, e.g. after changing DELETE_DELAY or deploying a fix to the player
+
+Only the userbot account itself can reload. Plugin names are relative
+to the plugins directory like "vc.player", all loaded plugins by
+default. Group calls, the playlist and the caches stay as they are,
+see tgvc/reload.py
+"""
+import time
+from pyrogram import Client, filters, emoji
+from pyrogram.types import Message
+from tgvc.dispatcher import CommandDispatcher
+from tgvc.reload import plugin_modules, reload_plugins
+
+commands = CommandDispatcher()
+
+
+@Client.on_message(commands.filter
+                   & filters.text
+                   & filters.outgoing
+                   & ~filters.edited
+                   & ~filters.via_bot)
+async def dispatch_command(client, m: Message):
+    await commands.dispatch(client, m)
+
+
+@commands.on("!reload", args=True)
+async def reload_handler_code(client, m: Message):
+    modules = plugin_modules(client, m.command[1:])
+    if not modules:
+        await m.edit_text(f"{emoji.NO_ENTRY} no such plugin loaded")
+        return
+    start = time.perf_counter()
+    try:
+        # handlers are swapped after this handler returned
+        await reload_plugins(client, modules)
+    except Exception as e:
+        await m.edit_text(f"{emoji.CROSS_MARK} reload failed: "
+                          f"`{type(e).__name__}: {e}`")
+        return
+    root = client.plugins["root"] + "."
+    names = ", ".join(x.__name__[len(root):] for x in modules)
+    await m.edit_text(f"{emoji.CLOCKWISE_VERTICAL_ARROWS} reloaded {names} "
+                      f"in `{(time.perf_counter() - start) * 1000:.0f} ms`")
@@ -3,6 +3,7 @@ from datetime import datetime
 import psutil
 from psutil._common import bytes2human
 from pyrogram import Client, filters
+from tgvc.dispatcher import CommandDispatcher
 
 self_or_contact_filter = filters.create(
     lambda
@@ -11,6 +12,7 @@ self_or_contact_filter = filters.create(
     message:
     (message.from_user and message.from_user.is_contact) or message.outgoing
 )
+commands = CommandDispatcher()
 
 
 async def generate_sysinfo(workdir):
@@ -78,11 +80,16 @@ async def generate_sysinfo(workdir):
     """
 
 
-@Client.on_message(filters.group
+@Client.on_message(commands.filter
+                   & filters.group
                    & filters.text
                    & ~filters.edited
-                   & ~filters.via_bot
-                   & filters.regex("^!sysinfo$"))
+                   & ~filters.via_bot)
+async def dispatch_command(client, m):
+    await commands.dispatch(client, m)
+
+
+@commands.on("!sysinfo")
 async def get_sysinfo(client, m):
     response = "**System Information**:\n"
     m_reply = await m.reply_text(f"{response}`...`")
@@ -3,6 +3,38 @@
 Dependencies:
 - ffmpeg
 
+Environment variables:
+- TRANSCODE_PROFILE: ffmpeg profile defined in tgvc/transcode.py,
+  compare them with benchmarks/bench_transcode.py
+- ADMISSION_USER_RATE, ADMISSION_USER_BURST, ADMISSION_CHAT_RATE,
+  ADMISSION_CHAT_BURST, ADMISSION_MAX_QUEUE, ADMISSION_MAX_BACKLOG:
+  limits of admission control, see tgvc/admission.py
+
+Played tracks are recorded in library.sqlite in the workdir, members
+can play them again with !play <query>. The same recording uploaded
+again is recognized by its acoustic fingerprint and shares the cached
+RAW PCM of the first upload, and leading/trailing silence is cut
+from the RAW PCM (both need NumPy and read one shared memory mapping
+of the PCM, see tgvc/pcm.py)
+
+Requests of group members which would download audio (/play, links)
+go through admission control, see tgvc/admission.py and
+ADMISSION_LIMITS below
+
+With several accounts (tgvc/shard.py) every account handles the chat
+it plays in, !join in another chat is routed to the account with the
+fewest voice chats, and they share the RAW PCM in the workdir. An
+account owns the chat until !leave
+
+Every queued track is traced from the request to its end (received,
+admitted, download, transcode, ready, play with the gap before it,
+end), main.py appends finished traces to TRACE_FILE (traces.jsonl in
+the workdir by default, rotated), !trace shows the slowest tracks to
+start playing, see tgvc/trace.py
+
+!reload (plugins/reload.py) re-imports this module while it plays, the
+player state and caches are kept in tgvc/core.py, see `mp` below
+
 Required group admin permissions:
 - Delete messages
 - Manage voice chats (optional)
@@ -15,23 +47,48 @@ How to use:
   it in the voice chat, every member of the group
   can use the !play command now
 - check !help for more commands
+
+pytgcalls, youtube_dl, PIL and ffmpeg-python are imported on first use
+and the GroupCall is built when it's needed, to start up faster
 """
 import os
+import time
+import zlib
 import asyncio
+from types import SimpleNamespace
 from urllib.parse import urlparse
 from datetime import datetime, timedelta
 from pyrogram import Client, filters, emoji
 from pyrogram.types import Message, Audio
 from pyrogram.methods.messages.download_media import DEFAULT_DOWNLOAD_DIR
-from pytgcalls import GroupCall
-import ffmpeg
-from youtube_dl import YoutubeDL
-from PIL import Image
+from tgvc import cache, core, shard
+from tgvc.admission import AdmissionControl, limits_from_environ
+from tgvc.core import register_group_call
+from tgvc.dispatcher import CommandDispatcher
+from tgvc.download import download_audio_file
+from tgvc.fingerprint import FingerprintIndex, fingerprint, loads
+from tgvc.library import TrackLibrary
+from tgvc.pcm import FRAME_BYTES, open_source
+from tgvc.silence import cut, find_silence, seconds
+from tgvc.trace import tracer
+from tgvc.transcode import profile_from_environ, transcode
 
 DELETE_DELAY = 8
 MUSIC_MAX_LENGTH = 10800
 DELAY_DELETE_INFORM = 10
 TG_THUMB_MAX_LENGTH = 320
+TRANSCODE_PROFILE = profile_from_environ(os.environ)
+# user_rate, user_burst, chat_rate, chat_burst, max_queue, max_backlog
+ADMISSION_LIMITS = limits_from_environ(os.environ)
+# tracks at the head of the playlist which are downloaded in advance
+PREFETCH_WINDOW = 2
+PLAYLIST_MAX_ENTRIES = 200
+# imported playlist entries resolved/downloaded at the same time
+PLAYLIST_CONCURRENCY = 2
+PLAYLIST_SHOW_MAX = 10
+TRACE_SHOW_DEFAULT = 5
+TRACE_SHOW_MAX = 20
+LIBRARY_FILE = "library.sqlite"
 REGEX_SITES = (
     r"^((?:https?:)?\/\/)"
     r"?((?:www|m)\.)"
@@ -41,15 +98,20 @@ REGEX_SITES = (
 REGEX_EXCLUDE_URL = (
     r"\/channel\/|\/playlist\?list=|&list=|\/sets\/"
 )
+REGEX_PLAYLIST_URL = r"\/playlist\?list=|&list=|\/sets\/"
+# cheap substring check before running REGEX_SITES
+SITE_KEYWORDS = ("youtu", "soundcloud.com", "mixcloud.com")
 
 USERBOT_HELP = f"""{emoji.LABEL}  **Common Commands**:
 __available to group members of current voice chat__
 __starts with / (slash) or ! (exclamation mark)__
 
 /play  reply with an audio to play/queue it, or show playlist
+`!play` [query]  queue the best match of played tracks
 /current  show current playing time of current track
 /repo  show git repository of the userbot
 `!help`  show help for commands
+__send a YouTube playlist or SoundCloud set link to queue its tracks__
 
 
 {emoji.LABEL}  **Admin Commands**:
@@ -63,6 +125,7 @@ __starts with ! (exclamation mark)__
 `!stop`  stop playing
 `!replay`  play from the beginning
 `!clean`  remove unused RAW PCM files
+`!trace` [n]  show the n slowest tracks to start playing
 `!pause` pause playing
 `!resume` resume playing
 `!mute`  mute the VC userbot
@@ -91,16 +154,37 @@ self_or_contact_filter = filters.create(
 )
 
 
+def in_current_vc(m: Message):
+    """mp.chat_id is kept up to date by network_status_changed_handler"""
+    return mp.chat_id is not None and m.chat.id == mp.chat_id
+
+
 async def current_vc_filter(_, __, m: Message):
-    group_call = mp.group_call
-    if not group_call.is_connected:
-        return False
-    chat_id = int("-100" + str(group_call.full_chat.id))
-    if m.chat.id == chat_id:
+    return in_current_vc(m)
+
+
+async def site_link_filter(_, __, m: Message):
+    text = m.text
+    return bool(text) and any(x in text for x in SITE_KEYWORDS)
+
+
+def in_owned_chat(m: Message):
+    """with several accounts (tgvc/shard.py) one handles the messages of
+    a chat, its owner or the first account if nobody plays there
+    """
+    worker = shard.worker
+    if worker is None or worker.owns(m.chat.id):
         return True
-    return False
+    return worker.owner(m.chat.id) is None and worker.index == 0
+
+
+async def owned_chat_filter(_, __, m: Message):
+    return in_owned_chat(m)
 
 current_vc = filters.create(current_vc_filter)
+site_link = filters.create(site_link_filter)
+owned_chat = filters.create(owned_chat_filter)
+commands = CommandDispatcher()
 
 
 # - class
@@ -108,12 +192,26 @@ current_vc = filters.create(current_vc_filter)
 
 class MusicPlayer(object):
     def __init__(self):
-        self.group_call = GroupCall(None, path_to_log_file='')
+        self._group_call = None
         self.chat_id = None
         self.start_time = None
         self.playlist = []
         self.msg = {}
 
+    @property
+    def group_call(self):
+        if self._group_call is None:
+            from pytgcalls import GroupCall
+            group_call = GroupCall(None, path_to_log_file='')
+            group_call.on_network_status_changed(_on_network_status_changed)
+            group_call.on_playout_ended(_on_playout_ended)
+            self._group_call = register_group_call("player", group_call)
+        return self._group_call
+
+    @group_call.setter
+    def group_call(self, group_call):
+        self._group_call = group_call
+
     async def update_start_time(self, reset=False):
         self.start_time = (
             None if reset
@@ -131,44 +229,180 @@ class MusicPlayer(object):
                 pl = f"{emoji.PLAY_BUTTON} **Playlist**:\n"
             pl += "\n".join([
                 f"**{i}**. **[{x.audio.title}]({x.link})**"
-                for i, x in enumerate(playlist)
+                for i, x in enumerate(playlist[:PLAYLIST_SHOW_MAX])
             ])
+            if len(playlist) > PLAYLIST_SHOW_MAX:
+                pl += f"\n__and {len(playlist) - PLAYLIST_SHOW_MAX} more__"
         if mp.msg.get('playlist') is not None:
             await mp.msg['playlist'].delete()
         mp.msg['playlist'] = await send_text(pl)
 
 
-mp = MusicPlayer()
+class PlaylistEntry(object):
+    """Track of an imported playlist, only metadata until it enters the
+    prefetch window, then it's downloaded with youtube_dl and transcoded
+    """
+
+    def __init__(self, message: Message, info: dict):
+        self.message = message
+        self.url = info.get('webpage_url') or info['url']
+        self.ie_key = info.get('ie_key')
+        if "://" in self.url:
+            self.link = self.url
+        else:
+            self.link = f"https://www.youtube.com/watch?v={self.url}"
+        track_id = info.get('id') or f"{zlib.crc32(self.url.encode()):x}"
+        self.audio = SimpleNamespace(
+            file_unique_id=f"{self.ie_key or 'url'}-{track_id}",
+            title=info.get('title') or self.url,
+            duration=int(info.get('duration') or 0),
+            performer=info.get('uploader')
+        )
+        self.task = None
+
+    async def reply_text(self, text, **kwargs):
+        return await self.message.reply_text(text, **kwargs)
+
+
+class LibraryTrack(object):
+    """Telegram audio played before, downloaded again by its file_id
+
+    The file reference in file_id expires, refresh() fetches the message
+    of the audio again for a fresh one
+    """
+
+    def __init__(self, client: Client, message: Message, track):
+        self.client = client
+        self.message = message
+        self.link = track.link
+        self.chat_id = track.chat_id
+        self.message_id = track.message_id
+        self.audio = SimpleNamespace(
+            file_unique_id=track.file_unique_id,
+            file_id=track.file_id,
+            file_size=track.file_size,
+            mime_type=track.mime_type,
+            title=track.title,
+            duration=track.duration,
+            performer=track.performer
+        )
+
+    async def refresh(self):
+        """take the file_id of the message of the audio, if it's known"""
+        if self.chat_id is None or self.message_id is None:
+            return
+        message = await self.client.get_messages(self.chat_id,
+                                                 self.message_id)
+        audio = message.audio
+        # deleted, the stored file_id may still work
+        if audio is None \
+                or audio.file_unique_id != self.audio.file_unique_id:
+            return
+        self.audio.file_id = audio.file_id
+
+    async def download(self):
+        return await self.client.download_media(self.audio.file_id)
+
+    async def reply_text(self, text, **kwargs):
+        return await self.message.reply_text(text, **kwargs)
+
+
+# kept across !reload, the new code gets the objects of the old one
+mp = core.state("player", MusicPlayer)
+admission = core.state("player admission", AdmissionControl)
+# the limits of this code, also after !reload
+admission.configure(**ADMISSION_LIMITS)
+# made on first use, TrackLibrary and FingerprintIndex of the workdir
+_caches = core.state("player caches", lambda: SimpleNamespace(
+    library=None, fingerprint_index=None, fingerprints_rowid=0,
+    dedupe_lock=None, playlist_semaphore=None
+))
+# file_unique_id -> task of download_audio() in progress
+_downloads = core.state("player downloads", dict)
+# flocks on the PCM of mp.playlist[:PREFETCH_WINDOW]
+_pins = core.state("player pins", cache.Pins)
+# file_unique_id of a duplicate -> file_unique_id whose RAW PCM it uses
+_pcm_ids = core.state("player pcm ids", dict)
+
+
+def _renew_classes(objects):
+    """objects made by the code before !reload get the classes of this
+    one, for its methods and isinstance()
+    """
+    classes = {x.__name__: x for x in (MusicPlayer, PlaylistEntry,
+                                       LibraryTrack)}
+    for x in objects:
+        if type(x).__module__ == __name__ and \
+                type(x).__name__ in classes:
+            x.__class__ = classes[type(x).__name__]
+
+
+_renew_classes([mp, *mp.playlist])
 
 
 # - pytgcalls handlers
 
 
-@mp.group_call.on_network_status_changed
-async def network_status_changed_handler(gc: GroupCall, is_connected: bool):
+async def network_status_changed_handler(gc, is_connected: bool):
     if is_connected:
         mp.chat_id = int("-100" + str(gc.full_chat.id))
         await send_text(f"{emoji.CHECK_MARK_BUTTON} joined the voice chat")
     else:
         await send_text(f"{emoji.CROSS_MARK_BUTTON} left the voice chat")
+        # the chat stays owned (tgvc/shard.py), pytgcalls reconnects
+        # after network drops, !leave releases it
         mp.chat_id = None
 
 
-@mp.group_call.on_playout_ended
 async def playout_ended_handler(group_call, filename):
     await skip_current_playing()
 
 
+# registered on the GroupCall once, they call the handlers of the code
+# loaded last
+async def _on_network_status_changed(gc, is_connected: bool):
+    await network_status_changed_handler(gc, is_connected)
+
+
+async def _on_playout_ended(group_call, filename):
+    await playout_ended_handler(group_call, filename)
+
+
 # - Pyrogram handlers
 
+@Client.on_message(commands.filter & main_filter)
+async def dispatch_command(client, m: Message):
+    if shard.worker is not None and not shard.worker.owns(m.chat.id):
+        # another account plays here, or the coordinator picks one
+        if m.text == "!join" and shard.worker.owner(m.chat.id) is None:
+            shard.worker.request(m.chat.id, m.message_id)
+        return
+    await commands.dispatch(client, m)
+
+
+@shard.on('command')
+async def run_routed_command(client, chat_id, message_id):
+    """the coordinator assigned chat_id to this account"""
+    m = await client.get_messages(chat_id, message_id)
+    await commands.dispatch(client, m)
+
+
+@shard.on('rejected')
+async def reject_routed_command(client, chat_id, message_id):
+    await client.send_message(
+        chat_id, f"{emoji.NO_ENTRY} every account is in a voice chat",
+        reply_to_message_id=message_id
+    )
+
+
+@commands.on("/play", "!play", args=True, check=in_current_vc)
 @Client.on_message(
     filters.group
     & ~filters.edited
     & current_vc
-    & (filters.regex("^(\\/|!)play$") | filters.audio)
+    & filters.audio
 )
-async def play_track(client, m: Message):
-    group_call = mp.group_call
+async def play_track(client, m: Message, admitted=False):
     playlist = mp.playlist
     # check audio
     if m.audio:
@@ -182,15 +416,18 @@ async def play_track(client, m: Message):
         m_audio = m
     elif m.reply_to_message and m.reply_to_message.audio:
         m_audio = m.reply_to_message
+    elif m.command and len(m.command) > 1:
+        m_audio = _find_in_library(client, m, " ".join(m.command[1:]))
+        if m_audio is None:
+            reply = await m.reply_text(f"{emoji.ROBOT} no played track "
+                                       "matches")
+            await _delay_delete_messages((reply, m), DELETE_DELAY)
+            return
     else:
         await mp.send_playlist()
         await m.delete()
         return
-    # check already added
-    if playlist and playlist[-1].audio.file_unique_id \
-            == m_audio.audio.file_unique_id:
-        reply = await m.reply_text(f"{emoji.ROBOT} already added")
-        await _delay_delete_messages((reply, m), DELETE_DELAY)
+    if not await _accept_track(client, m, m_audio, admitted):
         return
     # add to playlist
     playlist.append(m_audio)
@@ -198,25 +435,37 @@ async def play_track(client, m: Message):
         m_status = await m.reply_text(
             f"{emoji.INBOX_TRAY} downloading and transcoding..."
         )
-        await download_audio(playlist[0])
-        group_call.input_filename = os.path.join(
-            client.workdir,
-            DEFAULT_DOWNLOAD_DIR,
-            f"{playlist[0].audio.file_unique_id}.raw"
-        )
-        await mp.update_start_time()
+        await _start_playlist(client)
         await m_status.delete()
-        print(f"- START PLAYING: {playlist[0].audio.title}")
     await mp.send_playlist()
-    for track in playlist[:2]:
-        await download_audio(track)
+    await prefetch()
     if not m.audio:
         await m.delete()
 
 
-@Client.on_message(main_filter
-                   & current_vc
-                   & filters.regex("^(\\/|!)current$"))
+async def _accept_track(client, m: Message, m_audio, admitted):
+    """False if m_audio is queued already, also as another upload of the
+    same recording, or admission control rejects the request
+    """
+    pcm_id = _pcm_id(client, m_audio.audio)
+    if any(_pcm_id(client, x.audio) == pcm_id for x in mp.playlist):
+        reply = await m.reply_text(f"{emoji.ROBOT} already added")
+        await _delay_delete_messages((reply, m), DELETE_DELAY)
+        return False
+    _begin_trace(m_audio)
+    if admitted:
+        return True
+    # cached tracks add nothing to the backlog
+    backlog = 0 if os.path.isfile(_raw_file(client, m_audio.audio)) \
+        else m_audio.audio.duration
+    if not await _admit(m, backlog):
+        tracer.finish(m_audio, 'rejected')
+        return False
+    tracer.mark(m_audio, 'admitted')
+    return True
+
+
+@commands.on("/current", "!current", check=in_current_vc)
 async def show_current_playing_time(client, m: Message):
     start_time = mp.start_time
     playlist = mp.playlist
@@ -227,17 +476,19 @@ async def show_current_playing_time(client, m: Message):
     utcnow = datetime.utcnow().replace(microsecond=0)
     if mp.msg.get('current') is not None:
         await mp.msg['current'].delete()
+    trimmed = sum(get_library(client).trim(
+        _pcm_id(client, playlist[0].audio)
+    ))
+    duration = max(0, playlist[0].audio.duration - int(seconds(trimmed)))
     mp.msg['current'] = await playlist[0].reply_text(
         f"{emoji.PLAY_BUTTON}  {utcnow - start_time} / "
-        f"{timedelta(seconds=playlist[0].audio.duration)}",
+        f"{timedelta(seconds=duration)}",
         disable_notification=True
     )
     await m.delete()
 
 
-@Client.on_message(main_filter
-                   & current_vc
-                   & filters.regex("^(\\/|!)help$"))
+@commands.on("/help", "!help", check=in_current_vc)
 async def show_help(client, m: Message):
     if mp.msg.get('help') is not None:
         await mp.msg['help'].delete()
@@ -245,9 +496,7 @@ async def show_help(client, m: Message):
     await m.delete()
 
 
-@Client.on_message(main_filter
-                   & current_vc
-                   & filters.command("skip", prefixes="!"))
+@commands.on("!skip", args=True, check=in_current_vc)
 async def skip_track(client, m: Message):
     playlist = mp.playlist
     if len(m.command) == 1:
@@ -261,7 +510,7 @@ async def skip_track(client, m: Message):
             for i in items:
                 if 2 <= i <= (len(playlist) - 1):
                     audio = f"[{playlist[i].audio.title}]({playlist[i].link})"
-                    playlist.pop(i)
+                    tracer.finish(playlist.pop(i), 'skipped')
                     text.append(f"{emoji.WASTEBASKET} {i}. **{audio}**")
                 else:
                     text.append(f"{emoji.CROSS_MARK} {i}")
@@ -273,8 +522,7 @@ async def skip_track(client, m: Message):
         await _delay_delete_messages((reply, m), DELETE_DELAY)
 
 
-@Client.on_message(main_filter
-                   & filters.regex("^!join$"))
+@commands.on("!join")
 async def join_group_call(client, m: Message):
     group_call = mp.group_call
     group_call.client = client
@@ -285,19 +533,18 @@ async def join_group_call(client, m: Message):
     await m.delete()
 
 
-@Client.on_message(main_filter
-                   & current_vc
-                   & filters.regex("^!leave$"))
+@commands.on("!leave", check=in_current_vc)
 async def leave_voice_chat(client, m: Message):
     group_call = mp.group_call
-    mp.playlist.clear()
+    _clear_playlist()
     group_call.input_filename = ''
     await group_call.stop()
+    if shard.worker is not None:
+        shard.worker.release(m.chat.id)
     await m.delete()
 
 
-@Client.on_message(main_filter
-                   & filters.regex("^!vc$"))
+@commands.on("!vc")
 async def list_voice_chat(client, m: Message):
     group_call = mp.group_call
     if group_call.is_connected:
@@ -313,21 +560,17 @@ async def list_voice_chat(client, m: Message):
     await _delay_delete_messages((reply, m), DELETE_DELAY)
 
 
-@Client.on_message(main_filter
-                   & current_vc
-                   & filters.regex("^!stop$"))
+@commands.on("!stop", check=in_current_vc)
 async def stop_playing(_, m: Message):
     group_call = mp.group_call
     group_call.stop_playout()
     reply = await m.reply_text(f"{emoji.STOP_BUTTON} stopped playing")
     await mp.update_start_time(reset=True)
-    mp.playlist.clear()
+    _clear_playlist()
     await _delay_delete_messages((reply, m), DELETE_DELAY)
 
 
-@Client.on_message(main_filter
-                   & current_vc
-                   & filters.regex("^!replay$"))
+@commands.on("!replay", check=in_current_vc)
 async def restart_playing(_, m: Message):
     group_call = mp.group_call
     if not mp.playlist:
@@ -341,9 +584,7 @@ async def restart_playing(_, m: Message):
     await _delay_delete_messages((reply, m), DELETE_DELAY)
 
 
-@Client.on_message(main_filter
-                   & current_vc
-                   & filters.regex("^!pause"))
+@commands.on("!pause", args=True, check=in_current_vc)
 async def pause_playing(_, m: Message):
     mp.group_call.pause_playout()
     await mp.update_start_time(reset=True)
@@ -353,9 +594,7 @@ async def pause_playing(_, m: Message):
     await m.delete()
 
 
-@Client.on_message(main_filter
-                   & current_vc
-                   & filters.regex("^!resume"))
+@commands.on("!resume", args=True, check=in_current_vc)
 async def resume_playing(_, m: Message):
     mp.group_call.resume_playout()
     reply = await m.reply_text(f"{emoji.PLAY_OR_PAUSE_BUTTON} resumed",
@@ -366,29 +605,46 @@ async def resume_playing(_, m: Message):
     await _delay_delete_messages((reply, ), DELETE_DELAY)
 
 
-@Client.on_message(main_filter
-                   & current_vc
-                   & filters.regex("^!clean$"))
+@commands.on("!clean", check=in_current_vc)
 async def clean_raw_pcm(client, m: Message):
     download_dir = os.path.join(client.workdir, DEFAULT_DOWNLOAD_DIR)
     all_fn = os.listdir(download_dir)
-    for track in mp.playlist[:2]:
-        track_fn = f"{track.audio.file_unique_id}.raw"
+    for track in mp.playlist[:PREFETCH_WINDOW]:
+        track_fn = f"{_pcm_id(client, track.audio)}.raw"
         if track_fn in all_fn:
             all_fn.remove(track_fn)
-    count = 0
-    if all_fn:
-        for fn in all_fn:
-            if fn.endswith(".raw"):
-                count += 1
-                os.remove(os.path.join(download_dir, fn))
+    # files other accounts are about to play are pinned
+    removed = [
+        fn for fn in all_fn if fn.endswith(".raw")
+        and cache.remove_if_unpinned(os.path.join(download_dir, fn))
+    ]
+    count = len(removed)
+    if removed:
+        get_library(client).set_cached([fn[:-4] for fn in removed], False)
     reply = await m.reply_text(f"{emoji.WASTEBASKET} cleaned {count} files")
     await _delay_delete_messages((reply, m), DELETE_DELAY)
 
 
-@Client.on_message(main_filter
-                   & current_vc
-                   & filters.regex("^!mute$"))
+@commands.on("!trace", args=True, check=in_current_vc)
+async def show_slowest_tracks(_, m: Message):
+    n = TRACE_SHOW_DEFAULT
+    if len(m.command) > 1 and m.command[1].isdigit():
+        n = min(max(1, int(m.command[1])), TRACE_SHOW_MAX)
+    traces = tracer.slowest(n)
+    if not traces:
+        text = f"{emoji.NO_ENTRY} no track played yet"
+    else:
+        text = f"{emoji.STOPWATCH} **slowest to start**:\n" + "\n".join(
+            f"**{i}**. {x.title}: `{_trace_summary(x)}`"
+            for i, x in enumerate(traces, 1)
+        )
+    if mp.msg.get('trace') is not None:
+        await mp.msg['trace'].delete()
+    mp.msg['trace'] = await m.reply_text(text, quote=False)
+    await m.delete()
+
+
+@commands.on("!mute", check=in_current_vc)
 async def mute(_, m: Message):
     group_call = mp.group_call
     group_call.set_is_mute(True)
@@ -396,9 +652,7 @@ async def mute(_, m: Message):
     await _delay_delete_messages((reply, m), DELETE_DELAY)
 
 
-@Client.on_message(main_filter
-                   & current_vc
-                   & filters.regex("^!unmute$"))
+@commands.on("!unmute", check=in_current_vc)
 async def unmute(_, m: Message):
     group_call = mp.group_call
     group_call.set_is_mute(False)
@@ -406,9 +660,7 @@ async def unmute(_, m: Message):
     await _delay_delete_messages((reply, m), DELETE_DELAY)
 
 
-@Client.on_message(main_filter
-                   & current_vc
-                   & filters.regex("^(\\/|!)repo$"))
+@commands.on("/repo", "!repo", check=in_current_vc)
 async def show_repository(_, m: Message):
     if mp.msg.get('repo') is not None:
         await mp.msg['repo'].delete()
@@ -423,6 +675,56 @@ async def show_repository(_, m: Message):
 # - Other functions
 
 
+def _requester(m: Message):
+    if m.from_user:
+        return m.from_user.id
+    if m.sender_chat:
+        return m.sender_chat.id
+    return m.chat.id
+
+
+async def _admit(m: Message, seconds=0):
+    """admission control for requests of group members, reply only to
+    the first rejection of a member in a while
+    """
+    if m.outgoing:
+        return True
+    decision = admission.admit(_requester(m), m.chat.id, seconds,
+                               len(mp.playlist))
+    if decision:
+        return True
+    if decision.notify:
+        if decision.retry_after:
+            text = (f"{emoji.HOURGLASS_NOT_DONE} too many requests, try "
+                    f"again in {int(decision.retry_after) + 1}s")
+        else:
+            text = f"{emoji.NO_ENTRY} {decision.reason}, try again later"
+        reply = await m.reply_text(text)
+        await _delay_delete_messages((reply, ), DELETE_DELAY)
+    return False
+
+
+def _begin_trace(track):
+    """trace track from now on, links are traced from the message"""
+    trace = tracer.get(track) or tracer.begin(track, None, None)
+    trace.track_id = track.audio.file_unique_id
+    trace.title = track.audio.title or track.audio.file_unique_id
+    return trace
+
+
+def _trace_summary(trace):
+    spans = trace.durations()
+    return " ".join(
+        f"{k[:-2]} {v:.2f}s" for k, v in spans.items() if v is not None
+    )
+
+
+def _clear_playlist(name='stopped'):
+    for track in mp.playlist:
+        tracer.finish(track, name)
+    mp.playlist.clear()
+
+
 async def send_text(text):
     group_call = mp.group_call
     client = group_call.client
@@ -441,45 +743,388 @@ async def skip_current_playing():
     playlist = mp.playlist
     if not playlist:
         return
-    if len(playlist) == 1:
+    ended = time.monotonic()
+    if not await _next_track_ready():
         await mp.update_start_time()
+        if playlist:
+            tracer.mark(playlist[0], 'loop')
         return
     client = group_call.client
-    download_dir = os.path.join(client.workdir, DEFAULT_DOWNLOAD_DIR)
-    group_call.input_filename = os.path.join(
-        download_dir,
-        f"{playlist[1].audio.file_unique_id}.raw"
-    )
+    group_call.input_filename = _raw_file(client, playlist[1].audio)
+    tracer.mark(playlist[1], 'play', gap=time.monotonic() - ended)
     await mp.update_start_time()
     # remove old track from playlist
     old_track = playlist.pop(0)
+    tracer.finish(old_track)
     print(f"- START PLAYING: {playlist[0].audio.title}")
     await mp.send_playlist()
-    os.remove(os.path.join(
-        download_dir,
-        f"{old_track.audio.file_unique_id}.raw")
+    old_pcm_id = _pcm_id(client, old_track.audio)
+    library = get_library(client)
+    old_file = _raw_file(client, old_track.audio)
+    _pin_playlist()
+    if all(_pcm_id(client, x.audio) != old_pcm_id for x in playlist) \
+            and cache.remove_if_unpinned(old_file):
+        library.set_cached([old_pcm_id], False)
+    _record_played(library, playlist[0])
+    await prefetch()
+
+
+async def _play_first_track(client):
+    mp.group_call.input_filename = _raw_file(client, mp.playlist[0].audio)
+    tracer.mark(mp.playlist[0], 'play')
+    await mp.update_start_time()
+    print(f"- START PLAYING: {mp.playlist[0].audio.title}")
+    _record_played(get_library(client), mp.playlist[0])
+
+
+def get_library(client):
+    if _caches.library is None:
+        _caches.library = TrackLibrary(
+            os.path.join(client.workdir, LIBRARY_FILE)
+        )
+        _pcm_ids.clear()
+        _load_aliases(client)
+    return _caches.library
+
+
+def get_fingerprint_index(client):
+    if _caches.fingerprint_index is None:
+        _caches.fingerprint_index = FingerprintIndex()
+        _caches.fingerprints_rowid = 0
+        _load_fingerprints(client)
+    return _caches.fingerprint_index
+
+
+def _load_fingerprints(client):
+    """add the fingerprints which are new in the library to the index,
+    other accounts (tgvc/shard.py) add theirs to the same library
+    """
+    index = _caches.fingerprint_index
+    rows = get_library(client).fingerprints(_caches.fingerprints_rowid)
+    for rowid, file_unique_id, data in rows:
+        if file_unique_id not in index:
+            index.add(file_unique_id, loads(data))
+        _caches.fingerprints_rowid = rowid
+
+
+def _load_aliases(client):
+    _pcm_ids.update(get_library(client).aliases())
+
+
+def _pcm_id(client, audio):
+    get_library(client)
+    return _pcm_ids.get(audio.file_unique_id, audio.file_unique_id)
+
+
+def _raw_file(client, audio):
+    return os.path.join(client.workdir, DEFAULT_DOWNLOAD_DIR,
+                        f"{_pcm_id(client, audio)}.raw")
+
+
+def _analyze_pcm(raw_file, with_fingerprint):
+    """find the silence and the fingerprint of the rest in one mapping
+    of raw_file, then cut the silence, return (head, tail, fingerprint)
+    """
+    fp = None
+    with open_source(raw_file) as source:
+        head, tail = find_silence(source)
+        if with_fingerprint:
+            fp = fingerprint(source.array(
+                head // FRAME_BYTES,
+                source.frames - (head + tail) // FRAME_BYTES
+            ))
+    cut(raw_file, head, tail)
+    return head, tail, fp
+
+
+async def _trim_pcm(client, audio):
+    """cut leading and trailing silence of newly transcoded PCM, return
+    its fingerprint, None if the recording is known already
+    """
+    known = audio.file_unique_id in _pcm_ids \
+        or audio.file_unique_id in get_fingerprint_index(client)
+    loop = asyncio.get_event_loop()
+    head, tail, fp = await loop.run_in_executor(
+        None, _analyze_pcm, _raw_file(client, audio), not known
     )
-    if len(playlist) == 1:
+    get_library(client).set_trim(_pcm_id(client, audio), head, tail)
+    if head or tail:
+        print(f"- TRIMMED: {audio.title} {seconds(head):.1f}s "
+              f"+ {seconds(tail):.1f}s of silence")
+    return fp
+
+
+async def _dedupe_pcm(client, audio, fp):
+    """if newly transcoded PCM with fingerprint fp is a recording seen
+    before, share the PCM of the first one and return True
+    """
+    if fp is None:
+        return False
+    index = get_fingerprint_index(client)
+    library = get_library(client)
+    raw_file = _raw_file(client, audio)
+    if _caches.dedupe_lock is None:
+        _caches.dedupe_lock = asyncio.Lock()
+    # between accounts too, they share library.sqlite
+    async with _caches.dedupe_lock, cache.locked(library.path):
+        _load_aliases(client)
+        _load_fingerprints(client)
+        if audio.file_unique_id in _pcm_ids \
+                or audio.file_unique_id in index:
+            return False
+        loop = asyncio.get_event_loop()
+        found = await loop.run_in_executor(None, index.match, fp)
+        if found is None:
+            index.add(audio.file_unique_id, fp)
+            library.add_fingerprint(audio.file_unique_id, fp.tobytes())
+            return False
+        pcm_id = found[0]
+        _pcm_ids[audio.file_unique_id] = pcm_id
+        library.add_alias(audio.file_unique_id, pcm_id)
+    # not while holding the library, the account which transcodes
+    # pcm_file may wait for it
+    pcm_file = os.path.join(os.path.dirname(raw_file), f"{pcm_id}.raw")
+    async with cache.locked(pcm_file):
+        if os.path.isfile(pcm_file):
+            os.remove(raw_file)
+        else:
+            os.replace(raw_file, pcm_file)
+            library.set_trim(pcm_id, *library.trim(audio.file_unique_id))
+        _pins.add(pcm_file)
+    print(f"- DUPLICATE: {audio.title} shares PCM of {pcm_id}")
+    return True
+
+
+async def _drop_queued_duplicate(client, track):
+    """remove track if the same recording is queued before it"""
+    playlist = mp.playlist
+    pcm_id = _pcm_id(client, track.audio)
+    for x in playlist:
+        if x is track:
+            return
+        if _pcm_id(client, x.audio) == pcm_id:
+            break
+    else:
         return
-    await download_audio(playlist[1])
+    playlist[:] = [x for x in playlist if x is not track]
+    tracer.finish(track, 'duplicate')
+    await send_text(f"{emoji.ROBOT} **[{track.audio.title}]({track.link})** "
+                    "is already in the playlist")
+
+
+def _record_played(library, track):
+    """add the track which started playing (its PCM is cached)"""
+    audio = track.audio
+    track_info = {
+        'file_unique_id': audio.file_unique_id,
+        'title': audio.title or audio.file_unique_id,
+        'performer': audio.performer,
+        'duration': audio.duration,
+        'link': track.link,
+        'cached': 1
+    }
+    if isinstance(track, PlaylistEntry):
+        track_info.update(url=track.url, ie_key=track.ie_key)
+    elif isinstance(track, LibraryTrack):
+        track_info.update(file_id=audio.file_id,
+                          chat_id=track.chat_id,
+                          message_id=track.message_id)
+    else:
+        track_info.update(file_id=audio.file_id,
+                          file_size=audio.file_size,
+                          mime_type=audio.mime_type,
+                          chat_id=track.chat.id,
+                          message_id=track.message_id)
+    library.record(**track_info)
+
+
+def _find_in_library(client, m: Message, query):
+    """playlist item for the best match of query, None if not found"""
+    for track in get_library(client).search(query):
+        if track.file_id:
+            return LibraryTrack(client, m, track)
+        if track.url:
+            entry = PlaylistEntry(m, {
+                'url': track.url,
+                'ie_key': track.ie_key,
+                'id': track.file_unique_id.partition("-")[2],
+                'title': track.title,
+                'duration': track.duration
+            })
+            entry.link = track.link
+            return entry
+    return None
+
+
+async def _next_track_ready():
+    """wait for playlist[1], imported entries and library tracks which
+    fail and duplicates of queued tracks are dropped
+    """
+    playlist = mp.playlist
+    while len(playlist) > 1:
+        track = playlist[1]
+        await _prefetch_track(track)
+        if len(playlist) > 1 and playlist[1] is track:
+            return True
+    return False
+
+
+async def prefetch():
+    """download and transcode tracks in the prefetch window"""
+    await asyncio.gather(*[
+        _prefetch_track(track) for track in mp.playlist[:PREFETCH_WINDOW]
+    ])
+    _pin_playlist()
+
+
+def _pin_playlist():
+    """keep other processes from removing the PCM of the next tracks"""
+    client = mp.group_call.client
+    _pins.update(_raw_file(client, x.audio)
+                 for x in mp.playlist[:PREFETCH_WINDOW])
+
+
+async def _prefetch_track(track):
+    """return True if track is ready, imported entries and library
+    tracks which fail are dropped from the playlist
+    """
+    if isinstance(track, (PlaylistEntry, LibraryTrack)):
+        return await _prefetch_entry(track)
+    await download_audio(track)
+    return True
+
+
+async def _prefetch_entry(entry):
+    """return True if entry is ready, drop it from the playlist if not,
+    e.g. the message of a LibraryTrack was deleted
+    """
+    if isinstance(entry, LibraryTrack):
+        ready = download_audio(entry)
+    else:
+        if entry.task is None:
+            entry.task = asyncio.ensure_future(_resolve_entry(entry))
+        ready = asyncio.shield(entry.task)
+    try:
+        await ready
+        return True
+    except Exception as e:
+        if any(x is entry for x in mp.playlist):
+            mp.playlist[:] = [x for x in mp.playlist if x is not entry]
+            tracer.finish(entry, 'failed', error=repr(e))
+            await send_text(f"{emoji.CROSS_MARK} skipped "
+                            f"**[{entry.audio.title}]({entry.link})**: "
+                            f"`{e!r}`")
+        return False
+
+
+async def _resolve_entry(entry: PlaylistEntry):
+    client = mp.group_call.client
+    _load_aliases(client)
+    raw_file = _raw_file(client, entry.audio)
+    # another task or account may be transcoding the same file
+    async with cache.locked(raw_file):
+        # pinned before another account can remove it
+        if _pins.add(raw_file):
+            tracer.mark(entry, 'ready', cached=True)
+            return
+        await _fetch_entry(client, entry, raw_file)
+    tracer.mark(entry, 'ready')
+
+
+async def _fetch_entry(client, entry: PlaylistEntry, raw_file):
+    download_dir = os.path.join(client.workdir, DEFAULT_DOWNLOAD_DIR)
+    if _caches.playlist_semaphore is None:
+        _caches.playlist_semaphore = asyncio.Semaphore(PLAYLIST_CONCURRENCY)
+    async with _caches.playlist_semaphore, \
+            admission.job(entry.audio.duration):
+        loop = asyncio.get_event_loop()
+        tracer.mark(entry, 'download_start')
+        original_file, title, duration = await loop.run_in_executor(
+            None, _download_entry_file, entry, download_dir
+        )
+        tracer.mark(entry, 'download_end',
+                    bytes=os.path.getsize(original_file))
+        entry.audio.title, entry.audio.duration = title, duration
+        trace = tracer.get(entry)
+        if trace is not None:
+            trace.title = title or trace.title
+        tracer.mark(entry, 'transcode_start')
+        await transcode(original_file, raw_file, TRANSCODE_PROFILE)
+        tracer.mark(entry, 'transcode_end')
+        os.remove(original_file)
+        fp = await _trim_pcm(client, entry.audio)
+        if await _dedupe_pcm(client, entry.audio, fp):
+            await _drop_queued_duplicate(client, entry)
+        else:
+            _pins.add(raw_file)
+
+
+def _extract_playlist(url):
+    """titles and urls of the playlist entries, without resolving them"""
+    from youtube_dl import YoutubeDL
+    ydl = YoutubeDL({'extract_flat': 'in_playlist', 'quiet': True})
+    return ydl.extract_info(url, download=False)
+
+
+def _download_entry_file(entry: PlaylistEntry, download_dir):
+    from youtube_dl import YoutubeDL
+    ydl = YoutubeDL({
+        'format': 'bestaudio',
+        'quiet': True,
+        'outtmpl': os.path.join(download_dir,
+                                f"{entry.audio.file_unique_id}.%(ext)s")
+    })
+    info = ydl.extract_info(entry.url, download=False, ie_key=entry.ie_key)
+    duration = int(info.get('duration') or 0)
+    if duration > MUSIC_MAX_LENGTH:
+        raise ValueError(f"longer than {timedelta(seconds=MUSIC_MAX_LENGTH)}")
+    ydl.process_info(info)
+    return ydl.prepare_filename(info), info.get('title'), duration
 
 
 async def download_audio(m: Message):
-    group_call = mp.group_call
-    client = group_call.client
-    raw_file = os.path.join(client.workdir, DEFAULT_DOWNLOAD_DIR,
-                            f"{m.audio.file_unique_id}.raw")
-    if not os.path.isfile(raw_file):
-        original_file = await m.download()
-        ffmpeg.input(original_file).output(
-            raw_file,
-            format='s16le',
-            acodec='pcm_s16le',
-            ac=2,
-            ar='48k',
-            loglevel='error'
-        ).overwrite_output().run()
+    """download and transcode once, concurrent handlers share the task"""
+    file_unique_id = m.audio.file_unique_id
+    task = _downloads.get(file_unique_id)
+    if task is None:
+        task = asyncio.ensure_future(_download_audio(m))
+        _downloads[file_unique_id] = task
+        task.add_done_callback(lambda _: _downloads.pop(file_unique_id))
+    await asyncio.shield(task)
+
+
+async def _download_audio(m: Message):
+    client = mp.group_call.client
+    # another account may have found it to be a duplicate
+    _load_aliases(client)
+    raw_file = _raw_file(client, m.audio)
+    # another task or account may be transcoding the same file
+    async with cache.locked(raw_file):
+        # pinned before another account can remove it
+        if _pins.add(raw_file):
+            tracer.mark_once(m, 'ready', cached=True)
+            return
+        await _fetch_audio(client, m, raw_file)
+    tracer.mark(m, 'ready')
+
+
+async def _fetch_audio(client, m: Message, raw_file):
+    download_dir = os.path.join(client.workdir, DEFAULT_DOWNLOAD_DIR)
+    async with admission.job(m.audio.duration):
+        tracer.mark(m, 'download_start')
+        if isinstance(m, LibraryTrack):
+            await m.refresh()
+        original_file = await download_audio_file(client, m, download_dir)
+        tracer.mark(m, 'download_end', bytes=os.path.getsize(original_file))
+        tracer.mark(m, 'transcode_start')
+        await transcode(original_file, raw_file, TRANSCODE_PROFILE)
+        tracer.mark(m, 'transcode_end')
         os.remove(original_file)
+    fp = await _trim_pcm(client, m.audio)
+    if await _dedupe_pcm(client, m.audio, fp):
+        await _drop_queued_duplicate(client, m)
+    else:
+        _pins.add(raw_file)
 
 
 async def _delay_delete_messages(messages: tuple, delay: int):
@@ -488,15 +1133,79 @@ async def _delay_delete_messages(messages: tuple, delay: int):
         await m.delete()
 
 
-@Client.on_message(main_filter
+@Client.on_message(site_link
+                   & main_filter
+                   & owned_chat
                    & filters.regex(REGEX_SITES)
                    & ~filters.regex(REGEX_EXCLUDE_URL))
 async def music_downloader(client: Client, message: Message):
-    await _fetch_and_send_music(client, message)
+    tracer.begin(message, None, message.text)
+    if await _admit(message):
+        tracer.mark(message, 'admitted')
+        await _fetch_and_send_music(client, message)
+    if not any(x is message for x in mp.playlist):
+        tracer.finish(message, 'not queued')
+
+
+@Client.on_message(site_link
+                   & main_filter
+                   & current_vc
+                   & owned_chat
+                   & filters.regex(REGEX_SITES)
+                   & filters.regex(REGEX_PLAYLIST_URL)
+                   & ~filters.regex(r"\/channel\/"))
+async def import_playlist(client: Client, m: Message):
+    """queue up to PLAYLIST_MAX_ENTRIES tracks of a playlist/set link"""
+    received = time.monotonic()
+    if not await _admit(m):
+        return
+    status = await m.reply_text(f"{emoji.INBOX_TRAY} importing playlist...")
+    loop = asyncio.get_event_loop()
+    try:
+        info = await loop.run_in_executor(None, _extract_playlist, m.text)
+    except Exception as e:
+        await status.edit_text(f"{emoji.CROSS_MARK} `{e!r}`")
+        return
+    max_entries = PLAYLIST_MAX_ENTRIES if m.outgoing else min(
+        PLAYLIST_MAX_ENTRIES, max(0, admission.max_queue - len(mp.playlist))
+    )
+    entries = [
+        PlaylistEntry(m, x) for x in info.get('entries') or [] if x
+    ][:max_entries]
+    for entry in entries:
+        tracer.begin(entry, entry.audio.file_unique_id, entry.audio.title,
+                     started=received)
+        tracer.mark(entry, 'admitted')
+    was_empty = not mp.playlist
+    mp.playlist.extend(entries)
+    await status.edit_text(
+        f"{emoji.INBOX_TRAY} added {len(entries)} tracks from "
+        f"**{info.get('title')}**"
+    )
+    if was_empty and mp.playlist:
+        await _start_playlist(client)
+    await mp.send_playlist()
+    await prefetch()
+    await _delay_delete_messages((status, ), DELETE_DELAY)
+
+
+async def _start_playlist(client):
+    """play the first track which gets ready, imported entries and
+    library tracks which fail are dropped, the tracks queued meanwhile
+    move up
+    """
+    playlist = mp.playlist
+    while playlist:
+        track = playlist[0]
+        await _prefetch_track(track)
+        if playlist and playlist[0] is track:
+            await _play_first_track(client)
+            return
 
 
 async def _fetch_and_send_music(client: Client, message: Message):
     # await message.reply_chat_action("typing")
+    from youtube_dl import YoutubeDL
     processing = await message.reply_text("Processing Youtube video...")
     try:
         ydl_opts = {
@@ -515,23 +1224,36 @@ async def _fetch_and_send_music(client: Client, message: Message):
             await _reply_and_delete_later(message, inform,
                                           DELAY_DELETE_INFORM)
             return
+        if not message.outgoing and admission.overloaded(
+                info_dict['duration']):
+            await processing.edit_text(f"{emoji.NO_ENTRY} busy, try again "
+                                       "later")
+            await _delay_delete_messages((processing, ), DELETE_DELAY)
+            return
         # d_status = await message.reply_text("Downloading...", quote=True,
         #                                     disable_notification=True)
-        ydl.process_info(info_dict)
-        audio_file = ydl.prepare_filename(info_dict)
-        task = asyncio.create_task(_upload_audio(client, message, info_dict,
-                                                 audio_file))
-        # await message.reply_chat_action("upload_document")
-        # await d_status.delete()
-        while not task.done():
-            await asyncio.sleep(4)
+        async with admission.job(info_dict['duration']):
+            tracer.mark(message, 'download_start')
+            ydl.process_info(info_dict)
+            audio_file = ydl.prepare_filename(info_dict)
+            tracer.mark(message, 'download_end',
+                        bytes=os.path.getsize(audio_file))
+            task = asyncio.create_task(_upload_audio(client, message,
+                                                     info_dict, audio_file))
             # await message.reply_chat_action("upload_document")
-        # await message.reply_chat_action("cancel")
+            # await d_status.delete()
+            while not task.done():
+                await asyncio.sleep(4)
+                # await message.reply_chat_action("upload_document")
+            # await message.reply_chat_action("cancel")
         audio = task.result()
+        tracer.mark(message, 'uploaded')
         message.audio = audio
         await processing.delete()
 
-        await play_track(client, message)
+        # only uploaded in chats without the voice chat of this account
+        if in_current_vc(message):
+            await play_track(client, message, admitted=True)
 
         if message.chat.type == "private":
             await message.delete()
@@ -553,6 +1275,7 @@ async def _reply_and_delete_later(message: Message, text: str, delay: int):
 
 
 async def _upload_audio(client: Client, message: Message, info_dict, audio_file):
+    import ffmpeg
     basename = audio_file.rsplit(".", 1)[-2]
     if info_dict['ext'] == 'webm':
         audio_file_opus = basename + ".opus"
@@ -594,6 +1317,7 @@ def _get_file_extension_from_url(url):
 def make_squarethumb(thumbnail, output):
     """Convert thumbnail to square thumbnail"""
     # https://stackoverflow.com/a/52177551
+    from PIL import Image
     original_thumb = Image.open(thumbnail)
     squarethumb = _crop_to_square(original_thumb)
     squarethumb.thumbnail((TG_THUMB_MAX_LENGTH, TG_THUMB_MAX_LENGTH),
@@ -1,14 +1,19 @@
 """
 https://github.com/MarshalX/tgcalls/blob/main/examples/radio_as_smart_plugin.py
 154ef295a3fe3a2383bbd0275a1195c6fafd307d
+
+Set TRANSCODE_PROFILE to use one of the ffmpeg profiles of tgvc/transcode.py
 """
+import os
 import signal
 
-import ffmpeg  # pip install ffmpeg-python
 from pyrogram import Client, filters
 from pyrogram.types import Message
 
-from pytgcalls import GroupCall  # pip install pytgcalls
+from tgvc.core import register_group_call, state
+from tgvc import transcode
+
+TRANSCODE_PROFILE = transcode.profile_from_environ(os.environ)
 
 # Example of pinned message in a chat:
 '''
@@ -27,8 +32,9 @@ async def anon_filter(_, __, m: Message):
 
 anonymous = filters.create(anon_filter)
 
-GROUP_CALLS = {}
-FFMPEG_PROCESSES = {}
+# kept across !reload
+GROUP_CALLS = state("radio group calls", dict)
+FFMPEG_PROCESSES = state("radio ffmpeg processes", dict)
 
 
 @Client.on_message(anonymous & filters.command('start', prefixes='!'))
@@ -37,8 +43,10 @@ async def start(client, message: Message):
 
     group_call = GROUP_CALLS.get(message.chat.id)
     if group_call is None:
+        from pytgcalls import GroupCall  # pip install pytgcalls
         group_call = GroupCall(client, input_filename, path_to_log_file='')
         GROUP_CALLS[message.chat.id] = group_call
+        register_group_call(f"radio {message.chat.id}", group_call)
 
     if not message.reply_to_message or len(message.command) < 2:
         await message.reply_text(
@@ -67,13 +75,12 @@ async def start(client, message: Message):
 
     await group_call.start(message.chat.id)
 
-    process = ffmpeg.input(station_stream_url).output(
+    process = transcode.build(
+        station_stream_url,
         input_filename,
-        format='s16le',
-        acodec='pcm_s16le',
-        ac=2,
-        ar='48k'
-    ).overwrite_output().run_async()
+        TRANSCODE_PROFILE,
+        pipe=False
+    ).run_async()
     FFMPEG_PROCESSES[message.chat.id] = process
 
     await message.reply_text(f'Radio #{station_id} is playing...')
@@ -17,10 +17,19 @@ import subprocess
 from datetime import datetime
 from pyrogram import Client, filters
 from pyrogram.types import Message
-from pytgcalls import GroupCall, GroupCallAction
-import ffmpeg
+from tgvc.core import GROUP_CALLS, register_group_call
 
-group_call = GroupCall(None, path_to_log_file='')
+
+def get_group_call():
+    """built on first !record, kept across !reload"""
+    group_call = GROUP_CALLS.get("recorder")
+    if group_call is None:
+        from pytgcalls import GroupCall
+        group_call = register_group_call(
+            "recorder",
+            GroupCall(None, path_to_log_file='')
+        )
+    return group_call
 
 
 @Client.on_message(filters.group
@@ -29,6 +38,8 @@ group_call = GroupCall(None, path_to_log_file='')
                    & ~filters.edited
                    & filters.regex("^!record$"))
 async def record_from_voice_chat(client, m: Message):
+    from pytgcalls import GroupCallAction
+    group_call = get_group_call()
     group_call.client = client
     await group_call.start(m.chat.id)
     group_call.add_handler(
@@ -38,7 +49,7 @@ async def record_from_voice_chat(client, m: Message):
     await m.delete()
 
 
-async def network_status_changed_handler(gc: GroupCall, is_connected: bool):
+async def network_status_changed_handler(gc, is_connected: bool):
     if is_connected:
         print("- JOINED VC")
         await record_and_send_opus()
@@ -48,6 +59,8 @@ async def network_status_changed_handler(gc: GroupCall, is_connected: bool):
 
 
 async def record_and_send_opus():
+    import ffmpeg
+    group_call = get_group_call()
     client = group_call.client
     chat_id = int("-100" + str(group_call.full_chat.id))
     chat = await client.get_chat(chat_id)
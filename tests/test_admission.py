@@ -0,0 +1,94 @@
+import asyncio
+import pytest
+from tgvc import admission
+from tgvc.admission import AdmissionControl, limits_from_environ
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """admission.time.monotonic() returns clock[0]"""
+    clock = [1000.0]
+    monkeypatch.setattr(admission.time, 'monotonic', lambda: clock[0])
+    return clock
+
+
+def test_user_bucket(clock):
+    control = AdmissionControl(user_rate=1 / 10, user_burst=2,
+                               chat_burst=100)
+    assert control.admit(1, 1)
+    assert control.admit(1, 1)
+    decision = control.admit(1, 1)
+    assert not decision
+    assert decision.reason == 'user rate'
+    assert decision.retry_after == pytest.approx(10)
+    # another member is not limited by it
+    assert control.admit(2, 1)
+    clock[0] += 10
+    assert control.admit(1, 1)
+    assert not control.admit(1, 1)
+
+
+def test_chat_bucket(clock):
+    control = AdmissionControl(chat_rate=1, chat_burst=3)
+    assert all(control.admit(user, 1) for user in range(3))
+    assert control.admit(3, 1).reason == 'chat rate'
+    assert control.admit(3, 2)
+    clock[0] += 1
+    assert control.admit(3, 1)
+
+
+def test_notify_once_per_rejection(clock):
+    control = AdmissionControl(user_rate=1 / 10, user_burst=1)
+    assert control.admit(1, 1)
+    assert control.admit(1, 1).notify
+    assert not control.admit(1, 1).notify
+    clock[0] += 5
+    assert not control.admit(1, 1).notify
+    clock[0] += 5
+    assert control.admit(1, 1)
+    assert control.admit(1, 1).notify
+
+
+def test_queue_and_backlog(clock):
+    control = AdmissionControl(max_queue=5, max_backlog=600)
+    assert control.admit(1, 1, 0, queue_length=5).reason == 'queue full'
+
+    async def with_job():
+        async with control.job(500):
+            assert control.backlog == 500
+            assert control.admit(2, 1, 200).reason == 'busy'
+            assert control.admit(2, 1, 100)
+        assert control.backlog == 0
+
+    asyncio.run(with_job())
+    assert control.stats['busy'] == 1
+    assert control.stats['queue full'] == 1
+
+
+def test_configure_existing_buckets(clock):
+    control = AdmissionControl(user_rate=1, user_burst=5)
+    assert control.admit(1, 1)
+    control.configure(**dict(limits_from_environ({}), user_rate=1 / 60,
+                             user_burst=1))
+    assert control.max_queue == admission.MAX_QUEUE
+    assert control.users[1].burst == 1
+    assert control.users[1].tokens == 1
+    assert control.admit(1, 1)
+    decision = control.admit(1, 1)
+    assert decision.reason == 'user rate'
+    assert decision.retry_after == pytest.approx(60)
+
+
+def test_limits_from_environ():
+    defaults = limits_from_environ({})
+    assert defaults['user_rate'] == admission.USER_RATE
+    assert defaults['max_backlog'] == admission.MAX_BACKLOG
+    limits = limits_from_environ({'ADMISSION_MAX_QUEUE': "100",
+                                  'ADMISSION_CHAT_RATE': "0.5",
+                                  'ADMISSION_USER_BURST': ""})
+    assert limits['max_queue'] == 100
+    assert isinstance(limits['max_queue'], int)
+    assert limits['chat_rate'] == 0.5
+    assert limits['user_burst'] == admission.USER_BURST
+    with pytest.raises(ValueError):
+        limits_from_environ({'ADMISSION_MAX_QUEUE': "many"})
@@ -0,0 +1,63 @@
+import os
+import asyncio
+from tgvc import cache
+
+
+def make_file(tmp_path, name="a.raw", data=b"pcm"):
+    path = str(tmp_path / name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_remove_if_unpinned(tmp_path):
+    path = make_file(tmp_path)
+    pins = cache.Pins()
+    assert pins.add(path)
+    assert not cache.remove_if_unpinned(path)
+    pins.update([])
+    assert cache.remove_if_unpinned(path)
+    assert not os.path.exists(path)
+    assert not cache.remove_if_unpinned(path)
+
+
+def test_no_removal_while_locked(tmp_path):
+    path = make_file(tmp_path)
+
+    async def remove_while_locked():
+        async with cache.locked(path):
+            return cache.remove_if_unpinned(path)
+
+    assert not asyncio.run(remove_while_locked())
+    assert os.path.exists(path)
+
+
+def test_locked_excludes_tasks(tmp_path):
+    path = str(tmp_path / "a.raw")
+    events = []
+
+    async def task(name):
+        async with cache.locked(path):
+            events.append(f"{name} in")
+            await asyncio.sleep(0.01)
+            events.append(f"{name} out")
+
+    async def main():
+        await asyncio.gather(task(1), task(2))
+
+    asyncio.run(main())
+    assert events in (["1 in", "1 out", "2 in", "2 out"],
+                      ["2 in", "2 out", "1 in", "1 out"])
+
+
+def test_pins_follow_the_path(tmp_path):
+    path = make_file(tmp_path)
+    pins = cache.Pins()
+    assert not pins.add(str(tmp_path / "missing.raw"))
+    assert pins.add(path)
+    # replaced, e.g. by os.replace() of a duplicate's PCM
+    os.replace(make_file(tmp_path, "b.raw", b"new"), path)
+    assert pins.add(path)
+    assert not cache.remove_if_unpinned(path)
+    pins.update([path, str(tmp_path / "missing.raw")])
+    assert list(pins.fds) == [path]
@@ -0,0 +1,64 @@
+import asyncio
+from benchmarks.fakes import FakeClient
+from tgvc.dispatcher import CommandDispatcher
+
+CHAT_ID = -1001234567890
+
+
+def make_commands(calls):
+    commands = CommandDispatcher()
+
+    @commands.on("/current", "!current")
+    async def current(client, m):
+        calls.append(("current", m.command))
+
+    @commands.on("!skip", args=True)
+    async def skip(client, m):
+        calls.append(("skip", m.command))
+
+    @commands.on("!vc", check=lambda m: m.chat.id == CHAT_ID)
+    async def vc(client, m):
+        calls.append(("vc", m.command))
+
+    return commands
+
+
+def test_match_full_command_names(tmp_path):
+    client, calls = FakeClient(str(tmp_path)), []
+    commands = make_commands(calls)
+    for text in ("/current", "!current"):
+        m = client.message(CHAT_ID, text)
+        assert commands.match(m) is not None
+        assert m.command == ["current"]
+    for text in (None, "", "hello", "/currently", "!", "current",
+                 "!unknown"):
+        assert commands.match(client.message(CHAT_ID, text)) is None
+
+
+def test_arguments_only_for_args_commands(tmp_path):
+    client, calls = FakeClient(str(tmp_path)), []
+    commands = make_commands(calls)
+    m = client.message(CHAT_ID, "!skip 2 3")
+    assert commands.match(m) is not None
+    assert m.command == ["skip", "2", "3"]
+    assert commands.match(client.message(CHAT_ID, "!current now")) is None
+
+
+def test_check(tmp_path):
+    client, calls = FakeClient(str(tmp_path)), []
+    commands = make_commands(calls)
+    assert commands.match(client.message(CHAT_ID, "!vc")) is not None
+    assert commands.match(client.message(CHAT_ID - 1, "!vc")) is None
+
+
+def test_dispatch(tmp_path):
+    client, calls = FakeClient(str(tmp_path)), []
+    commands = make_commands(calls)
+
+    async def dispatch_all():
+        for text in ("!skip 4", "chatter", "!vc", "/current"):
+            await commands.dispatch(client, client.message(CHAT_ID, text))
+
+    asyncio.run(dispatch_all())
+    assert calls == [("skip", ["skip", "4"]), ("vc", ["vc"]),
+                     ("current", ["current"])]
@@ -0,0 +1,98 @@
+import os
+import asyncio
+import pytest
+from tgvc import download
+from tgvc.download import CdnRedirect, ChunkedDownload
+
+CHUNK = 1024
+DATA = bytes(range(256)) * 41  # 10.25 chunks
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    sleep = asyncio.sleep
+    monkeypatch.setattr(download.asyncio, 'sleep',
+                        lambda seconds: sleep(0))
+
+
+class Source(object):
+    """fetch() of DATA, fails[offset] exceptions are raised first"""
+
+    def __init__(self, fails=None):
+        self.fails = fails or {}
+        self.fetched = []
+
+    async def fetch(self, offset, limit):
+        await asyncio.sleep(0)
+        errors = self.fails.get(offset)
+        if errors:
+            raise errors.pop(0)
+        self.fetched.append(offset)
+        return DATA[offset:offset + limit]
+
+
+def run(source, path, **kwargs):
+    return asyncio.run(ChunkedDownload(source.fetch, len(DATA), path,
+                                       chunk_size=CHUNK, **kwargs).run())
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_download(tmp_path):
+    path = str(tmp_path / "audio.mp3")
+    source = Source()
+    assert run(source, path) == path
+    assert read(path) == DATA
+    assert sorted(source.fetched) == list(range(0, len(DATA), CHUNK))
+    assert not os.path.exists(path + ".part")
+
+
+def test_retry_failed_and_short_chunks(tmp_path):
+    path = str(tmp_path / "audio.mp3")
+    source = Source({CHUNK: [IOError("reset")],
+                     2 * CHUNK: [IOError("reset"), IOError("reset")]})
+    chunked = ChunkedDownload(source.fetch, len(DATA), path,
+                              chunk_size=CHUNK, retries=2)
+    asyncio.run(chunked.run())
+    assert read(path) == DATA
+    assert chunked.retried == 3
+
+
+def test_resume(tmp_path):
+    path = str(tmp_path / "audio.mp3")
+    with pytest.raises(IOError):
+        run(Source({5 * CHUNK: [IOError("gone")]}), path, retries=0,
+            workers=1)
+    assert os.path.exists(path + ".part")
+    source = Source()
+    run(source, path)
+    assert read(path) == DATA
+    # only the chunks which were not finished before
+    assert sorted(source.fetched) == list(range(5 * CHUNK, len(DATA), CHUNK))
+
+
+def test_no_resume_of_another_size(tmp_path):
+    path = str(tmp_path / "audio.mp3")
+    with open(path, 'wb') as f:
+        f.write(b"x" * 10)
+    with open(path + ".part", 'w') as f:
+        f.write("0\n1\n")
+    source = Source()
+    run(source, path)
+    assert read(path) == DATA
+    assert 0 in source.fetched
+
+
+def test_cdn_redirect_is_not_retried(tmp_path):
+    path = str(tmp_path / "audio.mp3")
+    source = Source({0: [CdnRedirect()]})
+    chunked = ChunkedDownload(source.fetch, len(DATA), path,
+                              chunk_size=CHUNK, workers=1)
+    with pytest.raises(CdnRedirect):
+        asyncio.run(chunked.run())
+    assert chunked.retried == 0
+    chunked.discard()
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,52 @@
+import wave
+import numpy as np
+import pytest
+from benchmarks.fakes import make_melody
+from tgvc.fingerprint import (
+    FingerprintIndex, bit_error_rate, fingerprint, loads
+)
+from tgvc.pcm import CHANNELS, SAMPLE_RATE
+
+
+@pytest.fixture(scope="module")
+def melodies(tmp_path_factory):
+    """int16 PCM of 20 s melodies of seeds 0 to 2"""
+    workdir = tmp_path_factory.mktemp("melodies")
+    pcm = {}
+    for seed in range(3):
+        path = make_melody(str(workdir / f"{seed}.wav"), 20, seed=seed)
+        with wave.open(path) as f:
+            pcm[seed] = np.frombuffer(f.readframes(f.getnframes()),
+                                      dtype='<i2')
+    return pcm
+
+
+def test_fingerprint(melodies):
+    fp = fingerprint(melodies[0])
+    assert fp.dtype == np.uint32
+    assert len(fp) > 200
+    assert bit_error_rate(fp, fp) == 0
+    assert np.array_equal(loads(fp.tobytes()), fp)
+    other = fingerprint(melodies[1])
+    assert bit_error_rate(fp, other[:len(fp)]) > 0.35
+
+
+def test_match_cut_and_noisy_copies(melodies):
+    index = FingerprintIndex()
+    for seed in (0, 1):
+        index.add(seed, fingerprint(melodies[seed]))
+    assert 0 in index and len(index) == 2
+    # 3 s later, as if leading silence was cut, with noise
+    pcm = melodies[0][3 * SAMPLE_RATE * CHANNELS:].astype(np.int32)
+    noise = np.random.default_rng(0).integers(-200, 200, len(pcm))
+    copy = np.clip(pcm + noise, -32768, 32767).astype(np.int16)
+    key, ber = index.match(fingerprint(copy))
+    assert key == 0
+    assert ber < 0.2
+    assert index.match(fingerprint(melodies[2])) is None
+
+
+def test_empty():
+    index = FingerprintIndex()
+    assert index.match(np.zeros(0, np.uint32)) is None
+    assert len(fingerprint(np.zeros(100, np.int16))) == 0
@@ -0,0 +1,88 @@
+import sqlite3
+import pytest
+from tgvc.library import TrackLibrary, fts_query
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = TrackLibrary(str(tmp_path / "library.sqlite"))
+    yield library
+    library.close()
+
+
+def test_fts_query():
+    assert fts_query("Daft Pun!") == '"daft"* "pun"*'
+    assert fts_query(" !? ") is None
+
+
+def test_search_prefix_and_cached_first(library):
+    library.record(file_unique_id="a", title="One More Time",
+                   performer="Daft Punk", file_id="fa")
+    library.record(file_unique_id="b", title="One More Time (Live)",
+                   performer="Daft Punk", file_id="fb", cached=1)
+    library.record(file_unique_id="c", title="Other", performer="Someone")
+    found = library.search("daft pun")
+    assert [x.file_unique_id for x in found] == ["b", "a"]
+    assert library.search("nothing") == []
+    assert library.search("!!") == []
+
+
+def test_record_upserts(library):
+    library.record(file_unique_id="a", title="Old", file_id="fa",
+                   chat_id=-100, message_id=7)
+    library.record(file_unique_id="a", title="New", url="https://x")
+    library.record(file_unique_id="a", title="New", played=False)
+    track, = library.search("new")
+    assert len(library) == 1
+    assert track.play_count == 2
+    # coalesced, missing columns keep their values
+    assert (track.file_id, track.url) == ("fa", "https://x")
+    assert (track.chat_id, track.message_id) == (-100, 7)
+    assert library.search("old") == []
+
+
+def test_adds_columns_to_old_libraries(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE tracks (id INTEGER PRIMARY KEY, "
+               "file_unique_id TEXT UNIQUE NOT NULL, title TEXT NOT NULL, "
+               "performer TEXT, duration INTEGER NOT NULL DEFAULT 0, "
+               "file_id TEXT, file_size INTEGER, mime_type TEXT, url TEXT, "
+               "ie_key TEXT, link TEXT, "
+               "cached INTEGER NOT NULL DEFAULT 0, "
+               "play_count INTEGER NOT NULL DEFAULT 0, last_played REAL)")
+    db.commit()
+    db.close()
+    library = TrackLibrary(path)
+    library.record(file_unique_id="a", title="Track", chat_id=1,
+                   message_id=2)
+    assert library.search("track")[0].message_id == 2
+    library.close()
+    # opened again, nothing to add
+    TrackLibrary(path).close()
+
+
+def test_set_cached_with_aliases(library):
+    for x in "abc":
+        library.record(file_unique_id=x, title=f"track {x}", cached=1)
+    library.add_alias("b", "a")
+    library.set_cached(["a"], False)
+    cached = {x.file_unique_id: x.cached for x in library.search("track")}
+    assert cached == {"a": 0, "b": 0, "c": 1}
+
+
+def test_fingerprints_after(library):
+    library.add_fingerprint("a", b"1234")
+    library.add_fingerprint("b", b"5678")
+    rows = library.fingerprints()
+    assert [x[1:] for x in rows] == [("a", b"1234"), ("b", b"5678")]
+    library.add_fingerprint("c", b"9abc")
+    assert [x[1] for x in library.fingerprints(rows[-1][0])] == ["c"]
+
+
+def test_aliases_and_trims(library):
+    library.add_alias("b", "a")
+    assert library.aliases() == {"b": "a"}
+    assert library.trim("a") == (0, 0)
+    library.set_trim("a", 4, 8)
+    assert library.trim("a") == (4, 8)
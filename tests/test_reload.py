@@ -0,0 +1,98 @@
+import sys
+import asyncio
+import importlib
+import pytest
+from benchmarks.fakes import FakeClient
+from tgvc import reload
+
+CHAT_ID = -1001234567890
+PLUGIN = """
+from pyrogram import Client, filters
+
+VALUE = {value!r}
+{extra}
+
+@Client.on_message(filters.regex("^!value$"))
+async def value(client, m):
+    client.replies.append(VALUE)
+"""
+
+
+@pytest.fixture
+def plugin(tmp_path, monkeypatch):
+    """write(value, extra) rewrites testplugins/value.py"""
+    package = tmp_path / "testplugins"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(reload, '_installed', {})
+
+    def write(value, extra=""):
+        (package / "value.py").write_text(
+            PLUGIN.format(value=value, extra=extra)
+        )
+
+    write(1)
+    yield write
+    for name in ("testplugins.value", "testplugins"):
+        sys.modules.pop(name, None)
+
+
+def load(tmp_path):
+    client = FakeClient(str(tmp_path),
+                        plugins=dict(root="testplugins", include=["value"]))
+    client.replies = []
+    module = importlib.import_module("testplugins.value")
+    client.load_plugins([module])
+    return client, module
+
+
+def value_after_reload(client, module):
+    async def main():
+        task = await reload.reload_plugins(client, [module])
+        await task
+        await client.dispatcher.dispatch(client.message(CHAT_ID, "!value"))
+
+    try:
+        asyncio.run(main())
+    finally:
+        handlers = [h for g in client.dispatcher.groups.values() for h in g]
+        assert len(handlers) == 1
+    return client.replies[-1]
+
+
+def test_plugin_modules(plugin, tmp_path):
+    client, module = load(tmp_path)
+    assert reload.plugin_modules(client) == [module]
+    assert reload.plugin_modules(client, ["value"]) == [module]
+
+
+def test_new_values_and_handlers(plugin, tmp_path):
+    client, module = load(tmp_path)
+    old = module.value
+    plugin(2)
+    assert value_after_reload(client, module) == 2
+    assert module.VALUE == 2
+    assert module.value is not old
+
+
+def test_raising_module_keeps_its_namespace(plugin, tmp_path):
+    client, module = load(tmp_path)
+    old = module.value
+    plugin(2, extra="raise RuntimeError('broken')")
+    with pytest.raises(RuntimeError):
+        value_after_reload(client, module)
+    assert module.VALUE == 1
+    assert module.value is old
+    client.replies.clear()
+    asyncio.run(client.dispatcher.dispatch(client.message(CHAT_ID, "!value")))
+    assert client.replies == [1]
+
+
+def test_syntax_error_changes_nothing(plugin, tmp_path):
+    client, module = load(tmp_path)
+    plugin(2, extra="def (")
+    with pytest.raises(SyntaxError):
+        asyncio.run(reload.reload_plugins(client, [module]))
+    assert module.VALUE == 1
+    assert reload._installed == {}
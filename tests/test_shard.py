@@ -0,0 +1,124 @@
+import time
+import asyncio
+import multiprocessing
+import pytest
+from tgvc import shard
+from tgvc.shard import Coordinator
+
+CHAT_ID = -1001234567890
+
+
+def received(conn):
+    messages = []
+    while conn.poll():
+        messages.append(conn.recv())
+    return messages
+
+
+@pytest.fixture
+def coordinator():
+    """Coordinator of 3 workers, without processes, which assigns at once;
+    coordinator.workers are the worker ends of the pipes
+    """
+    coordinator = Coordinator(None, [()] * 3, capacity=1, collect=0)
+    coordinator.workers = {}
+    for index in range(3):
+        parent, child = multiprocessing.Pipe()
+        coordinator.conns[index] = parent
+        coordinator.workers[index] = child
+    yield coordinator
+    for conn in list(coordinator.conns.values()):
+        conn.close()
+
+
+def request(coordinator, indexes, chat_id=CHAT_ID, message_id=1):
+    for index in indexes:
+        coordinator.handle(index, ('request', chat_id, message_id))
+    coordinator._assign_due()
+
+
+def test_assign_to_least_loaded(coordinator):
+    request(coordinator, [0, 1, 2], chat_id=1)
+    assert coordinator.owners == {1: 0}
+    assert received(coordinator.workers[0]) == [
+        ('owners', {1: 0}), ('command', 1, 1)
+    ]
+    assert received(coordinator.workers[1]) == [('owners', {1: 0})]
+    request(coordinator, [0, 2, 1], chat_id=2)
+    assert coordinator.owners == {1: 0, 2: 1}
+    assert ('command', 2, 1) in received(coordinator.workers[1])
+
+
+def test_late_and_owned_requests_are_ignored(coordinator):
+    request(coordinator, [0], chat_id=1)
+    # the copy received by another worker after the assignment
+    request(coordinator, [1], chat_id=1)
+    request(coordinator, [1], chat_id=1, message_id=2)
+    assert not coordinator.pending
+    assert coordinator.stats['assigned'] == 1
+    assert all(x[0] == 'owners' for x in received(coordinator.workers[1]))
+
+
+def test_reject_at_capacity(coordinator):
+    for chat_id in range(3):
+        request(coordinator, [0, 1, 2], chat_id=chat_id)
+    for conn in coordinator.workers.values():
+        received(conn)
+    request(coordinator, [2, 0], chat_id=3)
+    assert 3 not in coordinator.owners
+    assert received(coordinator.workers[2]) == [('rejected', 3, 1)]
+    assert received(coordinator.workers[0]) == []
+    assert coordinator.stats['rejected'] == 1
+
+
+def test_release_by_owner_only(coordinator):
+    request(coordinator, [1])
+    coordinator.handle(0, ('release', CHAT_ID))
+    assert coordinator.owners == {CHAT_ID: 1}
+    coordinator.handle(1, ('release', CHAT_ID))
+    assert coordinator.owners == {}
+    assert received(coordinator.workers[0])[-1] == ('owners', {})
+
+
+def test_lost_worker_frees_its_chats(coordinator):
+    request(coordinator, [1], chat_id=1)
+    request(coordinator, [2], chat_id=2)
+    coordinator.workers[1].close()
+    coordinator.poll(0)
+    assert 1 not in coordinator.conns
+    assert coordinator.owners == {2: 2}
+    assert received(coordinator.workers[0])[-1] == ('owners', {2: 2})
+    # a worker that is gone is not assigned a chat
+    request(coordinator, [1, 0], chat_id=3)
+    assert coordinator.owners[3] == 0
+
+
+def run_in_executor():
+    """worker target, reports whether its event loop works"""
+    async def main():
+        for _ in range(200):
+            await loop.run_in_executor(None, time.sleep, 0.001)
+        return loop._selector.fileno()
+
+    loop = asyncio.get_event_loop()
+    fd = loop.run_until_complete(asyncio.wait_for(main(), 10))
+    shard.worker.conn.send(('release', fd))
+
+
+def test_workers_get_their_own_loop():
+    # like the loop pyrogram makes at import
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    epoll = loop._selector.fileno()
+    coordinator = Coordinator(run_in_executor, [()] * 3)
+    try:
+        coordinator.start()
+        results = [conn.recv() for conn in coordinator.conns.values()]
+    finally:
+        coordinator.stop()
+        for process in coordinator.processes.values():
+            process.join()
+        asyncio.set_event_loop(None)
+        loop.close()
+    # not the epoll of the parent, they would take each other's wakeups
+    assert {x[1] for x in results}.isdisjoint({epoll})
@@ -0,0 +1,17 @@
+import pytest
+from tgvc.transcode import PROFILES, profile_from_environ, use_pipe
+
+
+def test_profile_from_environ():
+    assert profile_from_environ({}) == 'default'
+    assert profile_from_environ({'TRANSCODE_PROFILE': ""}) == 'default'
+    assert profile_from_environ({'TRANSCODE_PROFILE': "soxr"}) == 'soxr'
+    with pytest.raises(ValueError) as error:
+        profile_from_environ({'TRANSCODE_PROFILE': "fast"})
+    assert all(x in str(error.value) for x in PROFILES)
+
+
+def test_no_pipe_of_mp4():
+    assert use_pipe("audio.mp3", 'pipe')
+    assert not use_pipe("audio.M4A", 'pipe')
+    assert not use_pipe("audio.mp3")
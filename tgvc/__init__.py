@@ -0,0 +1,5 @@
+"""Shared helpers for the userbot which are not Pyrogram smart plugins
+
+Modules in this package don't register any handlers, they are imported
+by main.py and by the plugins under plugins/
+"""
@@ -0,0 +1,181 @@
+"""Admission control for requests which download and transcode audio
+
+Every accepted /play or link costs a download, a transcode and maybe
+an upload, so requests are admitted in this order, before anything is
+downloaded:
+
+- load shedding: rejected while the audio seconds being downloaded or
+  transcoded (the backlog) plus the request exceed max_backlog
+- max_queue: rejected while the playlist is that long
+- token buckets: one token per request from the bucket of the user and
+  the bucket of the chat, which refill at rate tokens per second up to
+  burst tokens
+
+The limits can be set with the environment variables of ENVIRON, e.g.
+ADMISSION_MAX_QUEUE=100, rates are tokens per second
+
+    admission = AdmissionControl(**limits_from_environ(os.environ))
+    decision = admission.admit(user_id, chat_id, seconds, len(playlist))
+    if decision:
+        async with admission.job(seconds):
+            ...  # download and transcode
+"""
+import time
+import itertools
+from collections import namedtuple
+from contextlib import asynccontextmanager
+
+USER_RATE = 1 / 30
+USER_BURST = 3
+CHAT_RATE = 1 / 5
+CHAT_BURST = 10
+MAX_QUEUE = 50
+MAX_BACKLOG = 2 * 3600
+# buckets kept before full (idle) buckets are dropped
+MAX_BUCKETS = 1024
+# environment variable -> (keyword argument of AdmissionControl, type)
+ENVIRON = {
+    'ADMISSION_USER_RATE': ('user_rate', float),
+    'ADMISSION_USER_BURST': ('user_burst', float),
+    'ADMISSION_CHAT_RATE': ('chat_rate', float),
+    'ADMISSION_CHAT_BURST': ('chat_burst', float),
+    'ADMISSION_MAX_QUEUE': ('max_queue', int),
+    'ADMISSION_MAX_BACKLOG': ('max_backlog', float),
+}
+
+
+def limits_from_environ(environ):
+    """keyword arguments of AdmissionControl, the defaults above unless
+    environ sets them
+    """
+    result = dict(user_rate=USER_RATE, user_burst=USER_BURST,
+                  chat_rate=CHAT_RATE, chat_burst=CHAT_BURST,
+                  max_queue=MAX_QUEUE, max_backlog=MAX_BACKLOG)
+    for name, (key, kind) in ENVIRON.items():
+        if environ.get(name):
+            result[key] = kind(environ[name])
+    return result
+
+
+class Decision(namedtuple('Decision', ['reason', 'retry_after', 'notify'])):
+    """reason is None if admitted, notify is False for repeated rejections
+    of the same user within retry_after, which shouldn't get a reply
+    """
+
+    def __bool__(self):
+        return self.reason is None
+
+
+ADMITTED = Decision(None, 0, False)
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def refill(self, now):
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def retry_after(self):
+        """seconds until the next token, 0 if there is one"""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class AdmissionControl(object):
+    def __init__(self, user_rate=USER_RATE, user_burst=USER_BURST,
+                 chat_rate=CHAT_RATE, chat_burst=CHAT_BURST,
+                 max_queue=MAX_QUEUE, max_backlog=MAX_BACKLOG):
+        self.users = {}
+        self.chats = {}
+        self.jobs = {}
+        self.rejected_until = {}
+        self.job_ids = itertools.count()
+        self.configure(user_rate, user_burst, chat_rate, chat_burst,
+                       max_queue, max_backlog)
+        # decisions by reason
+        self.stats = dict.fromkeys(
+            ('admitted', 'busy', 'queue full', 'user rate', 'chat rate'), 0
+        )
+
+    def configure(self, user_rate, user_burst, chat_rate, chat_burst,
+                  max_queue, max_backlog):
+        """change the limits, of the existing buckets too"""
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_queue = max_queue
+        self.max_backlog = max_backlog
+        for buckets, rate, burst in ((self.users, user_rate, user_burst),
+                                     (self.chats, chat_rate, chat_burst)):
+            for bucket in buckets.values():
+                bucket.rate = rate
+                bucket.burst = burst
+                bucket.tokens = min(bucket.tokens, burst)
+
+    @property
+    def backlog(self):
+        """audio seconds of the requests being downloaded/transcoded"""
+        return sum(self.jobs.values())
+
+    def overloaded(self, seconds=0):
+        return self.backlog + seconds > self.max_backlog
+
+    def _bucket(self, buckets, key, rate, burst, now):
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= MAX_BUCKETS:
+                for k in [k for k, x in buckets.items()
+                          if x.refill(now) >= x.burst]:
+                    del buckets[k]
+            bucket = buckets[key] = TokenBucket(rate, burst, now)
+        bucket.refill(now)
+        return bucket
+
+    def _reject(self, user_id, reason, retry_after, now):
+        self.stats[reason] += 1
+        if len(self.rejected_until) >= MAX_BUCKETS:
+            self.rejected_until = {k: x for k, x in
+                                   self.rejected_until.items() if x > now}
+        notify = self.rejected_until.get(user_id, 0) <= now
+        if notify:
+            self.rejected_until[user_id] = now + max(retry_after, 1)
+        return Decision(reason, retry_after, notify)
+
+    def admit(self, user_id, chat_id, seconds=0, queue_length=0):
+        """take a token of user_id and chat_id if the request fits"""
+        now = time.monotonic()
+        if self.overloaded(seconds):
+            return self._reject(user_id, 'busy', 0, now)
+        if queue_length >= self.max_queue:
+            return self._reject(user_id, 'queue full', 0, now)
+        user = self._bucket(self.users, user_id, self.user_rate,
+                            self.user_burst, now)
+        if user.tokens < 1:
+            return self._reject(user_id, 'user rate', user.retry_after(),
+                                now)
+        chat = self._bucket(self.chats, chat_id, self.chat_rate,
+                            self.chat_burst, now)
+        if chat.tokens < 1:
+            return self._reject(user_id, 'chat rate', chat.retry_after(),
+                                now)
+        user.tokens -= 1
+        chat.tokens -= 1
+        self.stats['admitted'] += 1
+        return ADMITTED
+
+    @asynccontextmanager
+    async def job(self, seconds):
+        """count seconds of audio in the backlog while it's processed"""
+        job_id = next(self.job_ids)
+        self.jobs[job_id] = seconds
+        try:
+            yield
+        finally:
+            del self.jobs[job_id]
@@ -0,0 +1,98 @@
+"""RAW PCM cache in the workdir, shared by processes
+
+Worker processes of tgvc/shard.py share the workdir, so a track is
+downloaded and transcoded once for all of them. Two locks with flock()
+keep them from stepping on each other:
+
+- locked(raw_file): exclusive lock of raw_file + ".lock" while the file
+  is downloaded, transcoded and trimmed, a process which wants the same
+  file waits and finds it ready
+- Pins: shared locks on the files a player is about to play, taken
+  under locked() together with the check that the file is ready
+- remove_if_unpinned(): removes a file while it holds its locked() lock
+  and an exclusive lock on it, so it never removes a file which is being
+  written or pinned
+
+flock() locks belong to the open file, so they work between tasks of
+one process too. The lock files are empty and left in place, removing
+them could let two processes lock different files of the same name.
+"""
+import os
+import fcntl
+import asyncio
+from contextlib import asynccontextmanager
+
+LOCK_POLL = 0.05
+
+
+@asynccontextmanager
+async def locked(path):
+    """exclusive lock of path between tasks and processes"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd = os.open(path + ".lock", os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(LOCK_POLL)
+        yield
+    finally:
+        os.close(fd)
+
+
+def remove_if_unpinned(path):
+    """remove path unless it's pinned or locked(), True if removed"""
+    lock = os.open(path + ".lock", os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fd = os.open(path, os.O_RDONLY)
+    except (BlockingIOError, FileNotFoundError):
+        os.close(lock)
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.remove(path)
+        return True
+    except BlockingIOError:
+        return False
+    finally:
+        os.close(fd)
+        os.close(lock)
+
+
+class Pins(object):
+    """shared locks on the files in use"""
+
+    def __init__(self):
+        self.fds = {}
+
+    def update(self, paths):
+        """pin exactly the existing files of paths"""
+        paths = set(paths)
+        for path in [x for x in self.fds if x not in paths]:
+            os.close(self.fds.pop(path))
+        for path in paths - self.fds.keys():
+            self.add(path)
+
+    def add(self, path):
+        """pin path, False if it doesn't exist"""
+        fd = self.fds.pop(path, None)
+        if fd is None:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                return False
+            fcntl.flock(fd, fcntl.LOCK_SH)
+        # remove_if_unpinned() may have removed it before the lock, or
+        # this process replaced it
+        try:
+            pinned = os.path.samestat(os.fstat(fd), os.stat(path))
+        except FileNotFoundError:
+            pinned = False
+        if not pinned:
+            os.close(fd)
+            return self.add(path) if os.path.exists(path) else False
+        self.fds[path] = fd
+        return True
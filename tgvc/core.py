@@ -0,0 +1,39 @@
+"""Long-lived objects shared between plugins
+
+Voice chat plugins register their GroupCall objects here, so other
+plugins (e.g. !ping) can inspect them without importing the plugin
+
+Plugins keep the rest of their long-lived objects (player state,
+caches, ffmpeg processes) in state(), !reload re-imports the plugin
+code and the new code gets the same objects, see tgvc/reload.py
+
+    mp = state("player", MusicPlayer)
+"""
+
+# name -> pytgcalls.GroupCall
+GROUP_CALLS = {}
+# name -> object of state()
+STATES = {}
+
+
+def register_group_call(name, group_call):
+    GROUP_CALLS[name] = group_call
+    return group_call
+
+
+def state(name, factory):
+    """the object of name, made by factory() once per process"""
+    if name not in STATES:
+        STATES[name] = factory()
+    return STATES[name]
+
+
+def group_call_states():
+    """sample connection state of registered group calls"""
+    states = {}
+    for name, group_call in GROUP_CALLS.items():
+        if group_call.is_connected:
+            states[name] = f"connected -100{group_call.full_chat.id}"
+        else:
+            states[name] = "disconnected"
+    return states
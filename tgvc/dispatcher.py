@@ -0,0 +1,64 @@
+"""One precompiled command dispatcher per plugin
+
+Instead of a Pyrogram handler with its own regex filter per command,
+a plugin registers its commands on a CommandDispatcher and adds a
+single handler for all of them. Most messages in busy groups are
+rejected on the first character, the rest are looked up in a dict.
+
+    commands = CommandDispatcher()
+
+    @commands.on("/current", "!current", check=in_current_vc)
+    async def show_current_playing_time(client, m): ...
+
+    @Client.on_message(commands.filter & main_filter)
+    async def dispatch_command(client, m):
+        await commands.dispatch(client, m)
+
+Handlers registered with args=True accept arguments after the command,
+like filters.command they find them in m.command (without the prefix).
+A check is a plain (sync) function of the message, e.g. to only accept
+commands in the chat of the current voice chat.
+"""
+from collections import namedtuple
+from pyrogram import filters
+
+Command = namedtuple('Command', ['handler', 'args', 'check'])
+
+
+class CommandDispatcher(object):
+    def __init__(self):
+        self.commands = {}
+        self.first_chars = frozenset()
+        # the bound method gets (client, message) from the Filter
+        self.filter = filters.create(self._filter)
+
+    def on(self, *names, args=False, check=None):
+        """register handler for full command names like "/play" "!play\""""
+        def decorator(func):
+            for name in names:
+                self.commands[name] = Command(func, args, check)
+            self.first_chars = frozenset(x[0] for x in self.commands)
+            return func
+        return decorator
+
+    def match(self, m):
+        """return the handler for message m or None"""
+        text = m.text
+        if not text or text[0] not in self.first_chars:
+            return None
+        name, _, rest = text.partition(" ")
+        command = self.commands.get(name)
+        if command is None or (rest and not command.args):
+            return None
+        m.command = [name[1:]] + rest.split()
+        if command.check is not None and not command.check(m):
+            return None
+        return command.handler
+
+    async def _filter(self, _, m):
+        return self.match(m) is not None
+
+    async def dispatch(self, client, m):
+        handler = self.match(m)
+        if handler is not None:
+            await handler(client, m)
@@ -0,0 +1,205 @@
+"""Parallel chunked download of Telegram media
+
+Message.download() fetches a file one 1 MiB chunk after another. For
+large audio the downloader below keeps several upload.GetFile requests
+in flight on the media session of the file's DC, writes every chunk at
+its offset into a preallocated file and records finished chunks in a
+".part" file next to it, so an interrupted download (e.g. a restart)
+resumes where it stopped. A failed chunk is retried on its own.
+
+Files smaller than PARALLEL_MIN_SIZE, of unknown size or served from a
+CDN fall back to Message.download().
+"""
+import os
+import asyncio
+import logging
+import mimetypes
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024  # upload.GetFile limit must divide 1 MiB
+WORKERS = 4
+RETRIES = 3
+PARALLEL_MIN_SIZE = 8 * CHUNK_SIZE
+
+
+class CdnRedirect(Exception):
+    """the file is served from a CDN DC, which isn't supported here"""
+
+
+class ChunkedDownload(object):
+    """download size bytes into path with fetch(offset, limit) coroutine"""
+
+    def __init__(self, fetch, size, path, chunk_size=CHUNK_SIZE,
+                 workers=WORKERS, retries=RETRIES):
+        self.fetch = fetch
+        self.size = size
+        self.path = path
+        self.part_path = path + ".part"
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.retries = retries
+        self.chunks = -(-size // chunk_size)
+        self.done = set()
+        self.retried = 0
+
+    def _load_progress(self):
+        """chunks finished before, only if the data file is intact"""
+        if not (os.path.isfile(self.part_path)
+                and os.path.isfile(self.path)
+                and os.path.getsize(self.path) == self.size):
+            return set()
+        with open(self.part_path) as f:
+            return {int(x) for x in f.read().split()}
+
+    async def _fetch_chunk(self, index):
+        offset = index * self.chunk_size
+        limit = min(self.chunk_size, self.size - offset)
+        for attempt in range(self.retries + 1):
+            try:
+                data = await self.fetch(offset, self.chunk_size)
+                if len(data) < limit:
+                    raise IOError(f"short chunk {index}: {len(data)}")
+                return data[:limit]
+            except (CdnRedirect, asyncio.CancelledError):
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                self.retried += 1
+                log.warning("chunk %d of %s failed (%r), retrying",
+                            index, self.path, e)
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def _worker(self, queue, fd, part):
+        while not queue.empty():
+            index = queue.get_nowait()
+            data = await self._fetch_chunk(index)
+            os.pwrite(fd, data, index * self.chunk_size)
+            part.write(f"{index}\n")
+            part.flush()
+            self.done.add(index)
+
+    async def run(self):
+        self.done = self._load_progress()
+        queue = asyncio.Queue()
+        for index in range(self.chunks):
+            if index not in self.done:
+                queue.put_nowait(index)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        try:
+            os.ftruncate(fd, self.size)
+            with open(self.part_path, "a") as part:
+                workers = [
+                    asyncio.ensure_future(self._worker(queue, fd, part))
+                    for _ in range(min(self.workers, queue.qsize()))
+                ]
+                try:
+                    await asyncio.gather(*workers)
+                except BaseException:
+                    for worker in workers:
+                        worker.cancel()
+                    raise
+        finally:
+            os.close(fd)
+        os.remove(self.part_path)
+        return self.path
+
+    def discard(self):
+        """remove the preallocated file and the progress of run()"""
+        for path in (self.path, self.part_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class TelegramChunkSource(object):
+    """fetch(offset, limit) for a document file_id over its media session"""
+
+    def __init__(self, client, file_id):
+        from pyrogram import raw
+        from pyrogram.file_id import FileId
+        self.client = client
+        self.file_id = FileId.decode(file_id)
+        self.location = raw.types.InputDocumentFileLocation(
+            id=self.file_id.media_id,
+            access_hash=self.file_id.access_hash,
+            file_reference=self.file_id.file_reference,
+            thumb_size=self.file_id.thumbnail_size
+        )
+        self._session = None
+
+    async def _media_session(self):
+        """same media session as Client.get_file() uses for this DC"""
+        from pyrogram import raw
+        from pyrogram.errors import AuthBytesInvalid
+        from pyrogram.session import Auth, Session
+        client, dc_id = self.client, self.file_id.dc_id
+        async with client.media_sessions_lock:
+            session = client.media_sessions.get(dc_id)
+            if session is not None:
+                return session
+            test_mode = await client.storage.test_mode()
+            if dc_id == await client.storage.dc_id():
+                session = Session(client, dc_id,
+                                  await client.storage.auth_key(),
+                                  test_mode, is_media=True)
+                await session.start()
+            else:
+                session = Session(
+                    client, dc_id,
+                    await Auth(client, dc_id, test_mode).create(),
+                    test_mode, is_media=True
+                )
+                await session.start()
+                exported = await client.send(
+                    raw.functions.auth.ExportAuthorization(dc_id=dc_id)
+                )
+                try:
+                    await session.send(raw.functions.auth.ImportAuthorization(
+                        id=exported.id, bytes=exported.bytes
+                    ))
+                except AuthBytesInvalid:
+                    await session.stop()
+                    raise
+            client.media_sessions[dc_id] = session
+            return session
+
+    async def fetch(self, offset, limit):
+        from pyrogram import raw
+        if self._session is None:
+            self._session = await self._media_session()
+        r = await self._session.send(
+            raw.functions.upload.GetFile(
+                location=self.location,
+                offset=offset,
+                limit=limit
+            ),
+            sleep_threshold=30
+        )
+        if isinstance(r, raw.types.upload.FileCdnRedirect):
+            raise CdnRedirect
+        return r.bytes
+
+
+def _extension(audio):
+    ext = os.path.splitext(getattr(audio, 'file_name', None) or "")[1]
+    return ext or mimetypes.guess_extension(audio.mime_type or "") or ""
+
+
+async def download_audio_file(client, m, download_dir):
+    """download the audio of message m, in parallel chunks if it's large"""
+    audio = m.audio
+    if not audio.file_size or audio.file_size < PARALLEL_MIN_SIZE:
+        return await m.download()
+    path = os.path.join(download_dir,
+                        f"{audio.file_unique_id}{_extension(audio)}")
+    source = TelegramChunkSource(client, audio.file_id)
+    download = ChunkedDownload(source.fetch, audio.file_size, path)
+    try:
+        return await download.run()
+    except CdnRedirect:
+        # no chunk of it will come, don't leave a sparse file behind
+        download.discard()
+        return await m.download()
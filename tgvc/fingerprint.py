@@ -0,0 +1,178 @@
+"""Acoustic fingerprints of the RAW PCM to find the same recording
+
+The same song uploaded again, or re-encoded by youtube_dl/ffmpeg, gets
+a new file_unique_id. Its fingerprint still matches, so the player can
+map it onto the PCM cached for the first upload.
+
+A fingerprint is one 32 bit sub-fingerprint per 64 ms frame: the signs
+of the energy differences of 33 bands between 300 Hz and 2 kHz, over
+frequency and time (Haitsma & Kalker). About 4 KB per minute.
+
+The PCM is memory-mapped (or a view of a PCMSource of tgvc/pcm.py) and
+processed in blocks, NumPy is imported on first use.
+"""
+from tgvc.pcm import CHANNELS, SAMPLE_RATE, samples
+
+DECIMATE = 6  # 48 kHz to 8 kHz
+FRAME = 2048
+HOP = 512
+BANDS = 33
+LOW_HZ, HIGH_HZ = 300, 2000
+BLOCK_SECONDS = 30
+# bit error rate of a match, unrelated audio is around 0.5
+MAX_BER = 0.35
+# fraction of the shorter fingerprint that has to overlap
+MIN_OVERLAP = 0.5
+# index every INDEX_STRIDE-th sub-fingerprint of the references
+INDEX_STRIDE = 2
+CANDIDATES = 3
+
+
+def _band_edges(np):
+    rate = SAMPLE_RATE / DECIMATE
+    edges = np.geomspace(LOW_HZ, HIGH_HZ, BANDS + 1) * FRAME / rate
+    return np.round(edges).astype(np.intp)
+
+
+def fingerprint(pcm):
+    """uint32 array of sub-fingerprints of s16le 48 kHz stereo PCM, a
+    path of RAW PCM, a PCMSource or an int16 array
+    """
+    import numpy as np
+    pcm = samples(pcm)
+    window = np.hanning(FRAME).astype(np.float32)
+    edges = _band_edges(np)
+    step = BLOCK_SECONDS * SAMPLE_RATE * CHANNELS
+    usable = len(pcm) - len(pcm) % (DECIMATE * CHANNELS)
+    tail = np.zeros(0, np.float32)
+    energies = []
+    for start in range(0, usable, step):
+        block = pcm[start:min(start + step, usable)]
+        mono = block.reshape(-1, DECIMATE * CHANNELS).mean(
+            axis=1, dtype=np.float32
+        )
+        mono = np.concatenate((tail, mono))
+        if len(mono) < FRAME:
+            tail = mono
+            continue
+        frames = np.lib.stride_tricks.sliding_window_view(
+            mono, FRAME
+        )[::HOP]
+        tail = mono[len(frames) * HOP:]
+        power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2
+        energies.append(np.add.reduceat(
+            power[:, edges[0]:edges[-1]], edges[:-1] - edges[0], axis=1
+        ))
+    if not energies:
+        return np.zeros(0, np.uint32)
+    energy = np.concatenate(energies)
+    diff = energy[:, :-1] - energy[:, 1:]
+    bits = diff[1:] > diff[:-1]
+    return np.packbits(bits, axis=1, bitorder='little').view('<u4').ravel()
+
+
+def loads(data):
+    import numpy as np
+    return np.frombuffer(data, dtype='<u4')
+
+
+def bit_error_rate(a, b):
+    import numpy as np
+    return np.unpackbits((a ^ b).view(np.uint8)).mean()
+
+
+class FingerprintIndex(object):
+    """find the reference a fingerprint matches, any alignment
+
+    References are looked up by exact sub-fingerprint hits in a sorted
+    array, the (reference, offset) pairs with the most hits are checked
+    with the bit error rate of the aligned fingerprints.
+    """
+
+    def __init__(self, max_ber=MAX_BER, min_overlap=MIN_OVERLAP,
+                 stride=INDEX_STRIDE):
+        self.max_ber = max_ber
+        self.min_overlap = min_overlap
+        self.stride = stride
+        self.keys = []
+        self.owners = {}
+        self.fingerprints = []
+        self._pending = []
+        self._values = self._owners = self._positions = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.owners
+
+    def add(self, key, fp):
+        self._pending.append(len(self.keys))
+        self.owners[key] = len(self.keys)
+        self.keys.append(key)
+        self.fingerprints.append(fp)
+
+    def _merge(self):
+        """insert pending references into the sorted arrays, O(n)"""
+        import numpy as np
+        values, owners, positions = [], [], []
+        for owner in self._pending:
+            fp = self.fingerprints[owner]
+            positions.append(
+                np.arange(0, len(fp), self.stride, dtype=np.int32)
+            )
+            values.append(fp[positions[-1]])
+            owners.append(np.full(len(positions[-1]), owner, np.int32))
+        self._pending = []
+        values = np.concatenate(values)
+        order = np.argsort(values)
+        values = values[order]
+        owners = np.concatenate(owners)[order]
+        positions = np.concatenate(positions)[order]
+        if self._values is None:
+            self._values, self._owners = values, owners
+            self._positions = positions
+            return
+        at = np.searchsorted(self._values, values)
+        self._values = np.insert(self._values, at, values)
+        self._owners = np.insert(self._owners, at, owners)
+        self._positions = np.insert(self._positions, at, positions)
+
+    def _aligned_ber(self, fp, owner, offset):
+        ref = self.fingerprints[owner]
+        start = max(0, -offset)
+        end = min(len(fp), len(ref) - offset)
+        if end - start < self.min_overlap * min(len(fp), len(ref)):
+            return None
+        return bit_error_rate(fp[start:end],
+                              ref[start + offset:end + offset])
+
+    def match(self, fp):
+        """(key, bit error rate) of the best reference or None"""
+        import numpy as np
+        if self._pending:
+            self._merge()
+        if self._values is None or not len(fp):
+            return None
+        query = np.arange(len(fp), dtype=np.int32)[fp != 0]
+        lo = np.searchsorted(self._values, fp[query], 'left')
+        hi = np.searchsorted(self._values, fp[query], 'right')
+        counts = hi - lo
+        total = counts.sum()
+        if not total:
+            return None
+        first = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        hits = first + np.arange(total)
+        offsets = self._positions[hits] - np.repeat(query, counts)
+        pairs, votes = np.unique(
+            np.stack((self._owners[hits], offsets)), axis=1,
+            return_counts=True
+        )
+        best = None
+        for i in np.argsort(-votes)[:CANDIDATES]:
+            owner, offset = int(pairs[0, i]), int(pairs[1, i])
+            ber = self._aligned_ber(fp, owner, offset)
+            if ber is not None and ber <= self.max_ber \
+                    and (best is None or ber < best[1]):
+                best = (self.keys[owner], float(ber))
+        return best
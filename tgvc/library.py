@@ -0,0 +1,228 @@
+"""Local library of every track the player has played
+
+Tracks are stored in SQLite with an FTS5 index over title and
+performer, so "!play <query>" finds a track played before without
+replying to its message again. Telegram audio is downloaded again by
+its file_id (no re-upload), after fetching its message (chat_id,
+message_id) for a fresh file reference, tracks imported from links by
+their URL.
+Tracks whose RAW PCM is still cached rank higher.
+
+It also keeps the acoustic fingerprints of tgvc/fingerprint.py and the
+aliases they found: file_unique_id of a duplicate -> file_unique_id
+whose PCM it shares, and the silence tgvc/silence.py cut from the
+cached PCM.
+
+    library = TrackLibrary("library.sqlite")
+    library.record(file_unique_id="...", title="...", file_id="...")
+    library.search("artist title")   # best match first
+"""
+import re
+import time
+import sqlite3
+from collections import namedtuple
+
+# weights of the title and performer columns for bm25()
+TITLE_WEIGHT = 10.0
+PERFORMER_WEIGHT = 5.0
+# bm25() is negative, better matches are lower, cached tracks get x2
+CACHED_BOOST = 2.0
+
+COLUMNS = ('file_unique_id', 'title', 'performer', 'duration', 'file_id',
+           'file_size', 'mime_type', 'url', 'ie_key', 'link', 'chat_id',
+           'message_id', 'cached', 'play_count', 'last_played')
+Track = namedtuple('Track', COLUMNS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    file_unique_id TEXT UNIQUE NOT NULL,
+    title TEXT NOT NULL,
+    performer TEXT,
+    duration INTEGER NOT NULL DEFAULT 0,
+    file_id TEXT,
+    file_size INTEGER,
+    mime_type TEXT,
+    url TEXT,
+    ie_key TEXT,
+    link TEXT,
+    chat_id INTEGER,
+    message_id INTEGER,
+    cached INTEGER NOT NULL DEFAULT 0,
+    play_count INTEGER NOT NULL DEFAULT 0,
+    last_played REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+    title, performer, content='tracks', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    file_unique_id TEXT PRIMARY KEY,
+    fingerprint BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    file_unique_id TEXT PRIMARY KEY,
+    pcm_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS aliases_pcm_id ON aliases(pcm_id);
+CREATE TABLE IF NOT EXISTS trims (
+    pcm_id TEXT PRIMARY KEY,
+    head INTEGER NOT NULL,
+    tail INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS tracks_ai AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_fts(rowid, title, performer)
+    VALUES (new.id, new.title, new.performer);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_ad AFTER DELETE ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, title, performer)
+    VALUES ('delete', old.id, old.title, old.performer);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_au AFTER UPDATE OF title, performer
+ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, title, performer)
+    VALUES ('delete', old.id, old.title, old.performer);
+    INSERT INTO tracks_fts(rowid, title, performer)
+    VALUES (new.id, new.title, new.performer);
+END;
+"""
+# columns added to the tracks table later, libraries made before get them
+ADDED_COLUMNS = (('chat_id', 'INTEGER'), ('message_id', 'INTEGER'))
+
+UPSERT = f"""
+INSERT INTO tracks ({", ".join(COLUMNS)})
+VALUES ({", ".join(f":{x}" for x in COLUMNS)})
+ON CONFLICT(file_unique_id) DO UPDATE SET
+    title = excluded.title,
+    performer = excluded.performer,
+    duration = excluded.duration,
+    file_id = coalesce(excluded.file_id, file_id),
+    file_size = coalesce(excluded.file_size, file_size),
+    mime_type = coalesce(excluded.mime_type, mime_type),
+    url = coalesce(excluded.url, url),
+    ie_key = coalesce(excluded.ie_key, ie_key),
+    link = coalesce(excluded.link, link),
+    chat_id = coalesce(excluded.chat_id, chat_id),
+    message_id = coalesce(excluded.message_id, message_id),
+    cached = excluded.cached,
+    play_count = play_count + excluded.play_count,
+    last_played = coalesce(excluded.last_played, last_played)
+"""
+
+SEARCH = f"""
+SELECT {", ".join(f"t.{x}" for x in COLUMNS)}
+FROM tracks_fts JOIN tracks t ON t.id = tracks_fts.rowid
+WHERE tracks_fts MATCH ?
+ORDER BY bm25(tracks_fts, {TITLE_WEIGHT}, {PERFORMER_WEIGHT})
+         * (CASE t.cached WHEN 1 THEN {CACHED_BOOST} ELSE 1.0 END),
+         t.play_count DESC
+LIMIT ?
+"""
+
+
+def fts_query(query):
+    """prefix match of every word, None if there is nothing to search"""
+    words = re.findall(r"\w+", query.lower())
+    if not words:
+        return None
+    return " ".join(f'"{x}"*' for x in words)
+
+
+class TrackLibrary(object):
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self._add_columns()
+
+    def _add_columns(self):
+        existing = {x[1] for x in self.db.execute("PRAGMA table_info(tracks)")}
+        for name, kind in ADDED_COLUMNS:
+            if name in existing:
+                continue
+            try:
+                self.db.execute(f"ALTER TABLE tracks ADD COLUMN {name} {kind}")
+            except sqlite3.OperationalError as e:
+                # another process added it meanwhile
+                if "duplicate column" not in str(e):
+                    raise
+
+    def record(self, played=True, **track):
+        """insert or update a track, count a play if played"""
+        self.record_many([track], played)
+
+    def record_many(self, tracks, played=False):
+        now = time.time() if played else None
+        rows = [
+            {**dict.fromkeys(COLUMNS), 'cached': 0, 'duration': 0,
+             **x, 'play_count': int(played), 'last_played': now}
+            for x in tracks
+        ]
+        with self.db:
+            self.db.executemany(UPSERT, rows)
+
+    def set_cached(self, pcm_ids, cached):
+        """mark the tracks which use the RAW PCM of pcm_ids, the aliases
+        of a pcm_id too
+        """
+        with self.db:
+            self.db.executemany(
+                "UPDATE tracks SET cached = ? WHERE file_unique_id = ? "
+                "OR file_unique_id IN "
+                "(SELECT file_unique_id FROM aliases WHERE pcm_id = ?)",
+                [(int(cached), x, x) for x in pcm_ids]
+            )
+
+    def add_fingerprint(self, file_unique_id, data):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?)",
+                (file_unique_id, data)
+            )
+
+    def fingerprints(self, after=0):
+        """(rowid, file_unique_id, fingerprint bytes) of the fingerprints
+        added after rowid, e.g. by other processes
+        """
+        return self.db.execute(
+            "SELECT rowid, file_unique_id, fingerprint FROM fingerprints "
+            "WHERE rowid > ? ORDER BY rowid", (after, )
+        ).fetchall()
+
+    def add_alias(self, file_unique_id, pcm_id):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO aliases VALUES (?, ?)",
+                            (file_unique_id, pcm_id))
+
+    def aliases(self):
+        return dict(self.db.execute(
+            "SELECT file_unique_id, pcm_id FROM aliases"
+        ))
+
+    def set_trim(self, pcm_id, head, tail):
+        """bytes cut from the start and end of the RAW PCM of pcm_id"""
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO trims VALUES (?, ?, ?)",
+                            (pcm_id, head, tail))
+
+    def trim(self, pcm_id):
+        """(head, tail) of set_trim(), (0, 0) if nothing was cut"""
+        row = self.db.execute(
+            "SELECT head, tail FROM trims WHERE pcm_id = ?", (pcm_id, )
+        ).fetchone()
+        return row or (0, 0)
+
+    def search(self, query, limit=5):
+        """tracks matching every word of query, best match first"""
+        match = fts_query(query)
+        if match is None:
+            return []
+        return [Track(*x) for x in self.db.execute(SEARCH, (match, limit))]
+
+    def __len__(self):
+        return self.db.execute("SELECT count(*) FROM tracks").fetchone()[0]
+
+    def close(self):
+        self.db.close()
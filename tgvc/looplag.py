@@ -0,0 +1,120 @@
+"""Event loop lag watchdog
+
+A heartbeat coroutine sleeps for a fixed interval and records how late
+it wakes up, that is the event loop lag. A watchdog thread checks the
+heartbeat, when the loop didn't respond for longer than the threshold
+it captures the stack of the event loop thread, which points at the
+synchronous call blocking the loop (ffmpeg .run(), YoutubeDL, PIL...)
+
+Enable it by setting LOOP_LAG_THRESHOLD (milliseconds) for main.py
+"""
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from tgvc.stats import percentile
+
+log = logging.getLogger(__name__)
+
+
+class LoopLagMonitor(object):
+    def __init__(self, interval=0.1, threshold=0.5, history=3000,
+                 report_cooldown=60):
+        self.interval = interval
+        self.threshold = threshold
+        self.report_cooldown = report_cooldown
+        self.samples = deque(maxlen=history)
+        self.blocked = deque(maxlen=20)
+        self.on_blocked = None
+        self._loop = None
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._last_beat = None
+        self._reported_beat = None
+        self._last_report = 0
+
+    @property
+    def is_running(self):
+        return self._task is not None
+
+    def start(self, loop=None):
+        """start measuring, must be called from the event loop thread"""
+        if self.is_running:
+            return
+        self._loop = loop or asyncio.get_event_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = self._loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch,
+                                        name="looplag-watchdog",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.is_running:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        self._task = None
+
+    def percentiles(self, ps=(50, 95, 99)):
+        """lag percentiles in seconds, e.g. {'p50': 0.001, ...}"""
+        samples = list(self.samples)
+        return {f"p{p}": percentile(samples, p) for p in ps}
+
+    def summary(self):
+        samples = list(self.samples)
+        if not samples:
+            return "no samples"
+        return ", ".join(
+            f"{k} {v * 1000:.1f}ms"
+            for k, v in (
+                *self.percentiles().items(),
+                ('max', max(samples))
+            )
+        )
+
+    async def _heartbeat(self):
+        loop = self._loop
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.samples.append(lag)
+            self._last_beat = time.monotonic()
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            last_beat = self._last_beat
+            stalled = time.monotonic() - last_beat - self.interval
+            if stalled < self.threshold or last_beat == self._reported_beat:
+                continue
+            # report each stall only once
+            self._reported_beat = last_beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            self.blocked.append((time.time(), stalled, stack))
+            log.warning("event loop blocked for over %.0fms:\n%s",
+                        stalled * 1000, stack)
+            if self.on_blocked is not None:
+                self._loop.call_soon_threadsafe(self._report, stalled, stack)
+
+    def _report(self, stalled, stack):
+        now = time.monotonic()
+        if now - self._last_report < self.report_cooldown:
+            return
+        self._last_report = now
+        result = self.on_blocked(stalled, stack)
+        if asyncio.iscoroutine(result):
+            self._loop.create_task(result)
+
+
+monitor = LoopLagMonitor()
@@ -0,0 +1,138 @@
+"""Memory-mapped RAW PCM shared by its readers
+
+The player, radio and recorder keep audio as s16le 48 kHz stereo files
+which GroupCall reads by path. Code which needs the samples (silence,
+fingerprints, level meters, ...) maps the file with open_source()
+instead of reading it again: readers of the same path share one
+PCMSource, its windows are memoryview or NumPy views of the mapping,
+nothing is copied and the pages are the page cache pages ffmpeg wrote.
+
+    with open_source(raw_file) as source:
+        for window in source.windows(SAMPLE_RATE):  # 1s memoryviews
+            ...
+        pcm = source.array()  # int16 (frames, channels), needs NumPy
+
+A file which is still growing (radio, recorder output) is mapped as far
+as it's written when opened, refresh() maps what was appended since.
+The mapping is closed with the last close(), or when the views still
+using it are garbage collected. Don't truncate a mapped file, cut it
+after close().
+"""
+import os
+import mmap
+import threading
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+FRAME_BYTES = 2 * CHANNELS
+
+# realpath -> PCMSource
+_sources = {}
+_lock = threading.Lock()
+
+
+def _unmap(view, mapping):
+    try:
+        view.release()
+        if mapping is not None:
+            mapping.close()
+    except BufferError:
+        # a window is still in use, it's unmapped when it's collected
+        pass
+
+
+class PCMSource(object):
+    def __init__(self, path):
+        self.path = path
+        self.users = 1
+        self._mmap = None
+        self._view = memoryview(b'')
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.frames
+
+    @property
+    def frames(self):
+        return len(self._view) // FRAME_BYTES
+
+    @property
+    def seconds(self):
+        return self.frames / SAMPLE_RATE
+
+    def refresh(self):
+        """map the frames written since the file was mapped"""
+        size = os.path.getsize(self.path)
+        size -= size % FRAME_BYTES
+        if size == len(self._view):
+            return self.frames
+        view, mapping = self._view, self._mmap
+        if size:
+            with open(self.path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), size,
+                                       access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+        else:
+            self._mmap, self._view = None, memoryview(b'')
+        _unmap(view, mapping)
+        return self.frames
+
+    def view(self, start=0, frames=None):
+        """memoryview of s16le bytes of frames from frame start"""
+        end = self.frames if frames is None \
+            else min(self.frames, start + frames)
+        return self._view[start * FRAME_BYTES:end * FRAME_BYTES]
+
+    def windows(self, frames, start=0):
+        """views of frames each (the last may be shorter) from start"""
+        for offset in range(start, self.frames, frames):
+            yield self.view(offset, frames)
+
+    def array(self, start=0, frames=None):
+        """int16 NumPy view of shape (frames, CHANNELS)"""
+        import numpy as np
+        return np.frombuffer(self.view(start, frames), dtype='<i2') \
+            .reshape(-1, CHANNELS)
+
+    def close(self):
+        """unmap the file when the last reader closes it"""
+        with _lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            key = os.path.realpath(self.path)
+            if _sources.get(key) is self:
+                del _sources[key]
+        view, mapping = self._view, self._mmap
+        self._mmap, self._view = None, memoryview(b'')
+        _unmap(view, mapping)
+
+
+def open_source(path):
+    """PCMSource of path, shared with the other readers of the file"""
+    key = os.path.realpath(path)
+    with _lock:
+        source = _sources.get(key)
+        if source is not None:
+            source.users += 1
+            return source
+        source = _sources[key] = PCMSource(path)
+        return source
+
+
+def samples(pcm):
+    """flat int16 array of a path of RAW PCM, a PCMSource or an array"""
+    import numpy as np
+    if isinstance(pcm, PCMSource):
+        return pcm.array().reshape(-1)
+    if isinstance(pcm, str):
+        if not os.path.getsize(pcm):
+            return np.zeros(0, dtype='<i2')
+        return np.memmap(pcm, dtype='<i2', mode='r')
+    return np.asarray(pcm, dtype='<i2').reshape(-1)
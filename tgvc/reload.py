@@ -0,0 +1,141 @@
+"""Reload plugins without restarting the userbot
+
+A restart leaves the voice chats and drops the playlist and every warm
+cache. reload_plugins() instead re-imports the modules of the smart
+plugins in place and swaps their Pyrogram handlers, the objects the
+plugins keep in tgvc/core.py (group calls, player state, caches, ffmpeg
+processes) are not touched and the audio keeps playing. Everything else
+on module level is set again, e.g. new values of DELETE_DELAY apply.
+
+Like importlib.reload() the new code runs in the namespace of the
+module, so functions of the old code which are still running (tasks,
+callbacks of pytgcalls) see the new module level names. The modules
+are compiled by another interpreter first, compile() would block the
+event loop for 15 ms or more (the player) even in a thread, as it
+holds the GIL. The event loop is only blocked while the module level
+code runs. If a module doesn't compile none is reloaded, one which
+raises while it runs gets its old namespace back and keeps its old
+handlers, they would not find half of their globals otherwise.
+
+    task = await reload_plugins(client, plugin_modules(client))
+"""
+import io
+import sys
+import asyncio
+import marshal
+from collections import OrderedDict
+from pyrogram.handlers.handler import Handler
+
+# argv: optimize level, paths; writes the marshalled code of each path
+COMPILE_SCRIPT = """
+import sys, marshal
+for path in sys.argv[2:]:
+    with open(path, 'rb') as f:
+        code = compile(f.read(), path, 'exec', dont_inherit=True,
+                       optimize=int(sys.argv[1]))
+    marshal.dump(code, sys.stdout.buffer)
+"""
+# module name -> (handler, group) in the dispatcher, once reloaded
+_installed = {}
+
+
+def plugin_modules(client, names=None):
+    """loaded modules of the smart plugins of client, or of names
+    relative to the plugin root like "vc.player"
+    """
+    root = client.plugins["root"]
+    if not names:
+        names = [x.split()[0] for x in client.plugins.get("include") or []]
+    if names:
+        paths = [f"{root}.{x}" for x in names]
+    else:
+        paths = sorted(x for x in sys.modules if x.startswith(root + "."))
+    # not the namespace packages of subdirectories like plugins.vc
+    return [sys.modules[x] for x in paths
+            if getattr(sys.modules.get(x), '__file__', None)]
+
+
+def handlers(module):
+    """(handler, group) of module like Client.load_plugins() finds them"""
+    found = OrderedDict()
+    for value in list(vars(module).values()):
+        items = getattr(value, 'handlers', None)
+        if not isinstance(items, list):
+            continue
+        for handler, group in items:
+            if isinstance(handler, Handler) and isinstance(group, int):
+                found[id(handler)] = (handler, group)
+    return list(found.values())
+
+
+async def reload_plugins(client, modules):
+    """re-import modules, returns the task which swaps their handlers
+
+    Pyrogram holds a dispatcher lock while a handler runs, so a handler
+    which reloads must not await the task, the handlers are swapped
+    after it returned
+    """
+    # SyntaxError before anything changed
+    codes = await compile_modules(modules)
+    old, new = [], []
+    try:
+        for module, code in zip(modules, codes):
+            # as Client.load_plugins() added them the first time, kept
+            # if the module raises
+            before = _installed.setdefault(module.__name__,
+                                           handlers(module))
+            namespace = vars(module)
+            # the old functions keep namespace as their globals
+            snapshot = dict(namespace)
+            try:
+                exec(code, namespace)
+            except BaseException:
+                namespace.clear()
+                namespace.update(snapshot)
+                raise
+            _installed[module.__name__] = handlers(module)
+            old.extend(before)
+            new.extend(_installed[module.__name__])
+    finally:
+        task = asyncio.ensure_future(
+            _swap_handlers(client.dispatcher, old, new)
+        )
+    return task
+
+
+async def compile_modules(modules):
+    """code objects of the current source of modules"""
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-I", "-S", "-c", COMPILE_SCRIPT,
+        str(sys.flags.optimize), *(x.__file__ for x in modules),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    output, _ = await process.communicate()
+    if process.returncode != 0:
+        # raises the SyntaxError with its details
+        return [x.__spec__.loader.get_code(x.__name__) for x in modules]
+    output = io.BytesIO(output)
+    return [marshal.load(output) for _ in modules]
+
+
+async def _swap_handlers(dispatcher, old, new):
+    """replace old with new handlers in one step, like add_handler()
+    and remove_handler() of the Dispatcher, at the place of the old ones
+    """
+    for lock in dispatcher.locks_list:
+        await lock.acquire()
+    try:
+        groups = dispatcher.groups
+        for group in {x[1] for x in old + new}:
+            removed = {id(h) for h, g in old if g == group}
+            added = [h for h, g in new if g == group]
+            current = groups.get(group, [])
+            index = next((i for i, h in enumerate(current)
+                          if id(h) in removed), len(current))
+            kept = [h for h in current if id(h) not in removed]
+            groups[group] = kept[:index] + added + kept[index:]
+        dispatcher.groups = OrderedDict(sorted(groups.items()))
+    finally:
+        for lock in dispatcher.locks_list:
+            lock.release()
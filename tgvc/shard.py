@@ -0,0 +1,234 @@
+"""Voice chats of several userbot accounts in worker processes
+
+With several session strings in SESSION_NAME, main.py runs a
+Coordinator instead of one Client: every session gets a worker process
+which runs the plugins as usual and is connected to the coordinator by
+a multiprocessing Pipe. The workers share the workdir, so the RAW PCM
+cache and library.sqlite are shared too, see tgvc/cache.py.
+
+The accounts are members of the same groups and every one of them
+receives the messages sent there. A worker only handles the chats it
+owns. A !join in a chat which nobody owns is sent to the coordinator,
+which waits COLLECT_SECONDS for the requests of the other workers that
+received it, assigns the chat to the one with the fewest voice chats
+(at most capacity each) and routes the command to it. The owner
+fetches the message and handles it. A worker releases its chat when it
+leaves the voice chat with !leave, not when the connection drops for a
+while, and loses its chats when it exits.
+
+Tuples sent over the pipes:
+- worker -> coordinator: ('request', chat_id, message_id),
+  ('release', chat_id)
+- coordinator -> worker: ('owners', {chat_id: worker index}),
+  ('command', chat_id, message_id), ('rejected', chat_id, message_id)
+
+    # plugin, worker is None if there is only one session
+    from tgvc import shard
+
+    @shard.on('command')
+    async def run_routed_command(client, chat_id, message_id): ...
+
+    if shard.worker is not None and not shard.worker.owns(m.chat.id):
+        shard.worker.request(m.chat.id, m.message_id)
+"""
+import time
+import asyncio
+import signal
+import multiprocessing
+from collections import Counter, OrderedDict
+from multiprocessing.connection import wait
+
+COLLECT_SECONDS = 0.5
+# voice chats per worker, the player plugin plays in one at a time
+CAPACITY = 1
+# requests remembered to ignore late copies of them
+MAX_HANDLED = 1024
+
+# set in worker processes, see _run_worker()
+worker = None
+# message kind -> coroutine function (client, *args), see on()
+_handlers = {}
+
+
+def on(kind):
+    """handle messages of kind from the coordinator in workers"""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+class Worker(object):
+    """the worker process side of its pipe to the coordinator"""
+
+    def __init__(self, index, conn):
+        self.index = index
+        self.conn = conn
+        self.owners = {}
+        self.client = None
+
+    def owner(self, chat_id):
+        return self.owners.get(chat_id)
+
+    def owns(self, chat_id):
+        return self.owners.get(chat_id) == self.index
+
+    def request(self, chat_id, message_id):
+        """ask the coordinator to assign chat_id and route the message"""
+        self.conn.send(('request', chat_id, message_id))
+
+    def release(self, chat_id):
+        if self.owns(chat_id):
+            del self.owners[chat_id]
+            self.conn.send(('release', chat_id))
+
+    def start(self, client):
+        """receive messages of the coordinator in the event loop"""
+        self.client = client
+        asyncio.get_event_loop().add_reader(self.conn.fileno(),
+                                            self._receive)
+
+    def _receive(self):
+        while self.conn.poll():
+            try:
+                kind, *args = self.conn.recv()
+            except (EOFError, ConnectionResetError):
+                asyncio.get_event_loop().remove_reader(self.conn.fileno())
+                return
+            if kind == 'owners':
+                self.owners = args[0]
+            elif kind in _handlers:
+                asyncio.ensure_future(_handlers[kind](self.client, *args))
+
+
+def _run_worker(target, index, conn, args):
+    global worker
+    # a loop of the parent (e.g. made by importing pyrogram) shares its
+    # epoll and self-pipe with the other workers, which would take its
+    # wakeups, so app.start() and idle() get a loop of their own
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    worker = Worker(index, conn)
+    target(*args)
+
+
+class Coordinator(object):
+    """run target(*args) in a worker process per item of worker_args"""
+
+    def __init__(self, target, worker_args, capacity=CAPACITY,
+                 collect=COLLECT_SECONDS):
+        self.target = target
+        self.worker_args = worker_args
+        self.capacity = capacity
+        self.collect = collect
+        self.conns = {}
+        self.processes = {}
+        self.owners = {}
+        # (chat_id, message_id) -> (deadline, indexes of the requesters)
+        self.pending = {}
+        self.handled = OrderedDict()
+        self.stats = Counter()
+
+    def load(self, index):
+        return sum(1 for x in self.owners.values() if x == index)
+
+    def start(self):
+        # fork, main.py isn't import safe and has nothing running yet
+        context = multiprocessing.get_context('fork')
+        for index, args in enumerate(self.worker_args):
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=_run_worker, args=(self.target, index, child, args),
+                name=f"worker-{index}"
+            )
+            process.start()
+            child.close()
+            self.conns[index] = parent
+            self.processes[index] = process
+
+    def run(self):
+        """start the workers and coordinate them until all have exited"""
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        self.start()
+        try:
+            while self.conns:
+                self.poll()
+        except KeyboardInterrupt:
+            self.stop()
+        for process in self.processes.values():
+            process.join()
+
+    def stop(self):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+
+    def poll(self, timeout=None):
+        if self.pending:
+            due = min(x[0] for x in self.pending.values())
+            timeout = max(0, due - time.monotonic())
+        indexes = {conn: i for i, conn in self.conns.items()}
+        for conn in wait(list(indexes), timeout):
+            try:
+                message = conn.recv()
+            except (EOFError, ConnectionResetError):
+                self._lost(indexes[conn])
+                continue
+            self.handle(indexes[conn], message)
+        self._assign_due()
+
+    def handle(self, index, message):
+        kind, chat_id, *args = message
+        self.stats[kind] += 1
+        if kind == 'request':
+            key = (chat_id, *args)
+            # owned meanwhile, the owner received the message itself
+            if key in self.handled or chat_id in self.owners:
+                return
+            deadline = time.monotonic() + self.collect
+            self.pending.setdefault(key, (deadline, []))[1].append(index)
+        elif kind == 'release' and self.owners.get(chat_id) == index:
+            del self.owners[chat_id]
+            self.broadcast_owners()
+
+    def _assign_due(self):
+        now = time.monotonic()
+        for key, (deadline, indexes) in list(self.pending.items()):
+            if deadline > now:
+                continue
+            del self.pending[key]
+            self.handled[key] = None
+            if len(self.handled) > MAX_HANDLED:
+                self.handled.popitem(last=False)
+            candidates = [i for i in indexes if i in self.conns
+                          and self.load(i) < self.capacity]
+            if not candidates:
+                self.stats['rejected'] += 1
+                if indexes[0] in self.conns:
+                    self.send(indexes[0], ('rejected', *key))
+                continue
+            index = min(candidates, key=lambda i: (self.load(i), i))
+            self.owners[key[0]] = index
+            self.stats['assigned'] += 1
+            self.broadcast_owners()
+            self.send(index, ('command', *key))
+
+    def send(self, index, message):
+        try:
+            self.conns[index].send(message)
+        except (BrokenPipeError, ConnectionResetError):
+            self._lost(index)
+
+    def broadcast_owners(self):
+        for index in list(self.conns):
+            self.send(index, ('owners', dict(self.owners)))
+
+    def _lost(self, index):
+        """worker index exited, its chats are free again"""
+        if self.conns.pop(index, None) is None:
+            return
+        self.stats['exited'] += 1
+        lost = [k for k, x in self.owners.items() if x == index]
+        for chat_id in lost:
+            del self.owners[chat_id]
+        if lost:
+            self.broadcast_owners()
@@ -0,0 +1,90 @@
+"""Trim leading and trailing silence of RAW PCM
+
+Uploaded tracks and DJ sets often start or end with seconds of dead
+air, which adds to the gap between tracks. After transcoding, the
+s16le 48 kHz stereo file is memory-mapped (or a PCMSource of
+tgvc/pcm.py is passed by the caller) and the RMS of 10 ms blocks
+is computed with NumPy, from the start forward and from the end
+backward, SCAN_SECONDS at a time until a block is louder than
+THRESHOLD_DB. Only the edges of the file are read, unless the track is
+silent for longer than that.
+
+The file is cut in place: the tail with a truncate, the head with a
+copy of the rest. The cut bytes are returned so the caller can keep
+them with the cache entry.
+"""
+import os
+import shutil
+from tgvc.pcm import CHANNELS, FRAME_BYTES, SAMPLE_RATE, samples
+
+BLOCK = SAMPLE_RATE // 100  # 10 ms
+THRESHOLD_DB = -50.0
+# audio kept before the first and after the last loud block
+PADDING_SECONDS = 0.1
+# silence shorter than this is left alone
+MIN_TRIM_SECONDS = 0.5
+SCAN_SECONDS = 30
+
+
+def _loud_blocks(pcm, threshold):
+    """bool array, True for blocks of pcm (int16 frames) above threshold"""
+    import numpy as np
+    blocks = pcm[:len(pcm) - len(pcm) % BLOCK].reshape(-1, BLOCK * CHANNELS)
+    power = np.square(blocks, dtype=np.float32).mean(axis=1)
+    return power > threshold
+
+
+def find_silence(pcm, threshold_db=THRESHOLD_DB):
+    """(head, tail) in bytes of silence to cut from the start and end of
+    pcm, a path of RAW PCM, a PCMSource or an int16 array
+    """
+    import numpy as np
+    pcm = samples(pcm)
+    if len(pcm) < CHANNELS * BLOCK:
+        return 0, 0
+    pcm = pcm[:len(pcm) - len(pcm) % CHANNELS].reshape(-1, CHANNELS)
+    threshold = (32768 * 10 ** (threshold_db / 20)) ** 2
+    frames = len(pcm)
+    scan = SCAN_SECONDS * SAMPLE_RATE
+    first = None
+    for start in range(0, frames, scan):
+        loud = np.flatnonzero(_loud_blocks(pcm[start:start + scan],
+                                           threshold))
+        if len(loud):
+            first = start + int(loud[0]) * BLOCK
+            break
+    if first is None:
+        # nothing but silence, keep it as it is
+        return 0, 0
+    last = first
+    for end in range(frames, first, -scan):
+        start = max(first, end - scan)
+        loud = np.flatnonzero(_loud_blocks(pcm[start:end], threshold))
+        if len(loud):
+            last = start + (int(loud[-1]) + 1) * BLOCK
+            break
+    padding = int(PADDING_SECONDS * SAMPLE_RATE)
+    head = max(0, first - padding)
+    tail = max(0, frames - min(frames, last + padding))
+    minimum = MIN_TRIM_SECONDS * SAMPLE_RATE
+    return (
+        head * FRAME_BYTES if head >= minimum else 0,
+        tail * FRAME_BYTES if tail >= minimum else 0
+    )
+
+
+def cut(path, head, tail):
+    """remove head bytes from the start and tail bytes from the end"""
+    size = os.path.getsize(path)
+    if tail:
+        os.truncate(path, size - tail)
+    if head:
+        tmp = path + ".trim"
+        with open(path, 'rb') as src, open(tmp, 'wb') as dst:
+            src.seek(head)
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp, path)
+
+
+def seconds(n_bytes):
+    return n_bytes / FRAME_BYTES / SAMPLE_RATE
@@ -0,0 +1,97 @@
+"""Startup profile of the userbot
+
+Records how long the phases of a (re)start take: imports, per module
+import time (inclusive of the modules they import), session start,
+plugin load and the time until the userbot sends its first message.
+
+    from tgvc.startup import profile   # as early as possible
+    with profile.imports():
+        from pyrogram import Client
+    app.load_plugins = profile.wrap("plugin load", app.load_plugins)
+    profile.watch_first_response(app)
+"""
+import sys
+import time
+import builtins
+import functools
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+
+class StartupProfile(object):
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = OrderedDict()
+        self.import_times = defaultdict(float)
+        self.first_response = None
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (self.phases.get(name, 0)
+                                 + time.perf_counter() - start)
+
+    @contextmanager
+    def imports(self, name="imports"):
+        """time the phase and every module imported for the first time"""
+        original_import = builtins.__import__
+
+        def timed_import(module, *args, **kwargs):
+            level = args[3] if len(args) > 3 else kwargs.get('level', 0)
+            if level or module in sys.modules:
+                return original_import(module, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return original_import(module, *args, **kwargs)
+            finally:
+                self.import_times[module] += time.perf_counter() - start
+
+        builtins.__import__ = timed_import
+        try:
+            with self.phase(name):
+                yield
+        finally:
+            builtins.__import__ = original_import
+
+    def wrap(self, name, func):
+        """time every call of func as phase name"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.imports(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def watch_first_response(self, client, on_response=None):
+        """record when client sends its first message after the start"""
+        send_message = client.send_message
+
+        async def first_send_message(*args, **kwargs):
+            client.send_message = send_message
+            self.first_response = self.elapsed()
+            if on_response is not None:
+                on_response(self)
+            return await send_message(*args, **kwargs)
+
+        client.send_message = first_send_message
+
+    def report(self, top=10):
+        lines = [f"startup {self.elapsed():.3f}s"]
+        lines.extend(f"- {name}: {seconds:.3f}s"
+                     for name, seconds in self.phases.items())
+        if self.first_response is not None:
+            lines.append(f"- first response: {self.first_response:.3f}s")
+        slowest = sorted(self.import_times.items(), key=lambda x: -x[1])
+        if slowest:
+            lines.append(f"slowest imports (inclusive, top {top}):")
+            lines.extend(f"- {module}: {seconds:.3f}s"
+                         for module, seconds in slowest[:top])
+        return "\n".join(lines)
+
+
+profile = StartupProfile()
@@ -0,0 +1,24 @@
+"""Small statistics helpers for latency samples"""
+import math
+
+
+def percentile(samples, p):
+    """Return the p-th percentile (0-100) of samples, nearest-rank"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    k = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[k]
+
+
+def summarize(samples):
+    """min/p50/p95/max of samples, or None if there are no samples"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        'min': ordered[0],
+        'p50': percentile(ordered, 50),
+        'p95': percentile(ordered, 95),
+        'max': ordered[-1],
+    }
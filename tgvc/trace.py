@@ -0,0 +1,153 @@
+"""Lifecycle traces of the tracks of the player
+
+Every queued track carries a trace of timestamped spans from the
+moment its request was received until it ends or is dropped:
+
+    received, admitted, download_start, download_end (bytes),
+    transcode_start, transcode_end, ready (cached), play (gap), end
+
+Offsets are seconds since received (time.monotonic). Finished traces
+are written as one JSON object per line to a rotating file (if opened)
+and the recent ones are kept in memory for !trace. A span costs an
+append to a list and a finished trace one json.dumps() and write, cheap
+enough to leave on.
+
+    from tgvc.trace import tracer
+    tracer.open("traces.jsonl")         # main.py
+    tracer.begin(m, track_id, title)    # request received
+    tracer.mark(m, 'ready')
+    tracer.finish(m)                    # 'end', or e.g. 'skipped'
+"""
+import json
+import time
+import logging
+from collections import OrderedDict, deque
+from logging.handlers import RotatingFileHandler
+
+MAX_BYTES = 4 * 1024 * 1024
+BACKUPS = 3
+RECENT = 200
+MAX_OPEN = 1000
+# spans per trace, a track looping for hours marks 'loop' every time
+MAX_SPANS = 64
+
+
+class TrackTrace(object):
+    __slots__ = ('track_id', 'title', 'started', 'wall_time', 'spans')
+
+    def __init__(self, track_id, title, started=None):
+        self.track_id = track_id
+        self.title = title
+        now = time.monotonic()
+        self.started = now if started is None else started
+        self.wall_time = time.time() - (now - self.started)
+        self.spans = []
+
+    def mark(self, name, **fields):
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append(
+                (name, time.monotonic() - self.started, fields)
+            )
+
+    def at(self, name):
+        """offset of the first span name, None if there is none"""
+        for span, offset, _ in self.spans:
+            if span == name:
+                return offset
+        return None
+
+    def field(self, name, key):
+        for span, _, fields in self.spans:
+            if span == name and key in fields:
+                return fields[key]
+        return None
+
+    def delay(self):
+        """how late it started playing: the gap after the track before
+        it, or the time from request to play for the first track
+        """
+        gap = self.field('play', 'gap')
+        return gap if gap is not None else self.at('play')
+
+    def durations(self):
+        def between(start, end):
+            start, end = self.at(start), self.at(end)
+            return None if start is None or end is None else end - start
+        return {
+            'download_s': between('download_start', 'download_end'),
+            'transcode_s': between('transcode_start', 'transcode_end'),
+            'ready_s': self.at('ready'),
+            'delay_s': self.delay(),
+        }
+
+    def to_dict(self):
+        return {
+            'id': self.track_id,
+            'title': self.title,
+            'time': self.wall_time,
+            'spans': [{'name': name, 't': round(offset, 6), **fields}
+                      for name, offset, fields in self.spans],
+        }
+
+
+class TrackTracer(object):
+    def __init__(self, recent=RECENT):
+        self.open_traces = OrderedDict()
+        self.recent = deque(maxlen=recent)
+        self.log = None
+
+    def open(self, path, max_bytes=MAX_BYTES, backups=BACKUPS):
+        """write finished traces to path, rotated at max_bytes"""
+        handler = RotatingFileHandler(path, maxBytes=max_bytes,
+                                      backupCount=backups, delay=True)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.log = logging.getLogger(f"{__name__}.{path}")
+        self.log.propagate = False
+        self.log.setLevel(logging.INFO)
+        self.log.addHandler(handler)
+
+    def begin(self, track, track_id, title, started=None, **fields):
+        """start the trace of track with a 'received' span at started
+        (time.monotonic(), now by default)
+        """
+        if len(self.open_traces) >= MAX_OPEN:
+            _, (old, _) = next(iter(self.open_traces.items()))
+            self.finish(old, 'evicted')
+        trace = TrackTrace(track_id, title, started)
+        trace.spans.append(('received', 0.0, fields))
+        # the track is kept so that its id() isn't reused while open
+        self.open_traces[id(track)] = (track, trace)
+        return trace
+
+    def get(self, track):
+        item = self.open_traces.get(id(track))
+        return item[1] if item is not None and item[0] is track else None
+
+    def mark(self, track, name, **fields):
+        trace = self.get(track)
+        if trace is not None:
+            trace.mark(name, **fields)
+
+    def mark_once(self, track, name, **fields):
+        trace = self.get(track)
+        if trace is not None and trace.at(name) is None:
+            trace.mark(name, **fields)
+
+    def finish(self, track, name='end', **fields):
+        trace = self.get(track)
+        if trace is None:
+            return None
+        del self.open_traces[id(track)]
+        trace.mark(name, **fields)
+        self.recent.append(trace)
+        if self.log is not None:
+            self.log.info(json.dumps(trace.to_dict()))
+        return trace
+
+    def slowest(self, n=5):
+        """the n recent traces with the longest delay() to start playing"""
+        played = [x for x in self.recent if x.delay() is not None]
+        return sorted(played, key=lambda x: -x.delay())[:n]
+
+
+tracer = TrackTracer()
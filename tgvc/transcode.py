@@ -0,0 +1,116 @@
+"""Transcode audio to the s16le 48 kHz stereo RAW PCM used by GroupCall
+
+Profiles tune the ffmpeg command line, compare them on the target
+machine with benchmarks/bench_transcode.py and select one with the
+TRANSCODE_PROFILE environment variable
+
+- threads: ffmpeg decoder/filter threads, 0 or unset for ffmpeg default
+- resampler: aresample engine, swr (ffmpeg default) or soxr
+- pipe: feed the input file through stdin instead of letting ffmpeg
+  open (and seek in) it, MP4/M4A input is never piped because the moov
+  atom may be at the end of the file and ffmpeg would stop early
+"""
+import os
+import asyncio
+
+PCM_OUTPUT = dict(
+    format='s16le',
+    acodec='pcm_s16le',
+    ac=2,
+    ar='48k',
+    loglevel='error'
+)
+PROFILES = {
+    'default': {},
+    'single-thread': {'threads': 1},
+    'soxr': {'resampler': 'soxr'},
+    'pipe': {'pipe': True},
+}
+PIPE_CHUNK_SIZE = 256 * 1024
+# containers which need a seekable input
+NO_PIPE_EXTENSIONS = ('.m4a', '.mp4', '.m4b', '.mov', '.3gp')
+
+
+def profile_from_environ(environ):
+    """TRANSCODE_PROFILE of environ or 'default', checked when the
+    plugins load instead of with the first transcode
+    """
+    profile = environ.get("TRANSCODE_PROFILE") or 'default'
+    if profile not in PROFILES:
+        raise ValueError(f"unknown TRANSCODE_PROFILE {profile!r}, "
+                         f"one of {', '.join(PROFILES)}")
+    return profile
+
+
+def use_pipe(src, profile='default'):
+    return (
+        PROFILES[profile].get('pipe', False)
+        and os.path.splitext(src)[1].lower() not in NO_PIPE_EXTENSIONS
+    )
+
+
+def build(src, dst, profile='default', pipe=None):
+    """ffmpeg-python stream of src to RAW PCM dst with profile applied"""
+    import ffmpeg
+    options = PROFILES[profile]
+    if pipe is None:
+        pipe = use_pipe(src, profile)
+    input_kwargs, output_kwargs = {}, dict(PCM_OUTPUT)
+    if options.get('threads'):
+        input_kwargs['threads'] = options['threads']
+        output_kwargs['threads'] = options['threads']
+    if options.get('resampler'):
+        output_kwargs['af'] = f"aresample=resampler={options['resampler']}"
+    return (
+        ffmpeg
+        .input('pipe:0' if pipe else src, **input_kwargs)
+        .output(dst, **output_kwargs)
+        .overwrite_output()
+    )
+
+
+async def transcode(src, dst, profile='default'):
+    """run ffmpeg without blocking the event loop
+
+    ffmpeg writes dst + ".tmp" which replaces dst once it succeeded, a
+    failed or cancelled transcode doesn't leave a truncated dst behind
+    """
+    pipe = use_pipe(src, profile)
+    tmp = dst + ".tmp"
+    args = build(src, tmp, profile, pipe).compile()
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.PIPE if pipe else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        if pipe:
+            await _feed(process, src)
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            import ffmpeg
+            raise ffmpeg.Error('ffmpeg', None, stderr)
+        os.replace(tmp, dst)
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            # shielded, a second cancel must not leave a zombie
+            await asyncio.shield(process.wait())
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    return dst
+
+
+async def _feed(process, src):
+    try:
+        with open(src, 'rb') as f:
+            for chunk in iter(lambda: f.read(PIPE_CHUNK_SIZE), b''):
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        process.stdin.close()